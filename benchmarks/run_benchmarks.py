@@ -0,0 +1,170 @@
+# benchmarks/run_benchmarks.py
+# Times transform_pulses, load_to_postgres and run_all_queries on synthetic data and saves the
+# results as JSON so runs can be compared across versions.
+#
+#   python -m benchmarks.run_benchmarks                      # 10k, 100k and 1M indicators
+#   python -m benchmarks.run_benchmarks --scales 10000 --skip-db
+#   python -m benchmarks.run_benchmarks --type-weights IPv4=0.5 domain=0.3 URL=0.2
+#
+# The load and query benchmarks run against a throwaway database created next to
+# DB_CONFIG["dbname"] with the same credentials, and dropped afterwards.
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+from datetime import datetime
+import pandas as pd
+import psycopg2
+from benchmarks.synthetic import DEFAULT_TYPE_WEIGHTS, generate_pulses
+from src.config import DB_CONFIG
+from src.db import close_pool
+from src.metrics import start_run
+
+DEFAULT_SCALES = [10_000, 100_000, 1_000_000]
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+
+def _git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _type_weight(text):
+    """Parse a --type-weights entry of the form TYPE=WEIGHT."""
+    indicator_type, _, weight = text.partition("=")
+    if indicator_type not in DEFAULT_TYPE_WEIGHTS:
+        raise argparse.ArgumentTypeError(
+            f"unknown indicator type {indicator_type!r} (choose from {', '.join(DEFAULT_TYPE_WEIGHTS)})")
+    try:
+        weight = float(weight)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected TYPE=WEIGHT, got {text!r}")
+    if weight <= 0:
+        raise argparse.ArgumentTypeError(f"weight of {indicator_type} must be positive")
+    return indicator_type, weight
+
+
+def _admin_execute(sql):
+    """Run a statement outside a transaction on the server's maintenance database."""
+    conn = psycopg2.connect(**{**DB_CONFIG, "dbname": "postgres"})
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(sql)
+    finally:
+        conn.close()
+
+
+@contextlib.contextmanager
+def throwaway_database(name, keep=False):
+    """Point DB_CONFIG (shared by every module) at a fresh database for the duration of the block."""
+    original = dict(DB_CONFIG)
+    _admin_execute(f"DROP DATABASE IF EXISTS {name}")
+    _admin_execute(f"CREATE DATABASE {name}")
+    close_pool()
+    DB_CONFIG["dbname"] = name
+    try:
+        from setup_db import setup_database
+        setup_database()
+        yield
+    finally:
+        close_pool()
+        DB_CONFIG.clear()
+        DB_CONFIG.update(original)
+        if not keep:
+            _admin_execute(f"DROP DATABASE IF EXISTS {name}")
+
+
+def _quiet():
+    """Silence the pipeline's progress output while timing."""
+    return contextlib.redirect_stdout(io.StringIO())
+
+
+def benchmark_scale(indicator_count, args):
+    """Run every benchmark at one scale and return the stage records."""
+    from src.transform import transform_pulses
+    # A fresh run report, so the query.* stages recorded by run_all_queries land in it too
+    report = start_run()
+    print(f"\n=== {indicator_count:,} indicators ===")
+    with report.stage("generate") as m:
+        pulses = generate_pulses(indicator_count, args.indicators_per_pulse, type_weights=args.type_weights,
+                                 seed=args.seed)
+        m["rows"] = indicator_count
+        m["details"] = {"pulses": len(pulses)}
+
+    with report.stage("transform") as m, _quiet():
+        pulses_df, indicators_df = transform_pulses(pulses)
+        m["rows"] = len(indicators_df)
+    del pulses
+
+    if not args.skip_db:
+        from src.load import load_to_postgres
+        from src.sql_queries import run_all_queries
+        with throwaway_database(args.database, keep=args.keep_db):
+            with report.stage("load_initial") as m, _quiet():
+                m["details"] = load_to_postgres(pulses_df, indicators_df)
+                m["rows"] = len(indicators_df)
+            with report.stage("load_unchanged") as m, _quiet():
+                m["details"] = load_to_postgres(pulses_df, indicators_df)
+                m["rows"] = len(indicators_df)
+            for use_rollups in (False, True):
+                name = "queries_rollup" if use_rollups else "queries_raw"
+                with report.stage(name) as m, _quiet():
+                    first = len(report.stages)
+                    results = run_all_queries(use_rollups=use_rollups, cache_dir=None)  # Time every query
+                    m["details"] = {
+                        "errors": [k for k, v in results.items() if isinstance(v, dict)],
+                        "query_seconds": {record["stage"][len("query."):]: record["wall_seconds"]
+                                          for record in report.stages[first:]
+                                          if record["stage"].startswith("query.")},
+                    }
+
+    for record in report.stages:
+        if not record["stage"].startswith("query."):
+            print(f"{record['stage']:>16}: {record['wall_seconds']:8.3f}s")
+    return [record for record in report.stages if not record["stage"].startswith("query.")]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the threat intel ETL on synthetic OTX data")
+    parser.add_argument("--scales", type=int, nargs="+", default=DEFAULT_SCALES,
+                        help="Indicator counts to benchmark")
+    parser.add_argument("--indicators-per-pulse", type=int, default=60)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--type-weights", type=_type_weight, nargs="+", metavar="TYPE=WEIGHT",
+                        help="Indicator type mix replacing the production one, e.g. IPv4=0.5 domain=0.5")
+    parser.add_argument("--skip-db", action="store_true", help="Only benchmark the transform")
+    parser.add_argument("--database", default="threat_intel_bench", help="Throwaway database name")
+    parser.add_argument("--keep-db", action="store_true", help="Keep the benchmark database afterwards")
+    parser.add_argument("--output", default=None, help="Results file (default: benchmarks/results/<timestamp>.json)")
+    args = parser.parse_args()
+    args.type_weights = dict(args.type_weights) if args.type_weights else None
+
+    results = {
+        "timestamp": datetime.now().isoformat(),
+        "git_revision": _git_revision(),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "platform": platform.platform(),
+        "parameters": {"indicators_per_pulse": args.indicators_per_pulse, "seed": args.seed,
+                       "type_weights": args.type_weights or DEFAULT_TYPE_WEIGHTS},
+        "scales": {},
+    }
+    for indicator_count in args.scales:
+        results["scales"][str(indicator_count)] = benchmark_scale(indicator_count, args)
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, default=str)
+    print(f"\nResults written to {output}")
+
+
+if __name__ == "__main__":
+    main()
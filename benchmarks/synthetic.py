@@ -0,0 +1,114 @@
+# benchmarks/synthetic.py
+# Synthetic pulse payloads shaped like OTXv2.getall() output, for reproducible benchmarks.
+import random
+from datetime import datetime, timedelta
+
+# Indicator type mix observed in the production subscription (see README "Key Findings")
+DEFAULT_TYPE_WEIGHTS = {
+    "FileHash-SHA256": 0.325,
+    "domain": 0.158,
+    "FileHash-MD5": 0.156,
+    "FileHash-SHA1": 0.132,
+    "hostname": 0.119,
+    "IPv4": 0.06,
+    "URL": 0.05,
+}
+
+TAGS = ["malware", "phishing", "ransomware", "powershell", "apt", "botnet", "stealer", "loader", "c2", "exploit"]
+COUNTRIES = ["United States of America", "Ukraine", "Russian Federation", "India", "Germany", "China", "Brazil"]
+INDUSTRIES = ["Government", "Finance", "Healthcare", "Energy", "Telecommunications", "Education"]
+TLPS = ["white", "white", "white", "green", "amber", "red"]
+HEX_LENGTHS = {"FileHash-SHA256": 64, "FileHash-SHA1": 40, "FileHash-MD5": 32}
+EPOCH = datetime(2025, 5, 15)
+
+
+def _timestamp(dt):
+    return dt.strftime("%Y-%m-%dT%H:%M:%S.%f")
+
+
+def _value(rng, indicator_type):
+    """Random indicator value of the given OTX type."""
+    if indicator_type in HEX_LENGTHS:
+        return f"{rng.getrandbits(HEX_LENGTHS[indicator_type] * 4):0{HEX_LENGTHS[indicator_type]}x}"
+    if indicator_type == "IPv4":
+        return ".".join(str(rng.randint(1, 254)) for _ in range(4))
+    name = f"{rng.getrandbits(40):010x}"
+    if indicator_type == "domain":
+        return f"{name}.com"
+    if indicator_type == "hostname":
+        return f"cdn.{name}.net"
+    return f"http://{name}.org/{rng.getrandbits(24):06x}/payload.exe"
+
+
+def generate_pulses(indicator_count, indicators_per_pulse=60, type_weights=None, shared_ratio=0.1,
+                    expiring_ratio=0.05, seed=0):
+    """
+    Generate synthetic OTX pulses.
+    Args:
+        indicator_count (int): Total indicators across all pulses.
+        indicators_per_pulse (int): Mean indicators per pulse (sizes vary from 1 to twice the mean).
+        type_weights (dict): Indicator type -> relative frequency; defaults to DEFAULT_TYPE_WEIGHTS.
+        shared_ratio (float): Fraction of indicators whose value reappears in other pulses.
+        expiring_ratio (float): Fraction of indicators with an expiration (half already expired).
+        seed (int): Random seed; the same arguments always produce the same payload.
+    Returns:
+        list: Pulse dictionaries.
+    """
+    rng = random.Random(seed)
+    weights = type_weights or DEFAULT_TYPE_WEIGHTS
+    types = list(weights)
+    cumulative = [sum(list(weights.values())[:i + 1]) for i in range(len(types))]
+    shared_pool = []
+    pulses = []
+    indicator_id = 1
+    while indicator_id <= indicator_count:
+        size = min(rng.randint(1, 2 * indicators_per_pulse - 1), indicator_count - indicator_id + 1)
+        created = EPOCH - timedelta(minutes=rng.randint(0, 60 * 24 * 365 * 3))
+        modified = created + timedelta(minutes=rng.randint(0, 60 * 24 * 30))
+        indicators = []
+        for _ in range(size):
+            if shared_pool and rng.random() < shared_ratio:
+                indicator_type, value = rng.choice(shared_pool)
+            else:
+                indicator_type = rng.choices(types, cum_weights=cumulative)[0]
+                value = _value(rng, indicator_type)
+                if len(shared_pool) < 10000:
+                    shared_pool.append((indicator_type, value))
+            expiration = None
+            if rng.random() < expiring_ratio:
+                expiration = _timestamp(EPOCH + timedelta(days=rng.randint(-90, 90)))
+            indicators.append({
+                "id": indicator_id,
+                "indicator": value,
+                "type": indicator_type,
+                "title": "",
+                "description": "",
+                "access_reason": "",
+                "created": _timestamp(created),
+                "is_active": 1,
+                "access_type": "public",
+                "content": "",
+                "role": None,
+                "expiration": expiration,
+                "access_groups": [],
+                "observations": 1,
+            })
+            indicator_id += 1
+        pulses.append({
+            "id": f"{rng.getrandbits(96):024x}",
+            "name": f"Synthetic pulse {len(pulses) + 1}",
+            "description": "Synthetic benchmark pulse",
+            "author_name": "benchmark",
+            "public": 1,
+            "revision": 1,
+            "adversary": "",
+            "industries": rng.sample(INDUSTRIES, rng.randint(0, 2)),
+            "tlp": rng.choice(TLPS),
+            "tags": rng.sample(TAGS, rng.randint(0, 4)),
+            "created": _timestamp(created),
+            "modified": _timestamp(modified),
+            "references": [f"https://example.com/report/{len(pulses) + 1}"],
+            "targeted_countries": rng.sample(COUNTRIES, rng.randint(0, 3)),
+            "indicators": indicators,
+        })
+    return pulses
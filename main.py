@@ -1,43 +1,380 @@
 # main.py
-from src.extract import extract_otx_pulses
-from src.transform import transform_pulses
-from src.load import load_to_postgres
-from src.send_to_llms import run_llm_pipeline
+# Stage modules are imported inside the functions that run them, so pandas, OTXv2 and
+# anthropic are only loaded by the stages that need them and CLI startup stays fast.
+from src.metrics import start_run, stage
+from src.db import advisory_lock, close_pool
+from src.config import (
+    OTX_FETCH_WORKERS, SNAPSHOT_DIR, SNAPSHOT_FORMAT, METRICS_REPORT_PATH, METRICS_PROMETHEUS_PATH,
+    METRICS_TRACEMALLOC, STORAGE_MODE, PIPELINE_LOCK_KEY, DAEMON_INTERVAL_SECONDS, DAEMON_QUEUE_SIZE
+)
+import argparse
+import logging
+import logging.handlers
+import queue
+import signal
 import sys
+import threading
+import time
 from contextlib import contextmanager
 
+LOG_BUFFER_RECORDS = 1000  # Lines held in memory before the log file is written
+
+class _LogWriter:
+    """File-like stdout replacement that turns each printed line into a log record."""
+    def __init__(self, logger, file_handler):
+        self._logger = logger
+        self._file_handler = file_handler
+        self._pending = threading.local()  # Partial lines, per thread
+
+    def write(self, data):
+        text = getattr(self._pending, "text", "") + data
+        *lines, self._pending.text = text.split("\n")
+        for line in lines:
+            # Error lines are written through to the file at once
+            level = logging.ERROR if line.lstrip().startswith("Error") else logging.INFO
+            self._logger.log(level, line)
+        return len(data)
+
+    def flush(self):
+        self._file_handler.flush()
+
 @contextmanager
-def tee(file_path):
-    """Redirect stdout to both console and a file."""
+def log_output(file_path):
+    """
+    Route print output through logging: lines go to the console as they are printed and to
+    file_path through a buffer flushed every LOG_BUFFER_RECORDS lines, on errors and on exit.
+    """
     original_stdout = sys.stdout
-    with open(file_path, 'w') as f:
-        class Tee:
-            def write(self, data):
-                f.write(data)
-                f.flush()
-                original_stdout.write(data)
-                original_stdout.flush()
-            def flush(self):
-                f.flush()
-                original_stdout.flush()
-        sys.stdout = Tee()
-        try:
-            yield
-        finally:
-            sys.stdout = original_stdout
+    logger = logging.getLogger("threat_intel_etl")
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    console = logging.StreamHandler(original_stdout)
+    log_file = logging.FileHandler(file_path, mode="w", encoding="utf-8")
+    file_handler = logging.handlers.MemoryHandler(LOG_BUFFER_RECORDS, flushLevel=logging.ERROR, target=log_file)
+    for handler in (console, file_handler):
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+    writer = _LogWriter(logger, file_handler)
+    sys.stdout = writer
+    try:
+        yield
+    finally:
+        if getattr(writer._pending, "text", ""):
+            writer.write("\n")
+        sys.stdout = original_stdout
+        for handler in (console, file_handler):
+            logger.removeHandler(handler)
+            handler.close()  # MemoryHandler.close() flushes to the file first
+        log_file.close()
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Threat intel ETL pipeline")
+    parser.add_argument("--full", action="store_true",
+                        help="Resync every subscribed pulse instead of only those modified since the last load")
+    parser.add_argument("--workers", type=int, default=OTX_FETCH_WORKERS,
+                        help="Concurrent OTX page fetchers (1 walks pages serially through the OTX SDK)")
+    parser.add_argument("--stream", action="store_true",
+                        help="Extract, transform and load page by page with bounded memory")
+    parser.add_argument("--csv", action="store_true",
+                        help="Also export pulses.csv and indicators.csv after transform")
+    parser.add_argument("--snapshot", nargs="?", const=SNAPSHOT_DIR, default=None, metavar="DIR",
+                        help=f"Save a snapshot of the transformed data (default dir: {SNAPSHOT_DIR})")
+    parser.add_argument("--snapshot-format", choices=["parquet", "csv"], default=SNAPSHOT_FORMAT,
+                        help="Format for --snapshot")
+    parser.add_argument("--from-snapshot", nargs="?", const=SNAPSHOT_DIR, default=None, metavar="DIR",
+                        help="Load a saved snapshot instead of extracting from OTX")
+    parser.add_argument("--chunked", action="store_true",
+                        help="Commit the load in checkpointed chunks (LOAD_CHUNK_SIZE) so a failed load can be resumed")
+    parser.add_argument("--resume", nargs="?", const="", default=None, metavar="RUN_ID",
+                        help="Resume an interrupted --chunked load (default: the newest unfinished one)")
+    parser.add_argument("--retention", action="store_true",
+                        help="After loading, archive expired and long-inactive indicators (see RETENTION_* in src/config.py)")
+    parser.add_argument("--skip-llm", action="store_true",
+                        help="Stop after loading, without running the SQL/LLM analysis")
+    parser.add_argument("--daemon", action="store_true",
+                        help="Run continuously, overlapping the next extract with the current load")
+    parser.add_argument("--interval", type=float, default=DAEMON_INTERVAL_SECONDS, metavar="SECONDS",
+                        help="Seconds between extracts in --daemon mode")
+    parser.add_argument("--report", default=METRICS_REPORT_PATH, metavar="PATH",
+                        help="Where to write the JSON run report")
+    parser.add_argument("--prometheus", default=METRICS_PROMETHEUS_PATH, metavar="PATH",
+                        help="Also write Prometheus textfile metrics to PATH")
+    parser.add_argument("--trace-memory", action="store_true", default=METRICS_TRACEMALLOC,
+                        help="Record the run's Python heap peak with tracemalloc")
+    return parser.parse_args()
+
+def _load_rows(stats):
+    """Rows written by a load (inserted + updated + deleted)."""
+    if not stats:
+        return 0
+    return sum(counts["inserted"] + counts["updated"] + counts.get("deleted", 0) for counts in stats.values())
+
+def _transform(pulses, export_csv=False):
+    """Transform stage for the configured STORAGE_MODE; returns the frames its loader takes."""
+    with stage("transform") as m:
+        if STORAGE_MODE == "normalized":
+            from src.transform import transform_pulses_normalized
+            frames = transform_pulses_normalized(pulses)
+        else:
+            from src.transform import transform_pulses
+            frames = transform_pulses(pulses, export_csv=export_csv)
+        m["rows"] = len(frames[-1])
+    return frames
+
+def _run_load(*frames, chunked=False):
+    with stage("load") as m:
+        if STORAGE_MODE == "normalized":
+            from src.load import load_normalized as load
+        elif chunked:
+            from src.load import load_resumable as load
+        else:
+            from src.load import load_to_postgres as load
+        stats = load(*frames)
+        m["rows"] = _load_rows(stats)
+        m["details"] = stats
+    return stats
+
+def _run_retention():
+    from src.retention import run_retention
+    with stage("retention") as m:
+        stats = run_retention(storage_mode=STORAGE_MODE)
+        m["rows"] = stats["archived"] if stats else 0
+        m["details"] = stats
+
+def _run_llm(exit_on_error=True):
+    """Run the LLM analysis; a failed query stage ends a one-shot run with exit status 1."""
+    from src.send_to_llms import run_llm_pipeline
+    with stage("llm") as m:
+        ok = run_llm_pipeline()
+        m["details"] = None if ok else {"error": "database queries failed"}
+    if not ok and exit_on_error:
+        sys.exit(1)
+    return ok
+
+def run_streaming_pipeline(full=False, retention=False, skip_llm=False):
+    """Run the ETL pipeline as a generator chain, loading and committing one chunk at a time."""
+    from src.extract import (
+        iter_otx_pulse_pages, get_last_modified, hold_extract_checkpoint, release_extract_checkpoint
+    )
+    from src.transform import iter_transform_chunks
+    from src.load import load_stream
+    print("Starting streaming ETL pipeline...")
+    modified_since = None if full else get_last_modified()
+    # Extract, transform and load interleave, so they are timed as one stage
+    with stage("stream") as m:
+        pages = iter_otx_pulse_pages(full=full, modified_since=modified_since)
+        stats = load_stream(iter_transform_chunks(pages))
+        m["rows"] = _load_rows(stats)
+        m["details"] = stats
+    if stats is None:
+        # Pages are not in modified order, so chunks committed before the failure can already
+        # have raised MAX(pulses.modified) past the pulses that were lost
+        hold_extract_checkpoint(modified_since)
+    else:
+        release_extract_checkpoint()
+    if retention:
+        _run_retention()
+    if not skip_llm:
+        _run_llm()
+    print("Pipeline complete!")
+
+def run_snapshot_pipeline(path, chunked=False, retention=False, skip_llm=False):
+    """Replay a saved snapshot into Postgres without calling OTX."""
+    if STORAGE_MODE != "wide":
+        print("Snapshots hold the wide indicators layout; replaying them requires STORAGE_MODE = 'wide'.")
+        return
+    from src.snapshot import read_snapshot
+    print("Starting ETL pipeline from snapshot...")
+    with stage("read_snapshot") as m:
+        pulses_df, indicators_df = read_snapshot(path)
+        m["rows"] = len(indicators_df)
+    _run_load(pulses_df, indicators_df, chunked=chunked)
+    if retention:
+        _run_retention()
+    if not skip_llm:
+        _run_llm()
+    print("Pipeline complete!")
 
-def run_pipeline():
+def run_pipeline(full=False, workers=OTX_FETCH_WORKERS, export_csv=False, snapshot=None,
+                 snapshot_format=SNAPSHOT_FORMAT, chunked=False, retention=False, skip_llm=False):
     """Run the full ETL pipeline."""
+    from src.extract import extract_otx_pulses
     print("Starting ETL pipeline...")
-    pulses = extract_otx_pulses()
+    with stage("extract") as m:
+        pulses = extract_otx_pulses(full=full, workers=workers)
+        m["rows"] = len(pulses)
     if not pulses:
         print("No pulses fetched. Exiting.")
+        if retention:
+            _run_retention()  # Indicators still expire when nothing new was published
         return
-    pulses_df, indicators_df = transform_pulses(pulses)
-    load_to_postgres(pulses_df, indicators_df)
-    run_llm_pipeline()
+    if STORAGE_MODE != "wide" and (export_csv or snapshot or chunked):
+        print("CSV export, snapshots and chunked loads need the wide storage mode; skipping them.")
+        export_csv = snapshot = None
+    frames = _transform(pulses, export_csv=export_csv)
+    del pulses  # Release the raw JSON before loading
+    if snapshot:
+        from src.snapshot import write_snapshot
+        with stage("snapshot") as m:
+            write_snapshot(*frames, snapshot, snapshot_format)
+            m["rows"] = len(frames[1])
+    if _run_load(*frames, chunked=chunked) is not None:
+        from src.extract import release_extract_checkpoint
+        release_extract_checkpoint()  # This extract started at any held checkpoint
+    if retention:
+        _run_retention()
+    if not skip_llm:
+        _run_llm()
+    print("Pipeline complete!")
+
+def run_resume(run_id=None, retention=False, skip_llm=False):
+    """Finish an interrupted chunked load from its checkpoint."""
+    from src.load import resume_load
+    with stage("load") as m:
+        stats = resume_load(run_id or None)
+        m["rows"] = _load_rows(stats)
+        m["details"] = stats
+    if retention:
+        _run_retention()
+    if stats and not skip_llm:
+        _run_llm()
     print("Pipeline complete!")
 
+def _produce_batches(batches, stop, checkpoint, full, workers, interval):
+    """
+    Daemon producer: extract and transform on a timer and hand (frames, modified_since, newest)
+    batches to the loader through the bounded `batches` queue, so the next extract overlaps
+    the current load. Each fetch starts from checkpoint["modified_since"], which only the
+    loader advances once a batch has committed (None: the database checkpoint), so a batch
+    whose load fails is fetched again by the next cycle.
+    """
+    from src.extract import extract_otx_pulses, latest_modified
+    while not stop.is_set():
+        started = time.monotonic()
+        modified_since = checkpoint["modified_since"]
+        batch = (None, modified_since, None)
+        try:
+            with stage("extract") as m:
+                pulses = extract_otx_pulses(full=full, workers=workers, modified_since=modified_since)
+                m["rows"] = len(pulses)
+            if pulses:
+                batch = (_transform(pulses), modified_since, latest_modified(pulses))
+            full = False
+            del pulses
+        except Exception as e:
+            print(f"Error in daemon extract/transform: {e}")
+        # Blocks while the loader is busy with earlier batches
+        while not stop.is_set():
+            try:
+                batches.put(batch, timeout=1)
+                break
+            except queue.Full:
+                continue
+        stop.wait(max(0.0, interval - (time.monotonic() - started)))
+
+def _drop_queued(batches):
+    """Discard batches waiting for the loader; returns how many were dropped."""
+    dropped = 0
+    while True:
+        try:
+            batches.get_nowait()
+        except queue.Empty:
+            return dropped
+        dropped += 1
+
+def _acknowledge(checkpoint, fetched_since, newest):
+    """Advance the producer's checkpoint after a batch committed."""
+    if newest and (checkpoint["modified_since"] is None or newest > checkpoint["modified_since"]):
+        checkpoint["modified_since"] = newest
+    if fetched_since is None:
+        from src.extract import release_extract_checkpoint
+        release_extract_checkpoint()  # The batch was fetched from the database checkpoint
+
+def run_daemon(interval=DAEMON_INTERVAL_SECONDS, full=False, workers=OTX_FETCH_WORKERS, retention=False,
+               skip_llm=False, report_path=None, prometheus_path=None, trace_memory=False):
+    """
+    Run the pipeline continuously until SIGTERM/SIGINT. The DB pool, HTTP sessions and
+    imports stay warm between cycles. A signal lets the current load finish; batches
+    still queued are dropped and refetched from the database checkpoint on restart.
+    """
+    stop = threading.Event()
+    checkpoint = {"modified_since": None}  # Newest pulse of the last committed batch
+
+    def request_stop(signum, frame):
+        print(f"Received signal {signum}; finishing the current cycle before shutting down...")
+        stop.set()
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+    batches = queue.Queue(maxsize=DAEMON_QUEUE_SIZE)
+    report = start_run(trace_memory=trace_memory)
+    producer = threading.Thread(target=_produce_batches, name="extract", daemon=True,
+                                args=(batches, stop, checkpoint, full, workers, interval))
+    producer.start()
+    print(f"Daemon started; extracting every {interval:g}s")
+    cycle = 0
+    while not stop.is_set():
+        try:
+            frames, fetched_since, newest = batches.get(timeout=1)
+        except queue.Empty:
+            continue
+        cycle += 1
+        try:
+            stats = _run_load(*frames) if frames else None
+            if frames and stats is None:
+                # The checkpoint was not advanced, so the producer refetches the failed batch's
+                # pulses (and anything newer) on its next cycle; queued batches are superseded
+                dropped = _drop_queued(batches)
+                print(f"Load failed; dropped {dropped} queued batches, refetching from the last committed batch")
+            elif frames:
+                _acknowledge(checkpoint, fetched_since, newest)
+            if retention:
+                _run_retention()
+            if _load_rows(stats) and not skip_llm:
+                _run_llm(exit_on_error=False)  # SystemExit would stop the daemon
+        except Exception as e:
+            print(f"Error in daemon cycle {cycle}: {e}")
+        # One report per load cycle, including the extract that overlapped it
+        if report_path:
+            report.write_json(report_path)
+        if prometheus_path:
+            report.write_prometheus(prometheus_path)
+        report = start_run(trace_memory=trace_memory)
+        print(f"Cycle {cycle} complete.")
+        sys.stdout.flush()
+    producer.join(timeout=5)
+    print("Daemon stopped.")
+
 if __name__ == "__main__":
-    with tee('pipeline_output.txt'):
-        run_pipeline()
+    args = parse_args()
+    report = start_run(trace_memory=args.trace_memory)
+    with log_output('pipeline_output.txt'):
+        # Session-level lock held for the whole run, so cron runs and a daemon never overlap
+        with advisory_lock(PIPELINE_LOCK_KEY) as locked:
+            if not locked:
+                print("Another pipeline run holds the lock; exiting.")
+                sys.exit(1)
+            try:
+                if args.daemon:
+                    run_daemon(interval=args.interval, full=args.full, workers=args.workers,
+                               retention=args.retention, skip_llm=args.skip_llm, report_path=args.report,
+                               prometheus_path=args.prometheus, trace_memory=args.trace_memory)
+                elif args.resume is not None:
+                    run_resume(args.resume, retention=args.retention, skip_llm=args.skip_llm)
+                elif args.from_snapshot:
+                    run_snapshot_pipeline(args.from_snapshot, chunked=args.chunked, retention=args.retention,
+                                          skip_llm=args.skip_llm)
+                elif args.stream:
+                    run_streaming_pipeline(full=args.full, retention=args.retention, skip_llm=args.skip_llm)
+                else:
+                    run_pipeline(full=args.full, workers=args.workers, export_csv=args.csv, snapshot=args.snapshot,
+                                 snapshot_format=args.snapshot_format, chunked=args.chunked,
+                                 retention=args.retention, skip_llm=args.skip_llm)
+            finally:
+                close_pool()
+                if not args.daemon:
+                    if args.report:
+                        report.write_json(args.report)
+                        print(f"Run report written to {args.report}")
+                    if args.prometheus:
+                        report.write_prometheus(args.prometheus)
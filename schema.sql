@@ -1,10 +1,7 @@
 -- schema.sql
--- Drop existing tables if they exist (for a fresh start)
-DROP TABLE IF EXISTS indicators CASCADE;
-DROP TABLE IF EXISTS pulses CASCADE;
-
+-- Generated by `python setup_db.py --schema`; do not edit by hand
 -- Create pulses table for top-level metadata
-CREATE TABLE pulses (
+CREATE TABLE IF NOT EXISTS pulses (
     id VARCHAR(50) PRIMARY KEY,
     name TEXT NOT NULL,
     description TEXT,
@@ -22,8 +19,8 @@ CREATE TABLE pulses (
 );
 
 -- Create indicators table for IoCs linked to pulses
-CREATE TABLE indicators (
-    id INTEGER PRIMARY KEY,
+CREATE TABLE IF NOT EXISTS indicators (
+    id BIGINT PRIMARY KEY,
     pulse_id VARCHAR(50) REFERENCES pulses(id) ON DELETE CASCADE,
     indicator TEXT NOT NULL,
     type VARCHAR(50),
@@ -38,4 +35,185 @@ CREATE TABLE indicators (
     expiration TIMESTAMP,
     access_groups JSONB,
     observations INTEGER
-);
\ No newline at end of file
+);
+
+-- Track which schema migrations have been applied
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version INTEGER PRIMARY KEY,
+    description TEXT,
+    applied_at TIMESTAMP DEFAULT NOW()
+);
+
+-- Migration 1: Indexes for the analytics queries and dashboard panels
+-- Joins on pulse_id; including type lets COUNT(DISTINCT type) per pulse use an index-only scan
+CREATE INDEX IF NOT EXISTS idx_indicators_pulse_id_type ON indicators (pulse_id, type);
+-- GROUP BY type
+CREATE INDEX IF NOT EXISTS idx_indicators_type ON indicators (type);
+-- Range filters on expiration; most indicators have none, so keep them out of the index
+CREATE INDEX IF NOT EXISTS idx_indicators_expiration ON indicators (expiration) WHERE expiration IS NOT NULL;
+-- Monthly pulse trends
+CREATE INDEX IF NOT EXISTS idx_pulses_created ON pulses (created);
+-- Containment filters (e.g. tags ? 'phishing') on the JSONB arrays
+CREATE INDEX IF NOT EXISTS idx_pulses_tags ON pulses USING GIN (tags);
+CREATE INDEX IF NOT EXISTS idx_pulses_targeted_countries ON pulses USING GIN (targeted_countries);
+CREATE INDEX IF NOT EXISTS idx_pulses_industries ON pulses USING GIN (industries);
+
+-- Migration 2: Per-pulse rollup tables for the dashboard and analytics queries
+CREATE TABLE IF NOT EXISTS rollup_pulses (
+    pulse_id VARCHAR(50) PRIMARY KEY REFERENCES pulses(id) ON DELETE CASCADE,
+    name TEXT,
+    tlp VARCHAR(10),
+    month TIMESTAMP,
+    indicator_count INTEGER NOT NULL,
+    type_count INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_rollup_pulses_indicator_count ON rollup_pulses (indicator_count DESC);
+CREATE INDEX IF NOT EXISTS idx_rollup_pulses_month ON rollup_pulses (month);
+
+CREATE TABLE IF NOT EXISTS rollup_pulse_types (
+    pulse_id VARCHAR(50) REFERENCES pulses(id) ON DELETE CASCADE,
+    type VARCHAR(50),
+    indicator_count INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_rollup_pulse_types_pulse_id ON rollup_pulse_types (pulse_id);
+
+CREATE TABLE IF NOT EXISTS rollup_pulse_facets (
+    pulse_id VARCHAR(50) REFERENCES pulses(id) ON DELETE CASCADE,
+    facet VARCHAR(20) NOT NULL,  -- 'tag', 'country' or 'industry'
+    value TEXT,
+    occurrences INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_rollup_pulse_facets_pulse_id ON rollup_pulse_facets (pulse_id);
+CREATE INDEX IF NOT EXISTS idx_rollup_pulse_facets_facet ON rollup_pulse_facets (facet);
+
+-- Backfill from the data already loaded
+INSERT INTO rollup_pulses (pulse_id, name, tlp, month, indicator_count, type_count)
+SELECT p.id, p.name, p.tlp, DATE_TRUNC('month', p.created), COUNT(i.id), COUNT(DISTINCT i.type)
+FROM pulses p LEFT JOIN indicators i ON i.pulse_id = p.id
+GROUP BY p.id;
+INSERT INTO rollup_pulse_types (pulse_id, type, indicator_count)
+SELECT pulse_id, type, COUNT(*) FROM indicators GROUP BY pulse_id, type;
+INSERT INTO rollup_pulse_facets (pulse_id, facet, value, occurrences)
+SELECT p.id, 'tag', value, COUNT(*) FROM pulses p, jsonb_array_elements_text(p.tags) AS value GROUP BY p.id, value
+UNION ALL
+SELECT p.id, 'country', value, COUNT(*) FROM pulses p, jsonb_array_elements_text(p.targeted_countries) AS value GROUP BY p.id, value
+UNION ALL
+SELECT p.id, 'industry', value, COUNT(*) FROM pulses p, jsonb_array_elements_text(p.industries) AS value GROUP BY p.id, value;
+
+-- Migration 3: Normalized observable storage (STORAGE_MODE = 'normalized')
+-- Unique IoCs, keyed by a 64-bit hash of (type, indicator)
+CREATE TABLE IF NOT EXISTS observables (
+    id BIGINT PRIMARY KEY,
+    type VARCHAR(50),
+    indicator TEXT NOT NULL,
+    title TEXT,
+    description TEXT,
+    content TEXT
+);
+
+-- One row per OTX indicator, linking a pulse to an observable
+CREATE TABLE IF NOT EXISTS pulse_observables (
+    indicator_id BIGINT PRIMARY KEY,
+    pulse_id VARCHAR(50) REFERENCES pulses(id) ON DELETE CASCADE,
+    observable_id BIGINT NOT NULL REFERENCES observables(id),
+    access_reason TEXT,
+    created TIMESTAMP,
+    is_active BOOLEAN,
+    access_type VARCHAR(20) CHECK (access_type IN ('public', 'private', 'redacted')),
+    role TEXT,
+    expiration TIMESTAMP,
+    access_groups JSONB,
+    observations INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_pulse_observables_pulse_id ON pulse_observables (pulse_id);
+CREATE INDEX IF NOT EXISTS idx_pulse_observables_observable_id ON pulse_observables (observable_id);
+CREATE INDEX IF NOT EXISTS idx_pulse_observables_expiration ON pulse_observables (expiration)
+    WHERE expiration IS NOT NULL;
+
+-- Occurrences in the `indicators` column layout. The LEFT JOIN on the observables
+-- primary key lets the planner skip observables when no IoC column is referenced.
+CREATE OR REPLACE VIEW indicator_occurrences AS
+SELECT l.indicator_id AS id, l.pulse_id, o.indicator, o.type, o.title, o.description,
+       l.access_reason, l.created, l.is_active, l.access_type, o.content, l.role,
+       l.expiration, l.access_groups, l.observations
+FROM pulse_observables l
+LEFT JOIN observables o ON o.id = l.observable_id;
+
+-- Migration 4: Archive tables for indicators removed by the retention job
+-- Same columns as the hot tables, without keys, plus when the row was archived
+CREATE TABLE IF NOT EXISTS indicators_archive (LIKE indicators);
+ALTER TABLE indicators_archive ADD COLUMN IF NOT EXISTS archived_at TIMESTAMP NOT NULL DEFAULT NOW();
+CREATE INDEX IF NOT EXISTS idx_indicators_archive_archived_at ON indicators_archive (archived_at);
+
+CREATE TABLE IF NOT EXISTS pulse_observables_archive (LIKE pulse_observables);
+ALTER TABLE pulse_observables_archive ADD COLUMN IF NOT EXISTS archived_at TIMESTAMP NOT NULL DEFAULT NOW();
+CREATE INDEX IF NOT EXISTS idx_pulse_observables_archive_archived_at ON pulse_observables_archive (archived_at);
+
+-- Migration 5: Checkpoints for resumable chunked loads
+CREATE TABLE IF NOT EXISTS load_checkpoints (
+    run_id VARCHAR(64) PRIMARY KEY,
+    spool_path TEXT NOT NULL,
+    chunk_size INTEGER NOT NULL,
+    total_chunks INTEGER NOT NULL,
+    last_chunk INTEGER NOT NULL DEFAULT -1,  -- Index of the last committed chunk
+    status VARCHAR(10) NOT NULL DEFAULT 'running' CHECK (status IN ('running', 'failed', 'complete')),
+    stats JSONB,
+    started_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+-- Migration 6: Committed writes, whose latest id is the data version used by the query cache
+CREATE TABLE IF NOT EXISTS etl_runs (
+    id BIGSERIAL PRIMARY KEY,
+    kind VARCHAR(20) NOT NULL,  -- 'load' or 'retention'
+    stats JSONB,
+    finished_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+-- Migration 7: Incremental extract checkpoint held back after a partially committed stream
+CREATE TABLE IF NOT EXISTS extract_checkpoint (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),  -- At most one row
+    modified_since TIMESTAMP  -- NULL: the next extract must be a full fetch
+);
+
+-- Migration 8: Per-occurrence indicator text on pulse_observables instead of the shared observables
+-- title, description and content belong to one pulse's indicator, not to the shared IoC
+ALTER TABLE pulse_observables ADD COLUMN IF NOT EXISTS title TEXT,
+    ADD COLUMN IF NOT EXISTS description TEXT, ADD COLUMN IF NOT EXISTS content TEXT;
+ALTER TABLE pulse_observables_archive ADD COLUMN IF NOT EXISTS title TEXT,
+    ADD COLUMN IF NOT EXISTS description TEXT, ADD COLUMN IF NOT EXISTS content TEXT;
+UPDATE pulse_observables l SET title = o.title, description = o.description, content = o.content
+FROM observables o WHERE o.id = l.observable_id;
+UPDATE pulse_observables_archive a SET title = o.title, description = o.description, content = o.content
+FROM observables o WHERE o.id = a.observable_id;
+
+DROP VIEW IF EXISTS indicator_occurrences;
+ALTER TABLE observables DROP COLUMN IF EXISTS title, DROP COLUMN IF EXISTS description,
+    DROP COLUMN IF EXISTS content;
+CREATE VIEW indicator_occurrences AS
+SELECT l.indicator_id AS id, l.pulse_id, o.indicator, o.type, l.title, l.description,
+       l.access_reason, l.created, l.is_active, l.access_type, l.content, l.role,
+       l.expiration, l.access_groups, l.observations
+FROM pulse_observables l
+LEFT JOIN observables o ON o.id = l.observable_id;
+
+-- Archived occurrences keep their observable; anything else unlinked is removed
+CREATE INDEX IF NOT EXISTS idx_pulse_observables_archive_observable_id
+    ON pulse_observables_archive (observable_id);
+DELETE FROM observables o
+WHERE NOT EXISTS (SELECT 1 FROM pulse_observables l WHERE l.observable_id = o.id)
+  AND NOT EXISTS (SELECT 1 FROM pulse_observables_archive a WHERE a.observable_id = o.id);
+
+-- Migration 9: Data version counter bumped in commit order, with a per-database epoch
+-- Writers bump the version under the row lock, so versions are taken in commit order;
+-- the epoch is new whenever the table is (re)created, e.g. by --reset
+CREATE TABLE IF NOT EXISTS data_version (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),  -- Exactly one row
+    epoch TEXT NOT NULL DEFAULT md5(random()::text || clock_timestamp()::text),
+    version BIGINT NOT NULL
+);
+INSERT INTO data_version (version) SELECT COALESCE(MAX(id), 0) FROM etl_runs
+ON CONFLICT (id) DO NOTHING;
+ALTER TABLE etl_runs ADD COLUMN IF NOT EXISTS data_version BIGINT;
+UPDATE etl_runs SET data_version = id WHERE data_version IS NULL;
+CREATE INDEX IF NOT EXISTS idx_etl_runs_data_version ON etl_runs (data_version);
@@ -1,17 +1,41 @@
 # setup_db.py
 # One-Time Configuration
 # Install PostgreSQL prior to running this script, place DB credentials in src/config.py
+# Safe to re-run: missing tables are created and pending migrations applied without touching loaded data.
+# Pass --reset to drop everything and start fresh, --explain to check the analytics query plans.
+import argparse
+import json
+import os
+import sys
+import textwrap
 import psycopg2
 from src.config import DB_CONFIG
 
-# SQL schema
-SCHEMA = """
--- Drop existing tables if they exist (for a fresh start)
+# Drop existing tables (only with --reset)
+RESET = """
+DROP TABLE IF EXISTS schema_migrations;
+DROP TABLE IF EXISTS data_version;
+DROP TABLE IF EXISTS etl_runs;
+DROP TABLE IF EXISTS extract_checkpoint;
+DROP TABLE IF EXISTS load_checkpoints;
+DROP TABLE IF EXISTS indicators_archive;
+DROP TABLE IF EXISTS pulse_observables_archive;
+DROP VIEW IF EXISTS indicator_occurrences;
+DROP TABLE IF EXISTS pulse_observables;
+DROP TABLE IF EXISTS observables;
+DROP TABLE IF EXISTS rollup_pulse_facets;
+DROP TABLE IF EXISTS rollup_pulse_types;
+DROP TABLE IF EXISTS rollup_pulses;
 DROP TABLE IF EXISTS indicators CASCADE;
 DROP TABLE IF EXISTS pulses CASCADE;
+"""
+
+SCHEMA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "schema.sql")
 
+# SQL schema
+SCHEMA = """
 -- Create pulses table for top-level metadata
-CREATE TABLE pulses (
+CREATE TABLE IF NOT EXISTS pulses (
     id VARCHAR(50) PRIMARY KEY,
     name TEXT NOT NULL,
     description TEXT,
@@ -29,7 +53,7 @@ CREATE TABLE pulses (
 );
 
 -- Create indicators table for IoCs linked to pulses
-CREATE TABLE indicators (
+CREATE TABLE IF NOT EXISTS indicators (
     id BIGINT PRIMARY KEY,
     pulse_id VARCHAR(50) REFERENCES pulses(id) ON DELETE CASCADE,
     indicator TEXT NOT NULL,
@@ -46,20 +70,367 @@ CREATE TABLE indicators (
     access_groups JSONB,
     observations INTEGER
 );
+
+-- Track which schema migrations have been applied
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version INTEGER PRIMARY KEY,
+    description TEXT,
+    applied_at TIMESTAMP DEFAULT NOW()
+);
 """
 
-def setup_database():
+# Versioned, non-destructive schema upgrades applied in order by setup_database()
+MIGRATIONS = [
+    (1, "Indexes for the analytics queries and dashboard panels", """
+        -- Joins on pulse_id; including type lets COUNT(DISTINCT type) per pulse use an index-only scan
+        CREATE INDEX IF NOT EXISTS idx_indicators_pulse_id_type ON indicators (pulse_id, type);
+        -- GROUP BY type
+        CREATE INDEX IF NOT EXISTS idx_indicators_type ON indicators (type);
+        -- Range filters on expiration; most indicators have none, so keep them out of the index
+        CREATE INDEX IF NOT EXISTS idx_indicators_expiration ON indicators (expiration) WHERE expiration IS NOT NULL;
+        -- Monthly pulse trends
+        CREATE INDEX IF NOT EXISTS idx_pulses_created ON pulses (created);
+        -- Containment filters (e.g. tags ? 'phishing') on the JSONB arrays
+        CREATE INDEX IF NOT EXISTS idx_pulses_tags ON pulses USING GIN (tags);
+        CREATE INDEX IF NOT EXISTS idx_pulses_targeted_countries ON pulses USING GIN (targeted_countries);
+        CREATE INDEX IF NOT EXISTS idx_pulses_industries ON pulses USING GIN (industries);
+    """),
+    (2, "Per-pulse rollup tables for the dashboard and analytics queries", """
+        CREATE TABLE IF NOT EXISTS rollup_pulses (
+            pulse_id VARCHAR(50) PRIMARY KEY REFERENCES pulses(id) ON DELETE CASCADE,
+            name TEXT,
+            tlp VARCHAR(10),
+            month TIMESTAMP,
+            indicator_count INTEGER NOT NULL,
+            type_count INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_rollup_pulses_indicator_count ON rollup_pulses (indicator_count DESC);
+        CREATE INDEX IF NOT EXISTS idx_rollup_pulses_month ON rollup_pulses (month);
+
+        CREATE TABLE IF NOT EXISTS rollup_pulse_types (
+            pulse_id VARCHAR(50) REFERENCES pulses(id) ON DELETE CASCADE,
+            type VARCHAR(50),
+            indicator_count INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_rollup_pulse_types_pulse_id ON rollup_pulse_types (pulse_id);
+
+        CREATE TABLE IF NOT EXISTS rollup_pulse_facets (
+            pulse_id VARCHAR(50) REFERENCES pulses(id) ON DELETE CASCADE,
+            facet VARCHAR(20) NOT NULL,  -- 'tag', 'country' or 'industry'
+            value TEXT,
+            occurrences INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_rollup_pulse_facets_pulse_id ON rollup_pulse_facets (pulse_id);
+        CREATE INDEX IF NOT EXISTS idx_rollup_pulse_facets_facet ON rollup_pulse_facets (facet);
+
+        -- Backfill from the data already loaded
+        INSERT INTO rollup_pulses (pulse_id, name, tlp, month, indicator_count, type_count)
+        SELECT p.id, p.name, p.tlp, DATE_TRUNC('month', p.created), COUNT(i.id), COUNT(DISTINCT i.type)
+        FROM pulses p LEFT JOIN indicators i ON i.pulse_id = p.id
+        GROUP BY p.id;
+        INSERT INTO rollup_pulse_types (pulse_id, type, indicator_count)
+        SELECT pulse_id, type, COUNT(*) FROM indicators GROUP BY pulse_id, type;
+        INSERT INTO rollup_pulse_facets (pulse_id, facet, value, occurrences)
+        SELECT p.id, 'tag', value, COUNT(*) FROM pulses p, jsonb_array_elements_text(p.tags) AS value GROUP BY p.id, value
+        UNION ALL
+        SELECT p.id, 'country', value, COUNT(*) FROM pulses p, jsonb_array_elements_text(p.targeted_countries) AS value GROUP BY p.id, value
+        UNION ALL
+        SELECT p.id, 'industry', value, COUNT(*) FROM pulses p, jsonb_array_elements_text(p.industries) AS value GROUP BY p.id, value;
+    """),
+    (3, "Normalized observable storage (STORAGE_MODE = 'normalized')", """
+        -- Unique IoCs, keyed by a 64-bit hash of (type, indicator)
+        CREATE TABLE IF NOT EXISTS observables (
+            id BIGINT PRIMARY KEY,
+            type VARCHAR(50),
+            indicator TEXT NOT NULL,
+            title TEXT,
+            description TEXT,
+            content TEXT
+        );
+
+        -- One row per OTX indicator, linking a pulse to an observable
+        CREATE TABLE IF NOT EXISTS pulse_observables (
+            indicator_id BIGINT PRIMARY KEY,
+            pulse_id VARCHAR(50) REFERENCES pulses(id) ON DELETE CASCADE,
+            observable_id BIGINT NOT NULL REFERENCES observables(id),
+            access_reason TEXT,
+            created TIMESTAMP,
+            is_active BOOLEAN,
+            access_type VARCHAR(20) CHECK (access_type IN ('public', 'private', 'redacted')),
+            role TEXT,
+            expiration TIMESTAMP,
+            access_groups JSONB,
+            observations INTEGER
+        );
+        CREATE INDEX IF NOT EXISTS idx_pulse_observables_pulse_id ON pulse_observables (pulse_id);
+        CREATE INDEX IF NOT EXISTS idx_pulse_observables_observable_id ON pulse_observables (observable_id);
+        CREATE INDEX IF NOT EXISTS idx_pulse_observables_expiration ON pulse_observables (expiration)
+            WHERE expiration IS NOT NULL;
+
+        -- Occurrences in the `indicators` column layout. The LEFT JOIN on the observables
+        -- primary key lets the planner skip observables when no IoC column is referenced.
+        CREATE OR REPLACE VIEW indicator_occurrences AS
+        SELECT l.indicator_id AS id, l.pulse_id, o.indicator, o.type, o.title, o.description,
+               l.access_reason, l.created, l.is_active, l.access_type, o.content, l.role,
+               l.expiration, l.access_groups, l.observations
+        FROM pulse_observables l
+        LEFT JOIN observables o ON o.id = l.observable_id;
+    """),
+    (4, "Archive tables for indicators removed by the retention job", """
+        -- Same columns as the hot tables, without keys, plus when the row was archived
+        CREATE TABLE IF NOT EXISTS indicators_archive (LIKE indicators);
+        ALTER TABLE indicators_archive ADD COLUMN IF NOT EXISTS archived_at TIMESTAMP NOT NULL DEFAULT NOW();
+        CREATE INDEX IF NOT EXISTS idx_indicators_archive_archived_at ON indicators_archive (archived_at);
+
+        CREATE TABLE IF NOT EXISTS pulse_observables_archive (LIKE pulse_observables);
+        ALTER TABLE pulse_observables_archive ADD COLUMN IF NOT EXISTS archived_at TIMESTAMP NOT NULL DEFAULT NOW();
+        CREATE INDEX IF NOT EXISTS idx_pulse_observables_archive_archived_at ON pulse_observables_archive (archived_at);
+    """),
+    (5, "Checkpoints for resumable chunked loads", """
+        CREATE TABLE IF NOT EXISTS load_checkpoints (
+            run_id VARCHAR(64) PRIMARY KEY,
+            spool_path TEXT NOT NULL,
+            chunk_size INTEGER NOT NULL,
+            total_chunks INTEGER NOT NULL,
+            last_chunk INTEGER NOT NULL DEFAULT -1,  -- Index of the last committed chunk
+            status VARCHAR(10) NOT NULL DEFAULT 'running' CHECK (status IN ('running', 'failed', 'complete')),
+            stats JSONB,
+            started_at TIMESTAMP NOT NULL DEFAULT NOW(),
+            updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+        );
+    """),
+    (6, "Committed writes, whose latest id is the data version used by the query cache", """
+        CREATE TABLE IF NOT EXISTS etl_runs (
+            id BIGSERIAL PRIMARY KEY,
+            kind VARCHAR(20) NOT NULL,  -- 'load' or 'retention'
+            stats JSONB,
+            finished_at TIMESTAMP NOT NULL DEFAULT NOW()
+        );
+    """),
+    (7, "Incremental extract checkpoint held back after a partially committed stream", """
+        CREATE TABLE IF NOT EXISTS extract_checkpoint (
+            id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),  -- At most one row
+            modified_since TIMESTAMP  -- NULL: the next extract must be a full fetch
+        );
+    """),
+    (8, "Per-occurrence indicator text on pulse_observables instead of the shared observables", """
+        -- title, description and content belong to one pulse's indicator, not to the shared IoC
+        ALTER TABLE pulse_observables ADD COLUMN IF NOT EXISTS title TEXT,
+            ADD COLUMN IF NOT EXISTS description TEXT, ADD COLUMN IF NOT EXISTS content TEXT;
+        ALTER TABLE pulse_observables_archive ADD COLUMN IF NOT EXISTS title TEXT,
+            ADD COLUMN IF NOT EXISTS description TEXT, ADD COLUMN IF NOT EXISTS content TEXT;
+        UPDATE pulse_observables l SET title = o.title, description = o.description, content = o.content
+        FROM observables o WHERE o.id = l.observable_id;
+        UPDATE pulse_observables_archive a SET title = o.title, description = o.description, content = o.content
+        FROM observables o WHERE o.id = a.observable_id;
+
+        DROP VIEW IF EXISTS indicator_occurrences;
+        ALTER TABLE observables DROP COLUMN IF EXISTS title, DROP COLUMN IF EXISTS description,
+            DROP COLUMN IF EXISTS content;
+        CREATE VIEW indicator_occurrences AS
+        SELECT l.indicator_id AS id, l.pulse_id, o.indicator, o.type, l.title, l.description,
+               l.access_reason, l.created, l.is_active, l.access_type, l.content, l.role,
+               l.expiration, l.access_groups, l.observations
+        FROM pulse_observables l
+        LEFT JOIN observables o ON o.id = l.observable_id;
+
+        -- Archived occurrences keep their observable; anything else unlinked is removed
+        CREATE INDEX IF NOT EXISTS idx_pulse_observables_archive_observable_id
+            ON pulse_observables_archive (observable_id);
+        DELETE FROM observables o
+        WHERE NOT EXISTS (SELECT 1 FROM pulse_observables l WHERE l.observable_id = o.id)
+          AND NOT EXISTS (SELECT 1 FROM pulse_observables_archive a WHERE a.observable_id = o.id);
+    """),
+    (9, "Data version counter bumped in commit order, with a per-database epoch", """
+        -- Writers bump the version under the row lock, so versions are taken in commit order;
+        -- the epoch is new whenever the table is (re)created, e.g. by --reset
+        CREATE TABLE IF NOT EXISTS data_version (
+            id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),  -- Exactly one row
+            epoch TEXT NOT NULL DEFAULT md5(random()::text || clock_timestamp()::text),
+            version BIGINT NOT NULL
+        );
+        INSERT INTO data_version (version) SELECT COALESCE(MAX(id), 0) FROM etl_runs
+        ON CONFLICT (id) DO NOTHING;
+        ALTER TABLE etl_runs ADD COLUMN IF NOT EXISTS data_version BIGINT;
+        UPDATE etl_runs SET data_version = id WHERE data_version IS NULL;
+        CREATE INDEX IF NOT EXISTS idx_etl_runs_data_version ON etl_runs (data_version);
+    """),
+]
+
+def schema_sql():
+    """The full schema as setup_database() builds it: SCHEMA followed by every migration, for schema.sql."""
+    parts = ["-- schema.sql\n-- Generated by `python setup_db.py --schema`; do not edit by hand\n" + SCHEMA.strip()]
+    for version, description, sql in MIGRATIONS:
+        parts.append(f"-- Migration {version}: {description}\n" + textwrap.dedent(sql).strip())
+    return "\n\n".join(parts) + "\n"
+
+def apply_migrations(cursor):
+    """Apply every migration newer than the last recorded version. Returns the versions applied."""
+    cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")
+    current = cursor.fetchone()[0]
+    applied = []
+    for version, description, sql in MIGRATIONS:
+        if version <= current:
+            continue
+        print(f"Applying migration {version}: {description}")
+        cursor.execute(sql)
+        cursor.execute("INSERT INTO schema_migrations (version, description) VALUES (%s, %s)",
+                       (version, description))
+        applied.append(version)
+    return applied
+
+# Relations a query has to read in full, so a sequential scan is the right plan; --explain fails
+# on any other sequential scan
+EXPECTED_SEQ_SCANS = {
+    "total_pulses": {"pulses"},  # COUNT(*) may prefer the heap over an index-only scan
+    "total_indicators": {"indicators"},
+    "top_countries": {"pulses"},  # JSONB arrays are unnested for every pulse
+    "top_tags": {"pulses"},
+    "top_industries": {"pulses"},
+    "expired_active": {"indicators"},  # Counts every indicator
+    "top_pulse": {"pulses", "indicators"},  # Counts indicators for every pulse
+    "samples": {"indicators"},  # LIMIT 3 stops after the first rows
+    "tlp_indicators": {"pulses", "indicators"},  # The TLP filter keeps nearly every row
+}
+# Indexes (from migration 1) each query must use; --explain fails when one is not used
+EXPECTED_INDEXES = {
+    "indicator_types": {("indicators", "idx_indicators_type")},
+    "pulse_trends": {("pulses", "idx_pulses_created")},
+    "multi_type_pulses": {("indicators", "idx_indicators_pulse_id_type")},
+    "expiring_indicators": {("indicators", "idx_indicators_expiration")},
+}
+# The GIN indexes serve containment filters (dashboard panels, ad-hoc queries) rather than the
+# analytics queries, so each is checked with a filter of that kind
+INDEX_PROBES = [
+    ("tags_filter", "SELECT id FROM pulses WHERE tags ? 'phishing'", {("pulses", "idx_pulses_tags")}),
+    ("countries_filter", "SELECT id FROM pulses WHERE targeted_countries ? 'Ukraine'",
+     {("pulses", "idx_pulses_targeted_countries")}),
+    ("industries_filter", "SELECT id FROM pulses WHERE industries ? 'Finance'",
+     {("pulses", "idx_pulses_industries")}),
+]
+# Tables smaller than this are cheaper to scan than to probe through an index, so they are not checked
+SEQ_SCAN_MIN_PAGES = 128
+
+def _bitmap_indexes(plan):
+    """Index names of the Bitmap Index Scans under a Bitmap Heap Scan (through BitmapAnd/BitmapOr)."""
+    names = [plan["Index Name"]] if plan.get("Node Type") == "Bitmap Index Scan" else []
+    for child in plan.get("Plans", []):
+        names.extend(_bitmap_indexes(child))
+    return names
+
+def _plan_access(plan, found):
+    """Collect (relation, index name or None for a sequential scan) for each relation read in an EXPLAIN (FORMAT JSON) plan tree."""
+    if plan.get("Node Type") == "Bitmap Heap Scan":
+        # The heap node names no index; its Bitmap Index Scan children do
+        for index in _bitmap_indexes(plan):
+            found.add((plan["Relation Name"], index))
+        return found
+    if "Relation Name" in plan:
+        index = plan.get("Index Name")
+        if index is None and plan.get("Node Type") != "Seq Scan":
+            index = plan["Node Type"].lower()  # e.g. a TID scan
+        found.add((plan["Relation Name"], index))
+    for child in plan.get("Plans", []):
+        _plan_access(child, found)
+    return found
+
+def _plan_problems(name, found, relpages, expected_indexes=None):
+    """
+    Problems with the relations and indexes `found` in the plan of query `name`: sequential scans
+    outside EXPECTED_SEQ_SCANS and expected indexes left unused, on relations of at least
+    SEQ_SCAN_MIN_PAGES pages (`relpages` maps a relation name to its size).
+    """
+    problems = []
+    expected = EXPECTED_INDEXES.get(name, set()) if expected_indexes is None else expected_indexes
+    for relation, index in sorted(expected - found):
+        if relpages(relation) >= SEQ_SCAN_MIN_PAGES:
+            problems.append(f"Expected index {index} on {relation} is not used ({relpages(relation)} pages)")
+    for relation, index in sorted(found, key=lambda access: (access[0], access[1] or "")):
+        if index is None and relation not in EXPECTED_SEQ_SCANS.get(name, set()) \
+                and relpages(relation) >= SEQ_SCAN_MIN_PAGES:
+            problems.append(f"Unexpected sequential scan of {relation} ({relpages(relation)} pages)")
+    return problems
+
+def check_query_plans():
+    """
+    EXPLAIN each analytics query in src/sql_queries.py and each of INDEX_PROBES, and report which
+    indexes they use.
+    Returns:
+        bool: False if a query sequentially scans a sizeable relation outside EXPECTED_SEQ_SCANS,
+            or does not use an index it is expected to.
+    """
+    from src.sql_queries import QUERIES, query_text
+    conn = None
+    ok = True
+    try:
+        conn = psycopg2.connect(**DB_CONFIG)
+        conn.autocommit = True  # VACUUM cannot run inside a transaction
+        cursor = conn.cursor()
+        # Fresh statistics and visibility map so the planner can consider index-only scans
+        cursor.execute("VACUUM ANALYZE pulses")
+        cursor.execute("VACUUM ANALYZE indicators")
+        pages = {}
+
+        def relpages(relation):
+            if relation not in pages:
+                cursor.execute("SELECT relpages FROM pg_class WHERE oid = %s::regclass", (relation,))
+                pages[relation] = cursor.fetchone()[0]
+            return pages[relation]
+
+        checks = [(q["name"], query_text(q, use_rollups=False, storage_mode="wide"), None) for q in QUERIES]
+        for name, sql, expected in checks + INDEX_PROBES:
+            cursor.execute("EXPLAIN (FORMAT JSON) " + sql)
+            plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            found = _plan_access(plan[0]["Plan"], set())
+            access = [f"{relation}: {index or 'sequential scan'}"
+                      for relation, index in sorted(found, key=lambda access: (access[0], access[1] or ""))]
+            print(f"{name}: {'; '.join(access) if access else 'no table access'}")
+            for problem in _plan_problems(name, found, relpages, expected):
+                print(f"  {problem}")
+                ok = False
+    except Exception as e:
+        print(f"Error checking query plans: {e}")
+        return False
+    finally:
+        if conn:
+            conn.close()
+    return ok
+
+def setup_database(reset=False):
+    conn = None
+    cursor = None
     try:
         conn = psycopg2.connect(**DB_CONFIG)
         cursor = conn.cursor()
+        if reset:
+            cursor.execute(RESET)
         cursor.execute(SCHEMA)
+        applied = apply_migrations(cursor)
         conn.commit()
-        print("Database schema created successfully!")
+        print(f"Database schema is up to date ({len(applied)} migrations applied).")
     except Exception as e:
         print(f"Error setting up database: {e}")
+        if conn:
+            conn.rollback()
     finally:
-        cursor.close()
-        conn.close()
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
 
 if __name__ == "__main__":
-    setup_database()
+    parser = argparse.ArgumentParser(description="Create or upgrade the threat_intel schema")
+    parser.add_argument("--reset", action="store_true", help="Drop all tables and recreate them (destroys data)")
+    parser.add_argument("--explain", action="store_true", help="Report index usage of the analytics queries")
+    parser.add_argument("--schema", action="store_true", help="Regenerate schema.sql from the schema and migrations")
+    args = parser.parse_args()
+    if args.schema:
+        with open(SCHEMA_FILE, "w", newline="\r\n") as f:
+            f.write(schema_sql())
+        print(f"Wrote {SCHEMA_FILE}")
+        sys.exit(0)
+    setup_database(reset=args.reset)
+    if args.explain and not check_query_plans():
+        sys.exit(1)
@@ -9,6 +9,14 @@ GROK_API_KEY = "your-xai-api-key" # Update to Credentials for Grok API
 # Anthropic API key for accessing Claude
 CLAUDE_API_KEY = "your-anthropic-api-key" # Update to Credentials for Claude API
 
+# LLM Settings (src/send_to_llms.py)
+GROK_API_URL = "https://api.x.ai/v1/completions"  # Adjust if endpoint changes
+CLAUDE_BASE_URL = None             # None = Anthropic default endpoint
+LLM_TIMEOUT_SECONDS = 60           # Per-call timeout
+LLM_MAX_RETRIES = 3                # Retries on rate limits, 5xx and connection errors
+LLM_CACHE_DIR = ".llm_cache"       # Responses cached by prompt + model hash
+LLM_CACHE_TTL_SECONDS = 86400      # Cached responses older than this are evicted
+
 # PostgreSQL Database Configuration
 DB_CONFIG = {                                                                      # Credentials for PostgreSQL Database
     "dbname": "threat_intel",
@@ -17,3 +25,66 @@ DB_CONFIG = {
     "host": "localhost",
     "port": "5432"
 }
+DB_POOL_MAX_CONNECTIONS = 8        # Upper bound on pooled connections shared by concurrent workers
+PIPELINE_LOCK_KEY = 72217          # pg advisory lock key that keeps pipeline runs from overlapping
+
+# Daemon Settings (main.py --daemon)
+DAEMON_INTERVAL_SECONDS = 900      # Time between the starts of consecutive extracts
+DAEMON_QUEUE_SIZE = 1              # Transformed batches waiting for the loader; bounds memory while stages overlap
+
+# OTX Extraction Settings
+OTX_SERVER = "https://otx.alienvault.com"
+OTX_FETCH_WORKERS = 4              # Concurrent page fetchers (1 = serial OTXv2 SDK walk)
+OTX_REQUESTS_PER_SECOND = 5        # Token-bucket rate limit shared by all fetchers
+OTX_MAX_RETRIES = 5                # Retries per page on HTTP 429/5xx or connection errors
+OTX_REQUEST_TIMEOUT = 60           # Seconds
+OTX_PAGE_SIZE = 50                 # Pulses requested per OTX API page
+
+# Storage Settings
+STORAGE_MODE = "wide"              # "wide" (indicators table) or "normalized" (observables + pulse_observables)
+
+# Load Settings
+LOAD_BATCH_SIZE = 50000            # Rows per COPY batch streamed into the staging tables
+LOAD_SKIP_UNCHANGED = True         # Skip pulses whose revision/modified match what is already loaded
+LOAD_CHUNK_SIZE = 100000           # Indicator rows per committed chunk in resumable loads (main.py --chunked)
+LOAD_SPOOL_DIR = "load_spool"      # Transformed data spooled per run so an interrupted load can resume
+
+# Retention Settings (src/retention.py, main.py --retention)
+RETENTION_INACTIVE_DAYS = 90       # Inactive indicators created longer ago than this are archived (None = keep)
+RETENTION_BATCH_SIZE = 10000       # Rows moved per DELETE ... RETURNING batch, each in its own transaction
+RETENTION_ARCHIVE = "table"        # "table" (indicators_archive), "parquet" (RETENTION_ARCHIVE_DIR) or "none"
+RETENTION_ARCHIVE_DIR = "archive"
+
+# Transform Settings
+TRANSFORM_WORKERS = 1              # Processes for transform_pulses (1 = serial); up to the host's core count
+TRANSFORM_PARALLEL_MIN_INDICATORS = 100000  # Smaller batches stay serial, where process startup would dominate
+
+# Streaming Settings (main.py --stream)
+TRANSFORM_CHUNK_SIZE = 50000       # Indicator rows per transformed chunk, loaded and committed one at a time
+
+# Snapshot Settings (main.py --snapshot / --from-snapshot)
+SNAPSHOT_DIR = "snapshot"
+SNAPSHOT_FORMAT = "parquet"        # "parquet" or "csv"
+SNAPSHOT_COMPRESSION = "zstd"      # Parquet codec
+
+# Analytics Query Settings (src/sql_queries.py)
+QUERY_WORKERS = 4                  # Queries run concurrently, each on its own pooled connection (<= DB_POOL_MAX_CONNECTIONS)
+QUERY_TIMEOUT_SECONDS = 120        # Per-query statement_timeout
+QUERY_USE_ROLLUPS = True           # Serve aggregates from the rollup tables refreshed by each load
+QUERY_CACHE_DIR = ".query_cache"   # Results reused until the next load/retention commit; None disables the cache
+QUERY_CACHE_TTL_SECONDS = 86400    # Upper bound on the age of any cached result
+QUERY_CACHE_RELATIVE_TTL_SECONDS = 300  # For queries relative to NOW() (expired_active, expiring_indicators)
+EXPORT_ITERSIZE = 10000            # Rows per server-side cursor round trip for JSONL/blocklist exports
+
+# IoC Lookup Settings (src/lookup.py)
+LOOKUP_HOST = "127.0.0.1"          # HTTP endpoint bind address
+LOOKUP_PORT = 8088
+LOOKUP_REFRESH_SECONDS = 300       # How often the HTTP service picks up newly loaded pulses
+LOOKUP_FETCH_SIZE = 50000          # Indicator rows per round trip when building the index
+LOOKUP_BLOOM_ERROR_RATE = None     # e.g. 0.001 to front batch lookups with a Bloom filter
+
+# Instrumentation Settings (src/metrics.py)
+METRICS_REPORT_PATH = "run_report.json"  # JSON report of per-stage timings, memory and row counts
+METRICS_PROMETHEUS_PATH = None     # e.g. "/var/lib/node_exporter/textfile/threat_intel.prom"
+METRICS_PROMETHEUS_PREFIX = "threat_intel_etl"
+METRICS_TRACEMALLOC = False        # Also record the run's Python heap peak (slows the run)
@@ -0,0 +1,90 @@
+# src/db.py
+import json
+import threading
+from contextlib import contextmanager
+import psycopg2
+from psycopg2.pool import ThreadedConnectionPool
+from src.config import DB_CONFIG, DB_POOL_MAX_CONNECTIONS
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Return the process-wide connection pool, creating it on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool.closed:
+            _pool = ThreadedConnectionPool(1, DB_POOL_MAX_CONNECTIONS, **DB_CONFIG)
+        return _pool
+
+
+def close_pool():
+    """Close every pooled connection."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None and not _pool.closed:
+            _pool.closeall()
+        _pool = None
+
+
+@contextmanager
+def pooled_connection():
+    """
+    Borrow a connection from the pool and return it afterwards.
+    Any open transaction is rolled back on return; connections that broke are discarded.
+    """
+    pool = get_pool()
+    conn = pool.getconn()
+    try:
+        yield conn
+    finally:
+        broken = bool(conn.closed)
+        if not broken:
+            try:
+                conn.rollback()
+                conn.autocommit = False  # e.g. after a VACUUM
+            except Exception:
+                broken = True
+        pool.putconn(conn, close=broken)
+
+
+@contextmanager
+def advisory_lock(key):
+    """
+    Hold a session-level Postgres advisory lock for the duration of the block, on a
+    dedicated connection so the lock lives exactly as long as the block.
+    Yields:
+        bool: True if the lock was acquired, False if another session holds it.
+    """
+    conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        conn.autocommit = True
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT pg_try_advisory_lock(%s)", (key,))
+            acquired = cursor.fetchone()[0]
+        yield acquired
+    finally:
+        conn.close()  # Releases the lock
+
+
+def record_etl_run(cursor, kind, stats=None):
+    """
+    Record a write to the pulse/indicator tables in `etl_runs` and bump the data version,
+    inside the caller's transaction. The counter row stays locked until the write commits,
+    so concurrent writers take versions in commit order. Returns the new version.
+    """
+    cursor.execute("UPDATE data_version SET version = version + 1 RETURNING version")
+    version = cursor.fetchone()[0]
+    cursor.execute("INSERT INTO etl_runs (kind, stats, data_version) VALUES (%s, %s, %s)",
+                   (kind, json.dumps(stats) if stats is not None else None, version))
+    return version
+
+
+def data_version(cursor):
+    """
+    (epoch, version) of the committed data. The version counts committed writes; the epoch
+    changes when the database is recreated, so versions of an earlier database never match.
+    """
+    cursor.execute("SELECT epoch, version FROM data_version")
+    return tuple(cursor.fetchone())
@@ -1,18 +1,257 @@
 # src/extract.py
-from OTXv2 import OTXv2
-from src.config import OTX_API_KEY
+import math
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import requests
+from requests.adapters import HTTPAdapter
+from src.db import pooled_connection
+from src.config import (
+    OTX_API_KEY, OTX_PAGE_SIZE, OTX_SERVER, OTX_FETCH_WORKERS, OTX_REQUESTS_PER_SECOND,
+    OTX_MAX_RETRIES, OTX_REQUEST_TIMEOUT
+)
 
-def extract_otx_pulses():
+SUBSCRIBED_PATH = "/api/v1/pulses/subscribed"
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+_otx_session = None
+_otx_session_workers = 0
+_otx_session_lock = threading.Lock()
+
+class TokenBucket:
+    """
+    Thread-safe token bucket shared by the page fetchers to stay inside the OTX quota.
+    The refill rate adapts: it is halved whenever OTX throttles us and creeps back up
+    towards the configured rate after each successful request.
+    """
+    def __init__(self, rate, capacity=None):
+        self.max_rate = rate
+        self.rate = rate
+        self.capacity = capacity or max(1, int(rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a request token is available."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def slow_down(self):
+        with self.lock:
+            self.rate = max(self.max_rate / 16, self.rate / 2)
+
+    def speed_up(self):
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate * 1.1)
+
+def get_last_modified():
+    """
+    Return the high-water mark for incremental extraction: the newest `pulses.modified`
+    already loaded into Postgres, or None if the table is empty or unreachable.
+    A checkpoint held back by hold_extract_checkpoint takes precedence.
+    """
+    try:
+        with pooled_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT modified_since FROM extract_checkpoint")
+                held = cursor.fetchone()
+                if held:
+                    return held[0]
+                cursor.execute("SELECT MAX(modified) FROM pulses")
+                return cursor.fetchone()[0]
+    except Exception as e:
+        print(f"Could not read last modified checkpoint: {e}")
+        return None
+
+def hold_extract_checkpoint(modified_since):
+    """
+    Keep the next incremental extracts at `modified_since` (None: a full fetch) until
+    release_extract_checkpoint. Used when an extract was only partly loaded: the committed
+    part may hold newer pulses than the lost part, so MAX(pulses.modified) would skip it.
+    """
+    try:
+        with pooled_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    INSERT INTO extract_checkpoint (modified_since) VALUES (%s)
+                    ON CONFLICT (id) DO UPDATE SET modified_since = CASE
+                        WHEN extract_checkpoint.modified_since IS NULL OR EXCLUDED.modified_since IS NULL THEN NULL
+                        ELSE LEAST(extract_checkpoint.modified_since, EXCLUDED.modified_since)
+                    END
+                """, (modified_since,))
+            conn.commit()
+        print(f"Next extract will restart from {modified_since.isoformat() if modified_since else 'a full fetch'}")
+    except Exception as e:
+        print(f"Could not hold the extract checkpoint: {e}")
+
+def release_extract_checkpoint():
+    """Drop a held checkpoint once an extract starting from it has been loaded completely."""
+    try:
+        with pooled_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("DELETE FROM extract_checkpoint")
+            conn.commit()
+    except Exception as e:
+        print(f"Could not release the extract checkpoint: {e}")
+
+def latest_modified(pulses):
+    """Newest `modified` timestamp among fetched pulses, or None; the next incremental fetch starts here."""
+    stamps = [pulse["modified"] for pulse in pulses if pulse.get("modified")]
+    return datetime.fromisoformat(max(stamps)) if stamps else None
+
+def _get_otx_session(workers):
+    """
+    Shared HTTP session for the OTX API, kept across runs so a long-running process reuses
+    its keep-alive connections. Re-created if more concurrent workers are requested.
+    """
+    global _otx_session, _otx_session_workers
+    with _otx_session_lock:
+        if _otx_session is None or _otx_session_workers < workers:
+            session = requests.Session()
+            session.headers.update({"X-OTX-API-KEY": OTX_API_KEY, "User-Agent": "Threat-Intel-ETL"})
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            if _otx_session is not None:
+                _otx_session.close()
+            _otx_session = session
+            _otx_session_workers = workers
+        return _otx_session
+
+def _fetch_page(session, limiter, params, max_retries=OTX_MAX_RETRIES):
+    """
+    GET one page of subscribed pulses, retrying HTTP 429/5xx and connection errors
+    with exponential backoff (honouring Retry-After when OTX sends it).
+    """
+    url = OTX_SERVER.rstrip("/") + SUBSCRIBED_PATH
+    for attempt in range(max_retries + 1):
+        limiter.acquire()
+        try:
+            response = session.get(url, params=params, timeout=OTX_REQUEST_TIMEOUT)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if attempt == max_retries:
+                raise
+            error = e
+            retry_after = None
+        else:
+            if response.status_code not in RETRY_STATUS_CODES:
+                response.raise_for_status()
+                limiter.speed_up()
+                return response.json()
+            if attempt == max_retries:
+                response.raise_for_status()
+            error = f"HTTP {response.status_code}"
+            retry_after = response.headers.get("Retry-After")
+            limiter.slow_down()
+        delay = float(retry_after) if retry_after and retry_after.isdigit() else 2 ** attempt + random.random()
+        print(f"Page {params.get('page')} failed ({error}); retrying in {delay:.1f}s")
+        time.sleep(delay)
+
+def _fetch_pages_parallel(modified_since, workers, page_size):
+    """
+    Fetch all pages of subscribed pulses concurrently. The first page is fetched alone to
+    learn the total count; the remaining pages are spread over a thread pool sharing one
+    pooled HTTP session and rate limiter. Pulses are returned in page order.
+    """
+    session = _get_otx_session(workers)
+    limiter = TokenBucket(OTX_REQUESTS_PER_SECOND)
+
+    params = {"limit": page_size}
+    if modified_since:
+        params["modified_since"] = modified_since.isoformat()
+    first = _fetch_page(session, limiter, {**params, "page": 1})
+    page_count = math.ceil(first.get("count", 0) / page_size)
+    print(f"Fetching {page_count} pages with {workers} workers...")
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pages = pool.map(lambda page: _fetch_page(session, limiter, {**params, "page": page}),
+                         range(2, page_count + 1))
+        pulses = list(first["results"])
+        for data in pages:
+            pulses.extend(data["results"])
+    return pulses
+
+def extract_otx_pulses(full=False, workers=OTX_FETCH_WORKERS, modified_since=None):
+    """
+    Fetch subscribed OTX pulses.
+    Args:
+        full (bool): Force a complete resync instead of fetching only pulses modified
+            since the last successful load.
+        workers (int): Concurrent page fetchers; 1 walks the pages serially through the OTX SDK.
+        modified_since (datetime): Checkpoint to fetch from instead of the newest loaded pulse,
+            e.g. when the previous batch has been fetched but not loaded yet.
+    Returns:
+        list: Pulse dictionaries, or an empty list on error.
+    """
     print("Fetching OTX pulses...")
     try:
-        otx = OTXv2(OTX_API_KEY)
-        # Get all subscribed pulses
-        pulses = otx.getall()  # Fetches all pulses you’re subscribed to
+        if full:
+            modified_since = None
+        elif modified_since is None:
+            modified_since = get_last_modified()
+        if modified_since:
+            print(f"Incremental fetch of pulses modified since {modified_since.isoformat()}")
+        else:
+            print("Full fetch of all subscribed pulses")
+        # Get subscribed pulses, limited to recent changes when a checkpoint exists
+        if workers > 1:
+            pulses = _fetch_pages_parallel(modified_since, workers, OTX_PAGE_SIZE)
+        else:
+            from OTXv2 import OTXv2
+            otx = OTXv2(OTX_API_KEY, server=OTX_SERVER)
+            pulses = otx.getall(modified_since=modified_since)
         if not pulses:
-            print("No pulses fetched. Check subscriptions or API key.")
+            if modified_since:
+                print("No pulses modified since the last load.")
+            else:
+                print("No pulses fetched. Check subscriptions or API key.")
             return []
         print(f"Fetched {len(pulses)} pulses.")
         return pulses
     except Exception as e:
         print(f"Error fetching OTX data: {e}")
         return []
+
+def iter_otx_pulse_pages(full=False, page_size=OTX_PAGE_SIZE, modified_since=None):
+    """
+    Stream subscribed OTX pulses one API page at a time instead of building the full list.
+    Args:
+        full (bool): Force a complete resync instead of an incremental fetch.
+        page_size (int): Pulses requested per API page.
+        modified_since (datetime): Checkpoint to fetch from instead of get_last_modified().
+    Yields:
+        list: A page of pulse dictionaries.
+    """
+    from OTXv2 import OTXv2
+    print("Streaming OTX pulses...")
+    otx = OTXv2(OTX_API_KEY, server=OTX_SERVER)
+    if full:
+        modified_since = None
+    elif modified_since is None:
+        modified_since = get_last_modified()
+    if modified_since:
+        print(f"Incremental fetch of pulses modified since {modified_since.isoformat()}")
+    else:
+        print("Full fetch of all subscribed pulses")
+    page = []
+    fetched = 0
+    for pulse in otx.getall(modified_since=modified_since, limit=page_size, iter=True):
+        page.append(pulse)
+        if len(page) >= page_size:
+            fetched += len(page)
+            yield page
+            page = []
+    if page:
+        fetched += len(page)
+        yield page
+    print(f"Fetched {fetched} pulses.")
@@ -1,65 +1,477 @@
 # src/load.py
-import psycopg2
-from src.config import DB_CONFIG
+import io
+import json
+import os
+import shutil
+import uuid
+from datetime import datetime
+from src.db import pooled_connection, record_etl_run
+from src.config import (
+    LOAD_BATCH_SIZE, LOAD_SKIP_UNCHANGED, STORAGE_MODE, LOAD_CHUNK_SIZE, LOAD_SPOOL_DIR
+)
+from src.transform import PULSE_COLUMNS, INDICATOR_COLUMNS, OBSERVABLE_COLUMNS, LINK_COLUMNS
+from src.rollups import refresh_rollups
+from src.storage import delete_orphaned_observables
 
-def load_to_postgres(pulses_df, indicators_df):
-    conn = None
-    cursor = None
+# Marker written for missing values so empty strings survive COPY as '' rather than NULL
+COPY_NULL = "\\N"
+
+
+def _column_list(columns, prefix=""):
+    return ", ".join(f'{prefix}"{c}"' for c in columns)
+
+
+def _create_staging_table(cursor, table):
+    """Create a session-local copy of `table` that is dropped when the transaction commits."""
+    stage = f"{table}_stage"
+    cursor.execute(f"CREATE TEMP TABLE {stage} (LIKE {table} INCLUDING DEFAULTS) ON COMMIT DROP")
+    return stage
+
+
+def _copy_frame(cursor, df, stage, columns, batch_size):
+    """Stream a DataFrame into a staging table with COPY FROM STDIN, `batch_size` rows at a time."""
+    sql = f"COPY {stage} ({_column_list(columns)}) FROM STDIN WITH (FORMAT csv, NULL '{COPY_NULL}')"
+    for start in range(0, len(df), batch_size):
+        buffer = io.StringIO()
+        df.iloc[start:start + batch_size][columns].to_csv(buffer, index=False, header=False, na_rep=COPY_NULL)
+        buffer.seek(0)
+        cursor.copy_expert(sql, buffer)
+
+
+def _count(cursor, table):
+    cursor.execute(f"SELECT COUNT(*) FROM {table}")
+    return cursor.fetchone()[0]
+
+
+def _merge_from_staging(cursor, table, stage, columns, key="id"):
+    """
+    Upsert staged rows into `table` with a single set-based INSERT ... ON CONFLICT.
+    Rows identical to the stored version are left untouched, so they create no dead
+    tuples or WAL. Returns (inserted, updated).
+    """
+    values = [c for c in columns if c != key]
+    updates = ",\n            ".join(f'"{c}" = EXCLUDED."{c}"' for c in values)
+    cursor.execute(f"""
+        WITH merged AS (
+            INSERT INTO {table} ({_column_list(columns)})
+            SELECT DISTINCT ON ({key}) {_column_list(columns)} FROM {stage}
+            ON CONFLICT ({key}) DO UPDATE SET
+            {updates}
+            WHERE ({_column_list(values, f"{table}.")}) IS DISTINCT FROM ({_column_list(values, "EXCLUDED.")})
+            RETURNING (xmax = 0) AS inserted
+        )
+        SELECT COUNT(*) FILTER (WHERE inserted), COUNT(*) FILTER (WHERE NOT inserted) FROM merged
+    """)
+    return cursor.fetchone()
+
+
+def _prune_unchanged_pulses(cursor, pulses_stage, indicators_stage):
+    """
+    Drop staged pulses whose revision and modified timestamp match the stored pulse,
+    along with their indicators, so unchanged pulses are skipped entirely.
+    """
+    cursor.execute(f"""
+        DELETE FROM {pulses_stage} s USING pulses p
+        WHERE p.id = s.id
+          AND p.revision IS NOT DISTINCT FROM s.revision
+          AND p.modified IS NOT DISTINCT FROM s.modified
+    """)
+    _prune_orphaned_indicators(cursor, pulses_stage, indicators_stage)
+
+
+def _prune_stale_pulses(cursor, pulses_stage, indicators_stage):
+    """
+    Drop staged pulses that are older than the stored pulse (earlier modified timestamp, or
+    the same one with a lower revision), along with their indicators, so replaying an old
+    extract never overwrites a newer revision loaded since. Returns the number dropped.
+    """
+    cursor.execute(f"""
+        DELETE FROM {pulses_stage} s USING pulses p
+        WHERE p.id = s.id
+          AND (p.modified > s.modified OR (p.modified = s.modified AND p.revision > s.revision))
+    """)
+    stale = cursor.rowcount
+    _prune_orphaned_indicators(cursor, pulses_stage, indicators_stage)
+    return stale
+
+
+def _prune_orphaned_indicators(cursor, pulses_stage, indicators_stage):
+    """Drop staged indicators whose pulse is no longer staged."""
+    cursor.execute(f"""
+        DELETE FROM {indicators_stage} st
+        WHERE NOT EXISTS (SELECT 1 FROM {pulses_stage} s WHERE s.id = st.pulse_id)
+    """)
+
+
+def _delete_vanished_indicators(cursor, pulses_stage, indicators_stage, table="indicators", key="id"):
+    """Delete stored indicators of the staged (new or revised) pulses that are no longer in those pulses."""
+    cursor.execute(f"""
+        DELETE FROM {table} i USING {pulses_stage} s
+        WHERE i.pulse_id = s.id
+          AND NOT EXISTS (SELECT 1 FROM {indicators_stage} st WHERE st.{key} = i.{key})
+    """)
+    return cursor.rowcount
+
+
+def _new_stats(storage_mode="wide"):
+    stats = {
+        "pulses": {"inserted": 0, "updated": 0, "unchanged": 0},
+        "indicators": {"inserted": 0, "updated": 0, "unchanged": 0, "deleted": 0},
+    }
+    if storage_mode == "normalized":
+        stats["observables"] = {"inserted": 0, "updated": 0, "unchanged": 0, "deleted": 0}
+    return stats
+
+
+def _add_stats(total, stats):
+    for table, counts in stats.items():
+        for key, value in counts.items():
+            total[table][key] += value
+    return total
+
+
+def _changed_rows(stats):
+    return sum(count for counts in stats.values() for key, count in counts.items() if key != "unchanged")
+
+
+def _format_stats(stats):
+    return "; ".join(
+        f"{table}: " + ", ".join(f"{value} {key}" for key, value in counts.items())
+        for table, counts in stats.items()
+    )
+
+
+def _record_load(cursor, pulses_stage, stats):
+    """
+    Record a load in etl_runs with the ids of the pulses left in staging (new or revised), so the
+    lookup index can re-read exactly those pulses whatever their modified timestamp.
+    """
+    cursor.execute(f"SELECT id FROM {pulses_stage}")
+    record_etl_run(cursor, "load", {**stats, "pulse_ids": [row[0] for row in cursor.fetchall()]})
+
+
+def _load_frames(cursor, pulses_df, indicators_df, batch_size, skip_unchanged=LOAD_SKIP_UNCHANGED,
+                 skip_stale=False):
+    """
+    Stage and merge one pair of frames on an open cursor, writing only new or changed rows.
+    With skip_stale, pulses older than the stored version are left alone (counted as unchanged).
+    Returns a stats dict of inserted/updated/unchanged(/deleted) counts per table.
+    """
+    stats = _new_stats()
+    pulses_stage = _create_staging_table(cursor, "pulses")
+    _copy_frame(cursor, pulses_df, pulses_stage, PULSE_COLUMNS, batch_size)
+    indicators_stage = _create_staging_table(cursor, "indicators")
+    _copy_frame(cursor, indicators_df, indicators_stage, INDICATOR_COLUMNS, batch_size)
+    staged_pulses = _count(cursor, pulses_stage)
+    staged_indicators = _count(cursor, indicators_stage)
+
+    if skip_unchanged:
+        _prune_unchanged_pulses(cursor, pulses_stage, indicators_stage)
+    if skip_stale:
+        stale = _prune_stale_pulses(cursor, pulses_stage, indicators_stage)
+        if stale:
+            print(f"Skipped {stale} pulses already stored at a newer revision")
+
+    # Merge pulses first so the indicators' foreign keys resolve
+    inserted, updated = _merge_from_staging(cursor, "pulses", pulses_stage, PULSE_COLUMNS)
+    stats["pulses"].update(inserted=inserted, updated=updated, unchanged=staged_pulses - inserted - updated)
+
+    stats["indicators"]["deleted"] = _delete_vanished_indicators(cursor, pulses_stage, indicators_stage)
+    inserted, updated = _merge_from_staging(cursor, "indicators", indicators_stage, INDICATOR_COLUMNS)
+    stats["indicators"].update(inserted=inserted, updated=updated,
+                               unchanged=staged_indicators - inserted - updated)
+
+    # Only the pulses left in staging (new or revised) need their rollups recomputed
+    refresh_rollups(cursor, f"SELECT id FROM {pulses_stage}", "wide")
+
+    # Bump the data version in the same transaction, so cached query results go stale exactly when it commits
+    if _changed_rows(stats):
+        _record_load(cursor, pulses_stage, stats)
+    return stats
+
+
+def _load_normalized_frames(cursor, pulses_df, observables_df, links_df, batch_size,
+                            skip_unchanged=LOAD_SKIP_UNCHANGED):
+    """
+    Normalized-mode counterpart of _load_frames: merges pulses, then the unique observables,
+    then the pulse <-> observable links. Link counts are reported under "indicators".
+    """
+    stats = _new_stats("normalized")
+    pulses_stage = _create_staging_table(cursor, "pulses")
+    _copy_frame(cursor, pulses_df, pulses_stage, PULSE_COLUMNS, batch_size)
+    links_stage = _create_staging_table(cursor, "pulse_observables")
+    _copy_frame(cursor, links_df, links_stage, LINK_COLUMNS, batch_size)
+    staged_pulses = _count(cursor, pulses_stage)
+    staged_links = _count(cursor, links_stage)
+
+    if skip_unchanged:
+        _prune_unchanged_pulses(cursor, pulses_stage, links_stage)
+
+    inserted, updated = _merge_from_staging(cursor, "pulses", pulses_stage, PULSE_COLUMNS)
+    stats["pulses"].update(inserted=inserted, updated=updated, unchanged=staged_pulses - inserted - updated)
+
+    # Only observables still referenced by a staged link are written
+    observables_stage = _create_staging_table(cursor, "observables")
+    _copy_frame(cursor, observables_df, observables_stage, OBSERVABLE_COLUMNS, batch_size)
+    staged_observables = _count(cursor, observables_stage)
+    cursor.execute(f"""
+        DELETE FROM {observables_stage} o
+        WHERE NOT EXISTS (SELECT 1 FROM {links_stage} l WHERE l.observable_id = o.id)
+    """)
+    inserted, updated = _merge_from_staging(cursor, "observables", observables_stage, OBSERVABLE_COLUMNS)
+    stats["observables"].update(inserted=inserted, updated=updated,
+                                unchanged=staged_observables - inserted - updated)
+
+    # Observables of the links about to be deleted or repointed may be left without any link
+    cursor.execute(f"""
+        CREATE TEMP TABLE unlinked_observables ON COMMIT DROP AS
+        SELECT l.observable_id FROM pulse_observables l JOIN {pulses_stage} s ON s.id = l.pulse_id
+        UNION
+        SELECT l.observable_id FROM pulse_observables l JOIN {links_stage} st ON st.indicator_id = l.indicator_id
+    """)
+    stats["indicators"]["deleted"] = _delete_vanished_indicators(
+        cursor, pulses_stage, links_stage, table="pulse_observables", key="indicator_id")
+    inserted, updated = _merge_from_staging(cursor, "pulse_observables", links_stage, LINK_COLUMNS,
+                                            key="indicator_id")
+    stats["indicators"].update(inserted=inserted, updated=updated,
+                               unchanged=staged_links - inserted - updated)
+    stats["observables"]["deleted"] = delete_orphaned_observables(
+        cursor, "SELECT observable_id FROM unlinked_observables")
+
+    refresh_rollups(cursor, f"SELECT id FROM {pulses_stage}", "normalized")
+    if _changed_rows(stats):
+        _record_load(cursor, pulses_stage, stats)
+    return stats
+
+
+def load_to_postgres(pulses_df, indicators_df, batch_size=LOAD_BATCH_SIZE, skip_unchanged=LOAD_SKIP_UNCHANGED):
+    """
+    Bulk load pulses and indicators into PostgreSQL.
+    Both frames are streamed into temporary staging tables with COPY and merged into
+    `pulses`/`indicators` in one transaction, so a failure leaves the database untouched.
+    Only new or changed rows are written, indicators that vanished from a revised
+    pulse are deleted, and the rollup tables are refreshed for the pulses that changed.
+    Args:
+        pulses_df (DataFrame): Pulse rows from transform_pulses.
+        indicators_df (DataFrame): Indicator rows from transform_pulses.
+        batch_size (int): Rows per COPY batch, bounding the size of the in-memory CSV buffer.
+        skip_unchanged (bool): Skip pulses whose revision and modified timestamp are unchanged.
+    Returns:
+        dict: Inserted/updated/unchanged/deleted counts per table, or None if the load failed.
+    """
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        cursor = conn.cursor()
+        with pooled_connection() as conn:  # Rolled back on return if the commit was not reached
+            with conn.cursor() as cursor:
+                stats = _load_frames(cursor, pulses_df, indicators_df, batch_size, skip_unchanged)
+            conn.commit()
+        print(f"Data loaded into database successfully! ({_format_stats(stats)})")
+        return stats
+    except Exception as e:
+        print(f"Error loading data: {e}")
+        return None
 
-        # Load pulses
-        for _, row in pulses_df.iterrows():
-            cursor.execute("""
-                INSERT INTO pulses (id, name, description, author_name, public, revision, adversary, industries, tlp, tags, created, modified, "references", targeted_countries)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                ON CONFLICT (id) DO UPDATE SET
-                    name = EXCLUDED.name,
-                    description = EXCLUDED.description,
-                    author_name = EXCLUDED.author_name,
-                    public = EXCLUDED.public,
-                    revision = EXCLUDED.revision,
-                    adversary = EXCLUDED.adversary,
-                    industries = EXCLUDED.industries,
-                    tlp = EXCLUDED.tlp,
-                    tags = EXCLUDED.tags,
-                    created = EXCLUDED.created,
-                    modified = EXCLUDED.modified,
-                    "references" = EXCLUDED."references",
-                    targeted_countries = EXCLUDED.targeted_countries
-            """, tuple(row))
-
-        # Load indicators
-        for _, row in indicators_df.iterrows():
-            cursor.execute("""
-                INSERT INTO indicators (id, pulse_id, indicator, type, title, description, access_reason, created, is_active, access_type, content, role, expiration, access_groups, observations)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                ON CONFLICT (id) DO UPDATE SET
-                    pulse_id = EXCLUDED.pulse_id,
-                    indicator = EXCLUDED.indicator,
-                    type = EXCLUDED.type,
-                    title = EXCLUDED.title,
-                    description = EXCLUDED.description,
-                    access_reason = EXCLUDED.access_reason,
-                    created = EXCLUDED.created,
-                    is_active = EXCLUDED.is_active,
-                    access_type = EXCLUDED.access_type,
-                    content = EXCLUDED.content,
-                    role = EXCLUDED.role,
-                    expiration = EXCLUDED.expiration,
-                    access_groups = EXCLUDED.access_groups,
-                    observations = EXCLUDED.observations
-            """, tuple(row))
 
+def load_normalized(pulses_df, observables_df, links_df, batch_size=LOAD_BATCH_SIZE,
+                    skip_unchanged=LOAD_SKIP_UNCHANGED):
+    """
+    Bulk load the normalized layout (observables + pulse_observables) in one transaction.
+    Args:
+        pulses_df (DataFrame): Pulse rows from transform_pulses_normalized.
+        observables_df (DataFrame): Unique observables from transform_pulses_normalized.
+        links_df (DataFrame): Pulse <-> observable links from transform_pulses_normalized.
+        batch_size (int): Rows per COPY batch.
+        skip_unchanged (bool): Skip pulses whose revision and modified timestamp are unchanged.
+    Returns:
+        dict: Inserted/updated/unchanged/deleted counts per table, or None if the load failed.
+    """
+    try:
+        with pooled_connection() as conn:
+            with conn.cursor() as cursor:
+                stats = _load_normalized_frames(cursor, pulses_df, observables_df, links_df, batch_size,
+                                                skip_unchanged)
+            conn.commit()
+        print(f"Data loaded into database successfully! ({_format_stats(stats)})")
+        return stats
+    except Exception as e:
+        print(f"Error loading data: {e}")
+        return None
+
+
+def load_stream(chunks, batch_size=LOAD_BATCH_SIZE, skip_unchanged=LOAD_SKIP_UNCHANGED,
+                storage_mode=STORAGE_MODE):
+    """
+    Load a stream of (pulses_df, indicators_df) chunks, committing after each one.
+    Only one chunk is held in memory at a time. If a chunk fails it is rolled back and
+    the stream stops; chunks committed before it stay loaded and are safe to reload,
+    since every write is an upsert.
+    Args:
+        chunks (iterable): Iterable of (pulses_df, indicators_df) tuples, e.g. from iter_transform_chunks.
+        batch_size (int): Rows per COPY batch.
+        skip_unchanged (bool): Skip pulses whose revision and modified timestamp are unchanged.
+        storage_mode (str): "wide", or "normalized" for (pulses_df, observables_df, links_df) chunks.
+    Returns:
+        dict: Counts per table summed over the chunks, or None if the stream stopped early
+            (the chunks committed before the failure stay loaded).
+    """
+    load_frames = _load_normalized_frames if storage_mode == "normalized" else _load_frames
+    chunk_count = 0
+    total = _new_stats(storage_mode)
+    try:
+        with pooled_connection() as conn:
+            with conn.cursor() as cursor:
+                for frames in chunks:
+                    stats = load_frames(cursor, *frames, batch_size, skip_unchanged)
+                    conn.commit()
+                    chunk_count += 1
+                    _add_stats(total, stats)
+                    print(f"Committed chunk {chunk_count}: {_format_stats(stats)}")
+        print(f"Data loaded into database successfully! ({_format_stats(total)} in {chunk_count} chunks)")
+    except Exception as e:
+        print(f"Error loading data after {chunk_count} committed chunks ({_format_stats(total)}): {e}")
+        return None
+    return total
+
+
+def _chunk_bounds(pulses_df, indicators_df, chunk_size):
+    """
+    Split the frames into chunks of whole pulses holding about `chunk_size` indicators.
+    Pulses are ordered by (modified, id), so the same input always yields the same chunks and
+    committed chunks hold the oldest changes: the MAX(modified) checkpoint used by incremental
+    extraction never jumps past pulses of a chunk that has not been committed yet.
+    Returns:
+        tuple: (sorted pulses_df, sorted indicators_df, [(pulse_start, pulse_end, ind_start, ind_end), ...])
+    """
+    pulses_df = pulses_df.sort_values(["modified", "id"], kind="stable", ignore_index=True)
+    position = indicators_df["pulse_id"].map(dict(zip(pulses_df["id"], range(len(pulses_df)))))
+    indicators_df = (indicators_df.assign(_position=position).dropna(subset=["_position"])
+                     .sort_values(["_position", "id"], kind="stable", ignore_index=True)
+                     .drop(columns="_position"))
+    per_pulse = pulses_df["id"].map(indicators_df["pulse_id"].value_counts()).fillna(0).astype(int).tolist()
+
+    bounds = []
+    pulse_start = indicator_start = indicator_end = 0
+    for i, count in enumerate(per_pulse):
+        indicator_end += count
+        if indicator_end - indicator_start >= chunk_size or i == len(per_pulse) - 1:
+            bounds.append((pulse_start, i + 1, indicator_start, indicator_end))
+            pulse_start, indicator_start = i + 1, indicator_end
+    return pulses_df, indicators_df, bounds
+
+
+def _read_checkpoint(cursor, run_id=None):
+    """Checkpoint row of `run_id`, or of the newest unfinished run when run_id is None."""
+    columns = "run_id, spool_path, chunk_size, total_chunks, last_chunk, status, stats"
+    if run_id:
+        cursor.execute(f"SELECT {columns} FROM load_checkpoints WHERE run_id = %s", (run_id,))
+    else:
+        cursor.execute(f"SELECT {columns} FROM load_checkpoints WHERE status <> 'complete' "
+                       "ORDER BY started_at DESC LIMIT 1")
+    row = cursor.fetchone()
+    return dict(zip(columns.split(", "), row)) if row else None
+
+
+def start_resumable_load(pulses_df, indicators_df, chunk_size=LOAD_CHUNK_SIZE, spool_dir=LOAD_SPOOL_DIR):
+    """
+    Spool the transformed frames to disk and register a checkpoint for a chunked load.
+    Returns:
+        str: The run id to pass to resume_load.
+    """
+    from src.snapshot import write_snapshot
+    run_id = f"{datetime.now():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}"
+    spool_path = os.path.join(spool_dir, run_id)
+    write_snapshot(pulses_df, indicators_df, spool_path, "parquet")
+    _, _, bounds = _chunk_bounds(pulses_df, indicators_df, chunk_size)
+    with pooled_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                INSERT INTO load_checkpoints (run_id, spool_path, chunk_size, total_chunks, stats)
+                VALUES (%s, %s, %s, %s, %s)
+            """, (run_id, spool_path, chunk_size, len(bounds), json.dumps(_new_stats())))
         conn.commit()
-        print("Data loaded into database successfully!")
+    print(f"Started resumable load {run_id}: {len(bounds)} chunks of ~{chunk_size} indicators")
+    return run_id
+
+
+def resume_load(run_id=None, batch_size=LOAD_BATCH_SIZE, skip_unchanged=LOAD_SKIP_UNCHANGED):
+    """
+    Load the spooled frames of a resumable run, committing each chunk together with its
+    checkpoint so no transaction spans more than one chunk. Chunks up to the checkpoint are
+    skipped; re-running a chunk is harmless because every write is an upsert. Other loads may
+    have committed newer revisions of the spooled pulses since the run started, so pulses
+    older than the stored ones are skipped rather than written back. The spool is deleted
+    once the run completes.
+    Args:
+        run_id (str): Run to resume; None picks the newest unfinished run.
+        batch_size (int): Rows per COPY batch.
+        skip_unchanged (bool): Skip pulses whose revision and modified timestamp are unchanged.
+    Returns:
+        dict: Counts per table summed over every committed chunk of the run, or None if the
+            run could not be finished (its checkpoint is kept for the next attempt).
+    """
+    from src.snapshot import read_snapshot
+    checkpoint = None
+    try:
+        with pooled_connection() as conn:
+            with conn.cursor() as cursor:
+                checkpoint = _read_checkpoint(cursor, run_id)
+                if checkpoint is None:
+                    print("No unfinished resumable load to resume.")
+                    return None
+                run_id = checkpoint["run_id"]
+                if checkpoint["status"] == "complete":
+                    print(f"Load {run_id} already completed.")
+                    return checkpoint["stats"]
+                pulses_df, indicators_df = read_snapshot(checkpoint["spool_path"])
+                pulses_df, indicators_df, bounds = _chunk_bounds(pulses_df, indicators_df, checkpoint["chunk_size"])
+                total = _add_stats(_new_stats(), checkpoint["stats"])  # jsonb does not keep key order
+                first = checkpoint["last_chunk"] + 1
+                if first:
+                    print(f"Resuming load {run_id} at chunk {first + 1} of {len(bounds)}")
+                for chunk, (p_start, p_end, i_start, i_end) in enumerate(bounds[first:], start=first):
+                    stats = _load_frames(cursor, pulses_df.iloc[p_start:p_end], indicators_df.iloc[i_start:i_end],
+                                         batch_size, skip_unchanged, skip_stale=True)
+                    _add_stats(total, stats)
+                    cursor.execute("""
+                        UPDATE load_checkpoints SET last_chunk = %s, stats = %s, status = 'running', updated_at = NOW()
+                        WHERE run_id = %s
+                    """, (chunk, json.dumps(total), run_id))
+                    conn.commit()
+                    print(f"Committed chunk {chunk + 1}/{len(bounds)}: {_format_stats(stats)}")
+                cursor.execute("UPDATE load_checkpoints SET status = 'complete', updated_at = NOW() WHERE run_id = %s",
+                               (run_id,))
+                conn.commit()
+        shutil.rmtree(checkpoint["spool_path"], ignore_errors=True)
+        print(f"Data loaded into database successfully! ({_format_stats(total)})")
+        return total
     except Exception as e:
         print(f"Error loading data: {e}")
-        if conn:
-            conn.rollback()
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
+        if checkpoint:
+            _mark_failed(checkpoint["run_id"])
+            print(f"Committed chunks are kept; continue with: python main.py --resume {checkpoint['run_id']}")
+        return None
+
+
+def _mark_failed(run_id):
+    try:
+        with pooled_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("UPDATE load_checkpoints SET status = 'failed', updated_at = NOW() WHERE run_id = %s",
+                               (run_id,))
+            conn.commit()
+    except Exception as e:
+        print(f"Could not record the failed load: {e}")
+
+
+def load_resumable(pulses_df, indicators_df, chunk_size=LOAD_CHUNK_SIZE, batch_size=LOAD_BATCH_SIZE,
+                   skip_unchanged=LOAD_SKIP_UNCHANGED, spool_dir=LOAD_SPOOL_DIR):
+    """
+    Load pulses and indicators in independently committed chunks of whole pulses instead of
+    one transaction. A crash loses at most the chunk in flight; `python main.py --resume`
+    continues from the last checkpoint. Same arguments and return value as load_to_postgres.
+    """
+    try:
+        run_id = start_resumable_load(pulses_df, indicators_df, chunk_size, spool_dir)
+    except Exception as e:
+        print(f"Error starting resumable load: {e}")
+        return None
+    return resume_load(run_id, batch_size, skip_unchanged)
@@ -0,0 +1,427 @@
+# src/lookup.py
+# In-memory IoC index over the loaded indicators, for checking large batches of log
+# observables ("is this IP/domain/hash known?") without a SQL round trip per value.
+import argparse
+import ipaddress
+import json
+import gc
+import math
+import socket
+import sys
+import threading
+import time
+from hashlib import blake2b
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from src.config import (
+    STORAGE_MODE, LOOKUP_HOST, LOOKUP_PORT, LOOKUP_REFRESH_SECONDS, LOOKUP_FETCH_SIZE,
+    LOOKUP_BLOOM_ERROR_RATE
+)
+from src.db import close_pool, data_version, pooled_connection
+from src.storage import indicator_relation
+
+# Types whose values are matched case-insensitively (stored lower-cased)
+CASE_INSENSITIVE_TYPES = {"domain", "hostname", "email", "IPv6", "CVE", "JA3"}
+NETWORK_TYPES = {"CIDR"}
+
+
+def _case_insensitive(indicator_type):
+    return indicator_type in CASE_INSENSITIVE_TYPES or indicator_type.startswith("FileHash-")
+
+
+def _normalize(indicator_type, value):
+    value = value.strip()
+    return value.lower() if _case_insensitive(indicator_type) else value
+
+
+def _parse_ip(value):
+    """(version, integer) of an IP address, or None if `value` is not one (inet_pton is far cheaper than ipaddress)."""
+    if not value or not (value[0].isdigit() or ":" in value):
+        return None
+    for version, family in ((4, socket.AF_INET), (6, socket.AF_INET6)):
+        try:
+            return version, int.from_bytes(socket.inet_pton(family, value), "big")
+        except OSError:
+            continue
+    return None
+
+
+class BloomFilter:
+    """
+    Fixed-size Bloom filter using double hashing over a 128-bit blake2b digest.
+    No false negatives; false positives at roughly `error_rate` once `capacity` items are added.
+    """
+    def __init__(self, capacity, error_rate=0.001):
+        capacity = max(1, capacity)
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, value):
+        digest = blake2b(value.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, value):
+        for position in self._positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, value):
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+    def to_bytes(self):
+        """Serialized filter: size and hash count (two little-endian uint64) followed by the bit array."""
+        return self.size.to_bytes(8, "little") + self.hashes.to_bytes(8, "little") + bytes(self.bits)
+
+
+class IndicatorIndex:
+    """
+    Reference-counted index of indicator values, rebuilt per pulse.
+    Exact values are kept in one dict per indicator type; CIDR indicators are kept per
+    IP version and prefix length so an address is matched with one dict probe per prefix
+    length in use. Each pulse's entries are tracked, so a revised pulse replaces its old
+    values and a value shared by several pulses stays until the last one drops it.
+    """
+    def __init__(self, storage_mode=STORAGE_MODE, bloom_error_rate=LOOKUP_BLOOM_ERROR_RATE):
+        self.storage_mode = storage_mode
+        self.bloom_error_rate = bloom_error_rate
+        self.high_water = None          # Newest pulses.modified included in the index
+        self.data_version = None        # (epoch, version) of the data indexed
+        self.refreshed_at = None
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self.exact = {}                 # type -> {value: pulse count}
+        self.networks = {4: {}, 6: {}}  # IP version -> {prefix length: {network int: pulse count}}
+        self.pulse_entries = {}         # pulse id -> [(type, value), ...]
+        self.bloom = None
+
+    def __len__(self):
+        return sum(len(values) for values in self.exact.values())
+
+    # --- Maintenance -------------------------------------------------------------------
+
+    def _network_key(self, value):
+        network = ipaddress.ip_network(value, strict=False)
+        return network.version, network.prefixlen, int(network.network_address) >> (network.max_prefixlen - network.prefixlen)
+
+    def _add(self, indicator_type, value):
+        values = self.exact.setdefault(indicator_type, {})
+        values[value] = values.get(value, 0) + 1
+        if indicator_type in NETWORK_TYPES:
+            try:
+                version, prefix, key = self._network_key(value)
+            except ValueError:
+                return
+            networks = self.networks[version].setdefault(prefix, {})
+            networks[key] = networks.get(key, 0) + 1
+        if self.bloom is not None:
+            self.bloom.add(value)
+
+    def _remove(self, indicator_type, value):
+        values = self.exact.get(indicator_type, {})
+        if values.get(value, 0) <= 1:
+            values.pop(value, None)
+        else:
+            values[value] -= 1
+        if indicator_type in NETWORK_TYPES:
+            try:
+                version, prefix, key = self._network_key(value)
+            except ValueError:
+                return
+            networks = self.networks[version].get(prefix, {})
+            if networks.get(key, 0) <= 1:
+                networks.pop(key, None)
+                if not networks:
+                    self.networks[version].pop(prefix, None)
+            else:
+                networks[key] -= 1
+
+    def replace_pulses(self, pulse_entries, full=False):
+        """
+        Swap in the indicator entries of the given pulses.
+        Args:
+            pulse_entries (dict): pulse id -> list of (type, raw value) for every pulse that changed;
+                a pulse mapped to an empty list loses all its entries.
+            full (bool): Discard the whole index first (pulses absent from `pulse_entries` are dropped).
+        """
+        with self._lock:
+            if full:
+                self._reset()
+            for pulse_id, entries in pulse_entries.items():
+                for indicator_type, value in self.pulse_entries.pop(pulse_id, ()):
+                    self._remove(indicator_type, value)
+                normalized = [(indicator_type, _normalize(indicator_type, value)) for indicator_type, value in entries]
+                for indicator_type, value in normalized:
+                    self._add(indicator_type, value)
+                if normalized:
+                    self.pulse_entries[pulse_id] = normalized
+            if full and self.bloom_error_rate:
+                self.rebuild_bloom()
+            self.refreshed_at = time.time()
+
+    def rebuild_bloom(self, error_rate=None):
+        """(Re)build the Bloom filter over every indexed value. Removals only clear it on rebuild."""
+        with self._lock:
+            bloom = BloomFilter(len(self), error_rate or self.bloom_error_rate or 0.001)
+            for values in self.exact.values():
+                for value in values:
+                    bloom.add(value)
+            self.bloom = bloom
+            return bloom
+
+    # --- Loading -----------------------------------------------------------------------
+
+    def _changed_pulses(self, cursor, version):
+        """
+        Ids of the pulses that loads and retention runs committed since the last refresh wrote
+        to, or None if they are unknown (the runs predate per-pulse tracking, or the database
+        was recreated) and only a full refresh is safe.
+        """
+        if self.data_version is None or self.data_version[0] != version[0]:
+            return None
+        cursor.execute("SELECT stats->'pulse_ids' FROM etl_runs WHERE data_version > %s",
+                       (self.data_version[1],))
+        pulse_ids = set()
+        for (ids,) in cursor.fetchall():
+            if ids is None:
+                return None
+            pulse_ids.update(ids)
+        return pulse_ids
+
+    def refresh(self, full=False):
+        """
+        Read indicators from Postgres. The first call (or full=True) builds the whole index;
+        later calls only re-read the pulses that loads and retention runs recorded in etl_runs
+        since the last refresh (including replays of pulses older than the newest one), so
+        calling this after each load keeps the index current. Falls back to a full refresh
+        when the changes cannot be traced.
+        Returns:
+            int: Number of pulses (re)indexed.
+        """
+        full = full or self.data_version is None
+        relation = indicator_relation(self.storage_mode)
+        with pooled_connection() as conn:
+            with conn.cursor() as cursor:
+                # One snapshot for the high-water marks and the rows they cover
+                cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY")
+                cursor.execute("SELECT MAX(modified) FROM pulses")
+                high_water = cursor.fetchone()[0]
+                version = data_version(cursor)
+                changed = None if full else self._changed_pulses(cursor, version)
+                full = full or changed is None
+                if full:
+                    pulse_entries = {}
+                    sql, params = f"SELECT pulse_id, type, indicator FROM {relation}", None
+                else:
+                    pulse_entries = {pulse_id: [] for pulse_id in changed}
+                    if not pulse_entries:
+                        self.high_water, self.data_version = high_water, version
+                        return 0
+                    sql = f"SELECT pulse_id, type, indicator FROM {relation} WHERE pulse_id = ANY(%s)"
+                    params = (list(pulse_entries),)
+            # Server-side cursor so the full build never materializes the whole result set
+            with conn.cursor(name="lookup_index") as cursor:
+                cursor.itersize = LOOKUP_FETCH_SIZE
+                cursor.execute(sql, params)
+                for pulse_id, indicator_type, value in cursor:
+                    if value is not None:
+                        pulse_entries.setdefault(pulse_id, []).append((indicator_type, value))
+        self.replace_pulses(pulse_entries, full=full)
+        self.high_water, self.data_version = high_water, version
+        return len(pulse_entries)
+
+    def load_snapshot(self, path):
+        """Build the whole index from a snapshot written by src/snapshot.py instead of Postgres."""
+        from src.snapshot import read_snapshot
+        pulses_df, indicators_df = read_snapshot(path)
+        pulse_entries = {}
+        for pulse_id, indicator_type, value in zip(indicators_df["pulse_id"], indicators_df["type"],
+                                                   indicators_df["indicator"]):
+            if value is not None:
+                pulse_entries.setdefault(pulse_id, []).append((indicator_type, value))
+        self.replace_pulses(pulse_entries, full=True)
+        self.high_water = pulses_df["modified"].max() if len(pulses_df) else None
+        self.data_version = None
+
+    # --- Queries -----------------------------------------------------------------------
+
+    def lookup_many(self, observables):
+        """
+        Match a batch of observables against the index.
+        Exact values are matched with one set intersection per indicator type; IP
+        addresses are also checked against the indexed CIDR ranges.
+        Args:
+            observables (iterable): Raw observable strings (IPs, domains, hashes, URLs, ...).
+        Returns:
+            dict: observable -> list of matches ({"type", "indicator", "pulses"}), matched observables only.
+        """
+        raw = {observable.strip(): observable for observable in observables if observable}
+        results = {}
+        with self._lock:
+            candidates = set(raw)
+            if self.bloom is not None:
+                bloom = self.bloom
+                candidates = {value for value in candidates if value in bloom or value.lower() in bloom}
+            lowered = {}
+            for value in candidates:
+                lowered.setdefault(value.lower(), []).append(value)
+            lowered_keys = set(lowered)
+
+            # set.intersection(dict) walks the smaller side, so each type costs O(min(batch, type size))
+            for indicator_type, values in self.exact.items():
+                if _case_insensitive(indicator_type):
+                    hits = [(key, original) for key in lowered_keys.intersection(values) for original in lowered[key]]
+                else:
+                    hits = [(key, key) for key in candidates.intersection(values)]
+                for key, value in hits:
+                    results.setdefault(raw[value], []).append(
+                        {"type": indicator_type, "indicator": key, "pulses": values[key]})
+
+            if self.networks[4] or self.networks[6]:
+                for value, observable in raw.items():
+                    address = _parse_ip(value)
+                    if address is None:
+                        continue
+                    for match in self._match_networks(*address):
+                        results.setdefault(observable, []).append(match)
+        return results
+
+    def lookup(self, observable):
+        """Matches for a single observable (empty list if unknown)."""
+        return self.lookup_many([observable]).get(observable, [])
+
+    def _match_networks(self, version, number):
+        bits = 32 if version == 4 else 128
+        for prefix, networks in self.networks[version].items():
+            key = number >> (bits - prefix)
+            count = networks.get(key)
+            if count:
+                network = ipaddress.ip_network((key << (bits - prefix), prefix))
+                yield {"type": "CIDR", "indicator": str(network), "pulses": count}
+
+    def stats(self):
+        with self._lock:
+            return {
+                "values": len(self),
+                "pulses": len(self.pulse_entries),
+                "types": {indicator_type: len(values) for indicator_type, values in self.exact.items()},
+                "high_water": str(self.high_water) if self.high_water is not None else None,
+                "refreshed_at": self.refreshed_at,
+                "bloom_bytes": len(self.bloom.bits) if self.bloom is not None else None,
+            }
+
+
+def _make_handler(index):
+    class LookupHandler(BaseHTTPRequestHandler):
+        """GET /lookup?value=..&value=.., POST /lookup (JSON list or one value per line), GET /stats."""
+        def _send(self, status, payload):
+            body = json.dumps(payload, default=str).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path == "/lookup":
+                self._send(200, index.lookup_many(parse_qs(url.query).get("value", [])))
+            elif url.path == "/stats":
+                self._send(200, index.stats())
+            else:
+                self._send(404, {"error": "not found"})
+
+        def do_POST(self):
+            if urlparse(self.path).path != "/lookup":
+                self._send(404, {"error": "not found"})
+                return
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode()
+            try:
+                observables = json.loads(body) if body.lstrip().startswith("[") else body.splitlines()
+            except ValueError as e:
+                self._send(400, {"error": f"invalid JSON: {e}"})
+                return
+            self._send(200, index.lookup_many(observables))
+
+        def log_message(self, format, *args):
+            pass  # Batch clients would flood stdout
+
+    return LookupHandler
+
+
+def serve(index, host=LOOKUP_HOST, port=LOOKUP_PORT, refresh_seconds=LOOKUP_REFRESH_SECONDS):
+    """
+    Serve lookups over HTTP until interrupted, refreshing the index from Postgres every
+    `refresh_seconds` (0 disables) so pulses loaded since startup become visible.
+    """
+    stop = threading.Event()
+
+    def refresh_loop():
+        while not stop.wait(refresh_seconds):
+            try:
+                changed = index.refresh()
+                if changed:
+                    print(f"Lookup index refreshed: {changed} pulses re-indexed, {len(index)} values")
+            except Exception as e:
+                print(f"Error refreshing lookup index: {e}")
+
+    if refresh_seconds:
+        threading.Thread(target=refresh_loop, name="lookup-refresh", daemon=True).start()
+    server = ThreadingHTTPServer((host, port), _make_handler(index))
+    print(f"Serving IoC lookups on http://{host}:{port}/lookup")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        server.server_close()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Look up observables against the loaded threat intel indicators")
+    parser.add_argument("observables", nargs="*", help="Values to look up")
+    parser.add_argument("--file", help="Read observables from a file, one per line ('-' for stdin)")
+    parser.add_argument("--snapshot", metavar="DIR", help="Build the index from a snapshot instead of Postgres")
+    parser.add_argument("--serve", action="store_true", help="Run the HTTP lookup service")
+    parser.add_argument("--host", default=LOOKUP_HOST)
+    parser.add_argument("--port", type=int, default=LOOKUP_PORT)
+    parser.add_argument("--bloom-out", metavar="PATH", help="Write a Bloom filter of every indexed value to PATH")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    index = IndicatorIndex()
+    start = time.perf_counter()
+    if args.snapshot:
+        index.load_snapshot(args.snapshot)
+    else:
+        index.refresh(full=True)
+    print(f"Indexed {len(index)} values from {len(index.pulse_entries)} pulses in "
+          f"{time.perf_counter() - start:.2f}s", file=sys.stderr)
+    gc.freeze()  # The index is long-lived; keep it out of the collections triggered by each batch
+
+    if args.bloom_out:
+        with open(args.bloom_out, "wb") as f:
+            f.write(index.rebuild_bloom().to_bytes())
+        print(f"Bloom filter written to {args.bloom_out}", file=sys.stderr)
+
+    if args.serve:
+        serve(index, args.host, args.port, refresh_seconds=0 if args.snapshot else LOOKUP_REFRESH_SECONDS)
+    else:
+        observables = list(args.observables)
+        if args.file:
+            with (sys.stdin if args.file == "-" else open(args.file)) as f:
+                observables.extend(line.strip() for line in f)
+        start = time.perf_counter()
+        results = index.lookup_many(observables)
+        for observable, matches in results.items():
+            print(json.dumps({"observable": observable, "matches": matches}))
+        print(f"{len(results)} of {len(observables)} observables matched in "
+              f"{time.perf_counter() - start:.3f}s", file=sys.stderr)
+    close_pool()
@@ -0,0 +1,146 @@
+# src/metrics.py
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from src.config import METRICS_PROMETHEUS_PREFIX
+
+try:
+    import resource  # Not available on Windows
+except ImportError:
+    resource = None
+
+
+def _peak_rss_bytes():
+    """Peak resident set size of this process since it started, or None where unsupported."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024  # kilobytes on Linux
+
+
+def _current_rss_bytes():
+    """Current resident set size of this process (Linux only), or None."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class RunReport:
+    """
+    Collects wall time, CPU time, memory and row counts for each stage of one pipeline run.
+    Stages may be recorded from several threads. CPU time and memory are process-wide, so
+    stages that overlap (e.g. concurrent queries) each include the others' use. Memory peaks
+    cannot be attributed to a single stage, so they are reported for the run; each stage
+    records the resident set size when it ended.
+    """
+    def __init__(self):
+        self.started_at = datetime.now()
+        self.stages = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Time a block of work. Yields a dict the caller can fill with "rows" and any
+        extra "details"; it is appended to the report when the block exits.
+        """
+        record = {"stage": name, "rows": None}
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield record
+            record["status"] = "ok"
+        except BaseException:
+            record["status"] = "error"
+            raise
+        finally:
+            record["wall_seconds"] = round(time.perf_counter() - wall_start, 6)
+            record["cpu_seconds"] = round(time.process_time() - cpu_start, 6)
+            record["rss_bytes"] = _current_rss_bytes()
+            with self._lock:
+                self.stages.append(record)
+
+    def to_dict(self):
+        with self._lock:
+            stages = list(self.stages)
+        return {
+            "started_at": self.started_at.isoformat(),
+            "finished_at": datetime.now().isoformat(),
+            "total_wall_seconds": round((datetime.now() - self.started_at).total_seconds(), 6),
+            "peak_rss_bytes": _peak_rss_bytes(),
+            # Python heap peak since start_run, when tracing with --trace-memory
+            "tracemalloc_peak_bytes": tracemalloc.get_traced_memory()[1] if tracemalloc.is_tracing() else None,
+            "stages": stages,
+        }
+
+    def write_json(self, path):
+        """Write the run report as JSON."""
+        _atomic_write(path, json.dumps(self.to_dict(), indent=2, default=str))
+
+    def write_prometheus(self, path, prefix=METRICS_PROMETHEUS_PREFIX):
+        """Write the report in the Prometheus textfile-collector format."""
+        report = self.to_dict()
+        metrics = [
+            ("stage_wall_seconds", "Wall-clock time of the stage", "wall_seconds"),
+            ("stage_cpu_seconds", "Process CPU time during the stage", "cpu_seconds"),
+            ("stage_rows", "Rows processed by the stage", "rows"),
+            ("stage_rss_bytes", "Process RSS when the stage ended", "rss_bytes"),
+        ]
+        lines = []
+        for metric, help_text, key in metrics:
+            lines.append(f"# HELP {prefix}_{metric} {help_text}")
+            lines.append(f"# TYPE {prefix}_{metric} gauge")
+            for record in report["stages"]:
+                if record.get(key) is not None:
+                    lines.append(f'{prefix}_{metric}{{stage="{record["stage"]}"}} {record[key]}')
+        run_metrics = [
+            ("peak_rss_bytes", "Peak RSS of the process since it started", "peak_rss_bytes"),
+            ("tracemalloc_peak_bytes", "Python heap peak during the run", "tracemalloc_peak_bytes"),
+        ]
+        for metric, help_text, key in run_metrics:
+            if report[key] is not None:
+                lines.append(f"# HELP {prefix}_{metric} {help_text}")
+                lines.append(f"# TYPE {prefix}_{metric} gauge")
+                lines.append(f"{prefix}_{metric} {report[key]}")
+        lines.append(f"# HELP {prefix}_last_run_timestamp_seconds Unix time the last run finished")
+        lines.append(f"# TYPE {prefix}_last_run_timestamp_seconds gauge")
+        lines.append(f"{prefix}_last_run_timestamp_seconds {time.time():.0f}")
+        _atomic_write(path, "\n".join(lines) + "\n")
+
+
+def _atomic_write(path, text):
+    """Write via a temporary file so readers (e.g. node_exporter) never see a partial file."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+_report = RunReport()
+
+
+def start_run(trace_memory=False):
+    """Begin a new run report, optionally tracing Python allocations with tracemalloc."""
+    global _report
+    if trace_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    if tracemalloc.is_tracing():
+        tracemalloc.reset_peak()  # The run's heap peak starts here
+    _report = RunReport()
+    return _report
+
+
+def current_report():
+    return _report
+
+
+def stage(name):
+    """Time a stage of the current run: `with stage("load") as m: ...; m["rows"] = n`."""
+    return _report.stage(name)
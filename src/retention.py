@@ -0,0 +1,168 @@
+# src/retention.py
+# Moves stale indicators out of the hot table so scans and dashboard panels only touch live data.
+import argparse
+import os
+import time
+from src.db import pooled_connection, record_etl_run
+from src.config import (
+    STORAGE_MODE, RETENTION_INACTIVE_DAYS, RETENTION_BATCH_SIZE, RETENTION_ARCHIVE,
+    RETENTION_ARCHIVE_DIR, SNAPSHOT_COMPRESSION
+)
+from src.rollups import refresh_rollups
+from src.storage import delete_orphaned_observables
+from src.transform import INDICATOR_COLUMNS, LINK_COLUMNS
+
+# Hot table, key and archive table per storage mode
+RETENTION_TARGETS = {
+    "wide": {"table": "indicators", "key": "id", "columns": INDICATOR_COLUMNS, "archive": "indicators_archive"},
+    "normalized": {"table": "pulse_observables", "key": "indicator_id", "columns": LINK_COLUMNS,
+                   "archive": "pulse_observables_archive"},
+}
+
+# Parquet archives always use the indicators layout, so in normalized mode the IoC text is joined back in
+PARQUET_SELECT = {
+    "wide": "SELECT " + ", ".join(f'"{c}"' for c in INDICATOR_COLUMNS) + " FROM moved",
+    "normalized": """
+        SELECT m.indicator_id AS id, m.pulse_id, o.indicator, o.type, m.title, m.description,
+               m.access_reason, m.created, m.is_active, m.access_type, m.content, m.role,
+               m.expiration, m.access_groups, m.observations
+        FROM moved m LEFT JOIN observables o ON o.id = m.observable_id
+    """,
+}
+
+
+def _stale_condition(inactive_days):
+    """WHERE clause matching expired indicators and, if enabled, long-inactive ones."""
+    condition = "(expiration IS NOT NULL AND expiration < NOW())"
+    if inactive_days is not None:
+        condition += f" OR (NOT is_active AND created < NOW() - INTERVAL '{int(inactive_days)} days')"
+    return condition
+
+
+def count_stale(storage_mode=STORAGE_MODE, inactive_days=RETENTION_INACTIVE_DAYS):
+    """Number of indicators the retention job would archive now."""
+    target = RETENTION_TARGETS[storage_mode]
+    with pooled_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(f"SELECT COUNT(*) FROM {target['table']} WHERE {_stale_condition(inactive_days)}")
+            return cursor.fetchone()[0]
+
+
+def _move_batch(cursor, target, condition, batch_size, archive, storage_mode):
+    """
+    Delete one batch of stale rows and archive them in the same statement. In normalized mode
+    the observables left without any link are deleted too.
+    Returns:
+        tuple: (rows moved, ids of the affected pulses, rows to write to Parquet or None)
+    """
+    table, key = target["table"], target["key"]
+    moved = f"""
+        WITH doomed AS (
+            SELECT {key} FROM {table} WHERE {condition} LIMIT {int(batch_size)}
+        ), moved AS (
+            DELETE FROM {table} t USING doomed d WHERE t.{key} = d.{key} RETURNING t.*
+        )
+    """
+    if storage_mode == "normalized":
+        # The deletes above are not visible to this statement, so orphans are removed by the next one
+        cursor.execute("CREATE TEMP TABLE unlinked_observables (observable_id BIGINT) ON COMMIT DROP")
+        moved += ", unlinked AS (INSERT INTO unlinked_observables SELECT observable_id FROM moved)"
+    if archive == "parquet":
+        cursor.execute(moved + PARQUET_SELECT[storage_mode])
+        columns = [c.name for c in cursor.description]
+        rows = cursor.fetchall()
+        pulse_ids = sorted({row[columns.index("pulse_id")] for row in rows})
+        result = len(rows), pulse_ids, (columns, rows)
+    else:
+        archived = ""
+        if archive == "table":
+            column_list = ", ".join(f'"{c}"' for c in target["columns"])
+            archived = (f", archived AS (INSERT INTO {target['archive']} ({column_list}) "
+                        f"SELECT {column_list} FROM moved)")
+        cursor.execute(moved + archived + " SELECT pulse_id, COUNT(*) FROM moved GROUP BY pulse_id")
+        counts = cursor.fetchall()
+        result = sum(count for _, count in counts), [pulse_id for pulse_id, _ in counts], None
+    if storage_mode == "normalized" and result[0]:
+        delete_orphaned_observables(cursor, "SELECT observable_id FROM unlinked_observables")
+    return result
+
+
+def _write_parquet_part(columns, rows, directory, part):
+    """Write one batch of archived rows as a zstd-compressed Parquet file."""
+    import pandas as pd
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"indicators-{time.strftime('%Y%m%dT%H%M%S')}-{part:05d}.parquet")
+    pd.DataFrame(rows, columns=columns).to_parquet(path, compression=SNAPSHOT_COMPRESSION, index=False)
+    return path
+
+
+def run_retention(storage_mode=STORAGE_MODE, inactive_days=RETENTION_INACTIVE_DAYS,
+                  batch_size=RETENTION_BATCH_SIZE, archive=RETENTION_ARCHIVE, archive_dir=RETENTION_ARCHIVE_DIR,
+                  vacuum=True):
+    """
+    Move expired indicators, and inactive ones older than `inactive_days`, out of the hot table.
+    Each batch is deleted with DELETE ... RETURNING, archived, and has the rollups of its pulses
+    refreshed in one transaction, so an interrupted run leaves every committed batch consistent.
+    A pulse revised later in OTX may bring archived indicators back; the next run moves them again.
+    Args:
+        storage_mode (str): "wide" or "normalized"; selects the hot and archive tables.
+        inactive_days (int): Age after which inactive indicators are archived (None keeps them).
+        batch_size (int): Rows moved per transaction.
+        archive (str): "table", "parquet" (one file per batch in `archive_dir`) or "none" to only delete.
+        archive_dir (str): Directory for Parquet archives.
+        vacuum (bool): VACUUM ANALYZE the hot table afterwards so freed space is reused and plans stay fresh.
+    Returns:
+        dict: Rows archived, batches and affected pulses, or None on failure.
+    """
+    if archive not in ("table", "parquet", "none"):
+        raise ValueError(f"Unsupported retention archive: {archive}")
+    target = RETENTION_TARGETS[storage_mode]
+    condition = _stale_condition(inactive_days)
+    stats = {"archived": 0, "batches": 0, "pulses": 0, "archive": archive}
+    try:
+        with pooled_connection() as conn:
+            with conn.cursor() as cursor:
+                pulses = set()
+                while True:
+                    moved, pulse_ids, parquet_rows = _move_batch(cursor, target, condition, batch_size, archive,
+                                                                 storage_mode)
+                    if not moved:
+                        conn.rollback()
+                        break
+                    if parquet_rows:
+                        _write_parquet_part(*parquet_rows, archive_dir, stats["batches"])
+                    refresh_rollups(cursor, cursor.mogrify("SELECT unnest(%s::varchar[])", (pulse_ids,)).decode(),
+                                    storage_mode)
+                    # The pulse ids let the lookup index re-read just the pulses that lost indicators
+                    record_etl_run(cursor, "retention", {"archived": moved, "pulses": len(pulse_ids),
+                                                         "pulse_ids": pulse_ids})
+                    conn.commit()
+                    stats["archived"] += moved
+                    stats["batches"] += 1
+                    pulses.update(pulse_ids)
+                    print(f"Archived batch {stats['batches']}: {moved} indicators from {len(pulse_ids)} pulses")
+                    if moved < batch_size:
+                        break
+                stats["pulses"] = len(pulses)
+
+                if vacuum and stats["archived"]:
+                    conn.autocommit = True  # VACUUM cannot run inside a transaction
+                    cursor.execute(f"VACUUM ANALYZE {target['table']}")
+        print(f"Retention complete: {stats['archived']} indicators archived ({archive}) "
+              f"from {stats['pulses']} pulses in {stats['batches']} batches")
+        return stats
+    except Exception as e:
+        print(f"Error running retention after {stats['batches']} committed batches: {e}")
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Archive expired and long-inactive indicators")
+    parser.add_argument("--inactive-days", type=int, default=RETENTION_INACTIVE_DAYS)
+    parser.add_argument("--archive", choices=["table", "parquet", "none"], default=RETENTION_ARCHIVE)
+    parser.add_argument("--dry-run", action="store_true", help="Only count the indicators that would be archived")
+    args = parser.parse_args()
+    if args.dry_run:
+        print(f"{count_stale(inactive_days=args.inactive_days)} indicators would be archived")
+    else:
+        run_retention(inactive_days=args.inactive_days, archive=args.archive)
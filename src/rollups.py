@@ -0,0 +1,53 @@
+# src/rollups.py
+# Per-pulse summary tables kept up to date by the load step, so the dashboard and
+# run_all_queries aggregate a few rows per pulse instead of every indicator.
+from src.config import STORAGE_MODE
+from src.storage import indicator_relation
+
+# Rollup tables, all keyed by pulse_id
+ROLLUP_TABLES = ["rollup_pulses", "rollup_pulse_types", "rollup_pulse_facets"]
+
+# JSONB array columns on pulses that are exploded into rollup_pulse_facets
+FACETS = {"tag": "tags", "country": "targeted_countries", "industry": "industries"}
+
+REFRESH_SQL = [
+    """
+    INSERT INTO rollup_pulses (pulse_id, name, tlp, month, indicator_count, type_count)
+    SELECT p.id, p.name, p.tlp, DATE_TRUNC('month', p.created), COUNT(i.id), COUNT(DISTINCT i.type)
+    FROM pulses p LEFT JOIN {indicators} i ON i.pulse_id = p.id
+    WHERE p.id IN ({pulse_ids})
+    GROUP BY p.id
+    """,
+    """
+    INSERT INTO rollup_pulse_types (pulse_id, type, indicator_count)
+    SELECT pulse_id, type, COUNT(*)
+    FROM {indicators}
+    WHERE pulse_id IN ({pulse_ids})
+    GROUP BY pulse_id, type
+    """,
+] + [
+    f"""
+    INSERT INTO rollup_pulse_facets (pulse_id, facet, value, occurrences)
+    SELECT p.id, '{facet}', value, COUNT(*)
+    FROM pulses p, jsonb_array_elements_text(p.{column}) AS value
+    WHERE p.id IN ({{pulse_ids}})
+    GROUP BY p.id, value
+    """
+    for facet, column in FACETS.items()
+]
+
+
+def refresh_rollups(cursor, pulse_ids, storage_mode=STORAGE_MODE):
+    """
+    Recompute the rollup rows of the given pulses inside the caller's transaction.
+    Args:
+        cursor: Open cursor on the load transaction.
+        pulse_ids (str): SQL subquery selecting the ids of the pulses that changed,
+            e.g. "SELECT id FROM pulses_stage".
+        storage_mode (str): Storage mode whose indicator rows are counted.
+    """
+    indicators = indicator_relation(storage_mode)
+    for table in ROLLUP_TABLES:
+        cursor.execute(f"DELETE FROM {table} WHERE pulse_id IN ({pulse_ids})")
+    for sql in REFRESH_SQL:
+        cursor.execute(sql.format(pulse_ids=pulse_ids, indicators=indicators))
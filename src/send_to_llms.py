@@ -1,33 +1,199 @@
 # src/send_ti_llms.py
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 import requests
-from anthropic import Anthropic
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from datetime import datetime
-from src.config import GROK_API_KEY, CLAUDE_API_KEY
-from src.sql_queries import run_all_queries
+from src.config import (
+    GROK_API_KEY, CLAUDE_API_KEY, GROK_API_URL, CLAUDE_BASE_URL, LLM_TIMEOUT_SECONDS, LLM_MAX_RETRIES,
+    LLM_CACHE_DIR, LLM_CACHE_TTL_SECONDS
+)
+from src.sql_queries import QUERIES, run_all_queries
 
-def run_llm_pipeline():
-    print("Generating LLM Response Results")
-    # Run SQL queries
-    query_results = run_all_queries()
+# Results that move with the clock rather than with the loaded data; the cache key holds them
+# coarsened by _clock_buckets, so drift between runs reuses a response but real changes do not
+TIME_RELATIVE_QUERIES = {q["name"] for q in QUERIES if "cache_ttl" in q}
+# Temp files of writers that died before renaming them into place are removed after this long
+STALE_TMP_SECONDS = 3600
+
+# Clients are created once and reused by every call (and every thread)
+_clients_lock = threading.Lock()
+_grok_session = None
+_claude_client = None
 
-    # Check for database connection error
-    if "error" in query_results:
-        print(f"Database error: {query_results['error']}")
-        exit(1)
 
+class ResponseCache:
+    """
+    Content-addressed cache of LLM responses on disk.
+    Each response is stored in its own JSON file named by the SHA-256 of model + key
+    (see cache_key), and expires after `ttl` seconds.
+    """
+    def __init__(self, directory=LLM_CACHE_DIR, ttl=LLM_CACHE_TTL_SECONDS):
+        self.directory = directory
+        self.ttl = ttl
+
+    def _path(self, model, key):
+        digest = hashlib.sha256(f"{model}\0{key}".encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, f"{digest}.json")
+
+    def get(self, model, key):
+        """Return the cached response, or None if missing or expired."""
+        path = self._path(model, key)
+        try:
+            with open(path, encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if time.time() - entry["created"] > self.ttl:
+            self._remove(path)
+            return None
+        return entry["response"]
+
+    def put(self, model, key, response):
+        """Store a response atomically so concurrent runs never read a partial file."""
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"model": model, "created": time.time(), "response": response}, f)
+            os.replace(tmp_path, self._path(model, key))
+        except BaseException:
+            self._remove(tmp_path)
+            raise
+
+    def evict_expired(self):
+        """Delete every expired entry and orphaned temp file. Returns the number of files removed."""
+        if not os.path.isdir(self.directory):
+            return 0
+        removed = 0
+        now = time.time()
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                age = now - os.path.getmtime(path)
+            except OSError:
+                continue  # Renamed or removed by a concurrent run
+            if (name.endswith(".json") and age > self.ttl) or (name.endswith(".tmp") and age > STALE_TMP_SECONDS):
+                self._remove(path)
+                removed += 1
+        return removed
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _get_grok_session():
+    """Pooled HTTP session for Grok, retrying 429/5xx with exponential backoff."""
+    global _grok_session
+    with _clients_lock:
+        if _grok_session is None:
+            retry = Retry(total=LLM_MAX_RETRIES, backoff_factor=1, status_forcelist=[429, 500, 502, 503, 504],
+                          allowed_methods=["POST"], respect_retry_after_header=True)
+            session = requests.Session()
+            session.mount("https://", HTTPAdapter(max_retries=retry))
+            session.mount("http://", HTTPAdapter(max_retries=retry))
+            session.headers.update({
+                "Authorization": f"Bearer {GROK_API_KEY}",
+                "Content-Type": "application/json"
+            })
+            _grok_session = session
+        return _grok_session
+
+
+def _get_claude_client():
+    """Shared Anthropic client with a request timeout and built-in retries."""
+    global _claude_client
+    with _clients_lock:
+        if _claude_client is None:
+            from anthropic import Anthropic  # Heavy import, only paid by runs that reach the LLM stage
+            _claude_client = Anthropic(api_key=CLAUDE_API_KEY, base_url=CLAUDE_BASE_URL,
+                                       timeout=LLM_TIMEOUT_SECONDS, max_retries=LLM_MAX_RETRIES)
+        return _claude_client
+
+
+# Function to query Grok
+def query_grok(prompt):
+    data = {
+        "model": "grok-3",
+        "prompt": prompt,
+        "max_tokens": 500,
+        "temperature": 0.7
+    }
+    response = _get_grok_session().post(GROK_API_URL, json=data, timeout=LLM_TIMEOUT_SECONDS)
+    response.raise_for_status()
+    return response.json()["choices"][0]["text"].strip()
+
+
+# Function to query Claude
+def query_claude(prompt):
+    response = _get_claude_client().messages.create(
+        model="claude-3-5-sonnet-20241022",
+        max_tokens=500,
+        messages=[{"role": "user", "content": prompt}],
+        extra_body={"temperature": 0.7}  # Newer SDKs dropped the keyword; the API still takes it
+    )
+    return response.content[0].text.strip()
+
+
+# Models queried by run_llm_pipeline: (display name, cache key, query function), in print order
+MODELS = [
+    ("Grok", "grok-3", query_grok),
+    ("Claude", "claude-3-5-sonnet-20241022", query_claude),
+]
+
+
+def _ask(model, prompt, cache, key):
+    """Answer from the cache if possible, otherwise call the model and cache a successful response."""
+    name, model_id, query = model
+    if cache:
+        cached = cache.get(model_id, key)
+        if cached is not None:
+            return cached, True
+    try:
+        response = query(prompt)
+    except Exception as e:
+        return f"Error from {name} API: {e}", False
+    if cache:
+        cache.put(model_id, key, response)
+    return response, False
+
+
+PROMPT_TEMPLATE = """
+    Analyze the following threat intelligence data from AlienVault OTX, collected on {collected_on}:
+
+    - Total pulses: {total_pulses}
+    - Total indicators: {total_indicators}
+    - Top 5 indicator types: {indicator_types}
+    - Top 5 targeted countries: {top_countries}
+    - Top 5 tags: {top_tags}
+    - Indicators status: {percent_expired:.2f}% expired, {percent_active:.2f}% active
+    - Pulse with most indicators: '{top_pulse_name}' ({top_pulse_count} indicators)
+    - Temporal trends (last 6 months): {pulse_trends}
+    - Top 5 TLP indicators: {tlp_indicators}
+    - Top 3 pulses with multiple indicator types: {multi_type_pulses}
+    - Indicators expiring soon: {expiring_indicators}
+    - Top 5 targeted industries: {top_industries}
+
+    Provide a concise summary and 3-5 key insights, focusing on the most critical threats and trends.
+    """
+
+
+def build_prompt(query_results, collected_on=None):
+    """Format the aggregate query results into the analysis prompt (dated today unless `collected_on` is given)."""
     # Extract results
-    total_pulses = query_results["total_pulses"][0][0]
-    total_indicators = query_results["total_indicators"][0][0]
-    indicator_types = query_results["indicator_types"]
-    top_countries = query_results["top_countries"]
-    top_tags = query_results["top_tags"]
     expired, active = query_results["expired_active"][0]
     top_pulse = query_results["top_pulse"][0]
-    pulse_trends = query_results["pulse_trends"]
-    tlp_indicators = query_results["tlp_indicators"]
-    multi_type_pulses = query_results["multi_type_pulses"]
-    expiring_indicators = query_results["expiring_indicators"]
-    top_industries = query_results["top_industries"]
 
     # Calculate expired/active percentages
     total = expired + active
@@ -35,68 +201,84 @@ def run_llm_pipeline():
     percent_active = (active / total * 100) if total > 0 else 0
 
     # Format the prompt
-    prompt = f"""
-    Analyze the following threat intelligence data from AlienVault OTX, collected on {datetime.now().strftime('%Y-%m-%d')}:
+    return PROMPT_TEMPLATE.format(
+        collected_on=collected_on or datetime.now().strftime('%Y-%m-%d'),
+        total_pulses=query_results["total_pulses"][0][0],
+        total_indicators=query_results["total_indicators"][0][0],
+        indicator_types=', '.join([f'{t[0]}: {t[1]}' for t in query_results["indicator_types"]]),
+        top_countries=', '.join([f'{c[0]}: {c[1]}' for c in query_results["top_countries"]]),
+        top_tags=', '.join([f'{t[0]}: {t[1]}' for t in query_results["top_tags"]]),
+        percent_expired=percent_expired,
+        percent_active=percent_active,
+        top_pulse_name=top_pulse[1],
+        top_pulse_count=top_pulse[2],
+        pulse_trends=', '.join(['{}: {} pulses'.format(t[0].strftime('%Y-%m'), t[1])
+                                for t in query_results["pulse_trends"]]),
+        tlp_indicators=', '.join([f'TLP {t[0]} - {t[1]}: {t[2]}' for t in query_results["tlp_indicators"]]),
+        multi_type_pulses=', '.join(["'{}': {} types".format(p[1], p[2]) for p in query_results["multi_type_pulses"]]),
+        expiring_indicators=', '.join(['{}: {} (expires {})'.format(i[0], i[1], i[2].strftime('%Y-%m-%d %H:%M:%S'))
+                                       for i in query_results["expiring_indicators"]]),
+        top_industries=', '.join([f'{i[0]}: {i[1]} pulses' for i in query_results["top_industries"]])
+    )
 
-    - Total pulses: {total_pulses}
-    - Total indicators: {total_indicators}
-    - Top 5 indicator types: {', '.join([f'{t[0]}: {t[1]}' for t in indicator_types])}
-    - Top 5 targeted countries: {', '.join([f'{c[0]}: {c[1]}' for c in top_countries])}
-    - Top 5 tags: {', '.join([f'{t[0]}: {t[1]}' for t in top_tags])}
-    - Indicators status: {percent_expired:.2f}% expired, {percent_active:.2f}% active
-    - Pulse with most indicators: '{top_pulse[1]}' ({top_pulse[2]} indicators)
-    - Temporal trends (last 6 months): {', '.join(['{}: {} pulses'.format(t[0].strftime('%Y-%m'), t[1]) for t in pulse_trends])}
-    - Top 5 TLP indicators: {', '.join([f'TLP {t[0]} - {t[1]}: {t[2]}' for t in tlp_indicators])}
-    - Top 3 pulses with multiple indicator types: {', '.join(["'{}': {} types".format(p[1], p[2]) for p in multi_type_pulses])}
-    - Indicators expiring soon: {', '.join(['{}: {} (expires {})'.format(i[0], i[1], i[2].strftime('%Y-%m-%d %H:%M:%S')) for i in expiring_indicators])}
-    - Top 5 targeted industries: {', '.join([f'{i[0]}: {i[1]} pulses' for i in top_industries])}
 
-    Provide a concise summary and 3-5 key insights, focusing on the most critical threats and trends.
+def _clock_buckets(query_results):
+    """The time-relative results as the cache key holds them: the expired share to the whole percent, and
+    the indicators expiring soon with their expiration day."""
+    expired, active = query_results["expired_active"][0]
+    total = expired + active
+    return {
+        "percent_expired": round(expired / total * 100) if total > 0 else 0,
+        "expiring_indicators": [(i[0], i[1], i[2].strftime('%Y-%m-%d')) for i in query_results["expiring_indicators"]],
+    }
+
+
+def cache_key(query_results):
+    """
+    Response cache key for build_prompt(query_results): the prompt template plus the query results
+    it is built from, leaving out the date and coarsening the results that move with the clock, so
+    responses are reused while the loaded data is unchanged and the expiry picture has not shifted.
     """
+    data = {name: rows for name, rows in query_results.items() if name not in TIME_RELATIVE_QUERIES}
+    data["clock"] = _clock_buckets(query_results)
+    return PROMPT_TEMPLATE + json.dumps(data, sort_keys=True, default=str)
+
+
+def run_llm_pipeline(use_cache=True):
+    """
+    Query every model in MODELS concurrently with the aggregate threat data and print the responses.
+    Responses are cached on disk by model and cache_key, so the calls are skipped entirely
+    when the data has not changed since the last run.
+    Returns:
+        bool: False if the database queries failed and no model was asked.
+    """
+    print("Generating LLM Response Results")
+    # Run SQL queries
+    query_results = run_all_queries()
+
+    # Check for database connection error
+    if "error" in query_results:
+        print(f"Database error: {query_results['error']}")
+        return False
+
+    prompt = build_prompt(query_results)
+    key = cache_key(query_results)
+    cache = ResponseCache() if use_cache else None
+    if cache:
+        cache.evict_expired()
+
+    # Fan out to all models at once
+    with ThreadPoolExecutor(max_workers=len(MODELS)) as pool:
+        responses = list(pool.map(lambda model: _ask(model, prompt, cache, key), MODELS))
+
+    # Print responses
+    for i, ((name, _, _), (response, cached)) in enumerate(zip(MODELS, responses)):
+        header = f"=== {name} Response{' (cached)' if cached else ''} ==="
+        print(header if i == 0 else f"\n{header}")
+        print(response)
+    return True
 
-    # Function to query Grok
-    def query_grok(prompt):
-        url = "https://api.x.ai/v1/completions"  # Adjust if endpoint changes
-        headers = {
-            "Authorization": f"Bearer {GROK_API_KEY}",
-            "Content-Type": "application/json"
-        }
-        data = {
-            "model": "grok-3",
-            "prompt": prompt,
-            "max_tokens": 500,
-            "temperature": 0.7
-        }
-        try:
-            response = requests.post(url, json=data, headers=headers)
-            response.raise_for_status()
-            return response.json()["choices"][0]["text"].strip()
-        except Exception as e:
-            return f"Error from Grok API: {e}"
-
-    # Function to query Claude
-    def query_claude(prompt):
-        # Initialize Anthropic client for Claude
-        anthropic = Anthropic(api_key=CLAUDE_API_KEY)
-        try:
-            response = anthropic.messages.create(
-                model="claude-3-5-sonnet-20241022",
-                max_tokens=500,
-                temperature=0.7,
-                messages=[{"role": "user", "content": prompt}]
-            )
-            return response.content[0].text.strip()
-        except Exception as e:
-            return f"Error from Claude API: {e}"
-
-    # Get and print responses
-    print("=== Grok Response ===")
-    grok_response = query_grok(prompt)
-    print(grok_response)
-
-    print("\n=== Claude Response ===")
-    claude_response = query_claude(prompt)
-    print(claude_response)
 
 if __name__ == "__main__":
-    run_llm_pipeline()
+    if not run_llm_pipeline():
+        sys.exit(1)
@@ -0,0 +1,74 @@
+# src/snapshot.py
+import os
+import shutil
+import pandas as pd
+from src.config import SNAPSHOT_DIR, SNAPSHOT_FORMAT, SNAPSHOT_COMPRESSION
+from src.transform import PULSE_COLUMNS, INDICATOR_COLUMNS
+
+# Low-cardinality columns stored dictionary-encoded in Parquet
+CATEGORY_COLUMNS = {"pulses": ["tlp"], "indicators": ["type"]}
+
+# Written for missing values in CSV snapshots, so empty strings read back as '' rather than NULL
+CSV_NULL = "\\N"
+
+
+def _pulse_months(pulses_df):
+    """Partition key for each pulse: the 'YYYY-MM' of its creation date."""
+    return pulses_df["created"].str[:7].fillna("unknown")
+
+
+def write_snapshot(pulses_df, indicators_df, path=SNAPSHOT_DIR, fmt=SNAPSHOT_FORMAT):
+    """
+    Save transformed pulses and indicators so later runs can reload them without calling OTX.
+    Any existing snapshot at `path` is replaced.
+    Args:
+        pulses_df (DataFrame): Pulse rows from transform_pulses.
+        indicators_df (DataFrame): Indicator rows from transform_pulses.
+        path (str): Snapshot directory.
+        fmt (str): "parquet" (compressed, partitioned by pulse month) or "csv".
+    """
+    print(f"Saving {fmt} snapshot to '{path}'")
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    os.makedirs(path)
+
+    if fmt == "csv":
+        pulses_df.to_csv(os.path.join(path, "pulses.csv"), index=False, na_rep=CSV_NULL)
+        indicators_df.to_csv(os.path.join(path, "indicators.csv"), index=False, na_rep=CSV_NULL)
+        return
+    if fmt != "parquet":
+        raise ValueError(f"Unsupported snapshot format: {fmt}")
+
+    # Indicators are partitioned by the month of their parent pulse
+    months = _pulse_months(pulses_df)
+    indicator_months = indicators_df["pulse_id"].map(dict(zip(pulses_df["id"], months))).fillna("unknown")
+    frames = {
+        "pulses": pulses_df.assign(month=months),
+        "indicators": indicators_df.assign(month=indicator_months),
+    }
+    for name, df in frames.items():
+        df = df.astype({column: "category" for column in CATEGORY_COLUMNS[name]})
+        df.to_parquet(os.path.join(path, name), partition_cols=["month"],
+                      compression=SNAPSHOT_COMPRESSION, index=False)
+
+
+def read_snapshot(path=SNAPSHOT_DIR):
+    """
+    Load a snapshot written by write_snapshot; the format is detected from the directory contents.
+    Returns:
+        tuple: (pulses_df, indicators_df) with the same columns as transform_pulses.
+    """
+    if os.path.exists(os.path.join(path, "pulses.csv")):
+        csv_options = {"keep_default_na": False, "na_values": [CSV_NULL]}
+        pulses_df = pd.read_csv(os.path.join(path, "pulses.csv"), **csv_options)
+        indicators_df = pd.read_csv(os.path.join(path, "indicators.csv"), **csv_options)
+        # Only the NULL marker comes back as NaN; load it as NULL and keep blank cells as ''
+        pulses_df = pulses_df.astype(object).where(pulses_df.notna(), None)
+        indicators_df = indicators_df.astype(object).where(indicators_df.notna(), None)
+    else:
+        pulses_df = pd.read_parquet(os.path.join(path, "pulses"))
+        indicators_df = pd.read_parquet(os.path.join(path, "indicators"))
+        pulses_df = pulses_df.astype({column: object for column in CATEGORY_COLUMNS["pulses"]})
+        indicators_df = indicators_df.astype({column: object for column in CATEGORY_COLUMNS["indicators"]})
+    print(f"Loaded snapshot from '{path}': {len(pulses_df)} pulses, {len(indicators_df)} indicators")
+    return pulses_df[PULSE_COLUMNS], indicators_df[INDICATOR_COLUMNS]
@@ -1,162 +1,446 @@
 # src/sql_queries.py
-import psycopg2
+import argparse
+import hashlib
+import os
+import pickle
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from src.config import DB_CONFIG
+from src.config import (
+    QUERY_WORKERS, QUERY_TIMEOUT_SECONDS, QUERY_USE_ROLLUPS, STORAGE_MODE, EXPORT_ITERSIZE,
+    QUERY_CACHE_DIR, QUERY_CACHE_TTL_SECONDS, QUERY_CACHE_RELATIVE_TTL_SECONDS
+)
+from src.db import close_pool, data_version, pooled_connection
+from src.metrics import stage
+from src.storage import indicator_relation
 
+# Analytics queries run by run_all_queries, in report order.
+# {indicators} is replaced by the indicator relation of the configured STORAGE_MODE (see query_text).
+# Queries whose result moves with the clock set a short "cache_ttl"; the rest stay cached until the next load.
+QUERIES = [
+    {
+        "name": "total_pulses",
+        "query": "SELECT COUNT(*) FROM pulses"
+    },
+    {
+        "name": "total_indicators",
+        "query": "SELECT COUNT(*) FROM {indicators}"
+    },
+    {
+        "name": "indicator_types",
+        "query": "SELECT type, COUNT(*) as count FROM {indicators} GROUP BY type ORDER BY count DESC LIMIT 5"
+    },
+    {
+        "name": "top_countries",
+        "query": """
+            SELECT country, COUNT(*) as count
+            FROM (SELECT jsonb_array_elements_text(targeted_countries) as country FROM pulses) as sub
+            GROUP BY country ORDER BY count DESC LIMIT 5
+        """
+    },
+    {
+        "name": "top_tags",
+        "query": """
+            SELECT tag, COUNT(*) as count
+            FROM (SELECT jsonb_array_elements_text(tags) as tag FROM pulses) as sub
+            GROUP BY tag ORDER BY count DESC LIMIT 5
+        """
+    },
+    {
+        "name": "expired_active",
+        "cache_ttl": QUERY_CACHE_RELATIVE_TTL_SECONDS,
+        "query": """
+            SELECT
+                SUM(CASE WHEN expiration < NOW() THEN 1 ELSE 0 END) as expired,
+                SUM(CASE WHEN expiration >= NOW() OR expiration IS NULL THEN 1 ELSE 0 END) as active
+            FROM {indicators}
+        """
+    },
+    {
+        "name": "top_pulse",
+        "query": """
+            SELECT p.id, p.name, COUNT(i.id) as indicator_count
+            FROM pulses p LEFT JOIN {indicators} i ON p.id = i.pulse_id
+            GROUP BY p.id, p.name ORDER BY indicator_count DESC LIMIT 1
+        """
+    },
+    {
+        "name": "samples",
+        "query": """
+            SELECT p.id, p.name, p.description, i.type, i.indicator
+            FROM pulses p JOIN {indicators} i ON p.id = i.pulse_id
+            LIMIT 3
+        """
+    },
+    {
+        "name": "pulse_trends",
+        "query": """
+            SELECT DATE_TRUNC('month', created) AS month, COUNT(*) AS pulse_count
+            FROM pulses
+            GROUP BY DATE_TRUNC('month', created)
+            ORDER BY month DESC
+            LIMIT 6
+        """
+    },
+    {
+        "name": "tlp_indicators",
+        "query": """
+            SELECT p.tlp, i.type, COUNT(i.id) AS indicator_count
+            FROM pulses p
+            JOIN {indicators} i ON p.id = i.pulse_id
+            WHERE p.tlp IN ('red', 'amber', 'green', 'white')
+            GROUP BY p.tlp, i.type
+            ORDER BY indicator_count DESC
+            LIMIT 5
+        """
+    },
+    {
+        "name": "multi_type_pulses",
+        "query": """
+            SELECT p.id, p.name, COUNT(DISTINCT i.type) AS type_count
+            FROM pulses p
+            JOIN {indicators} i ON p.id = i.pulse_id
+            GROUP BY p.id, p.name
+            HAVING COUNT(DISTINCT i.type) > 1
+            ORDER BY type_count DESC
+            LIMIT 3
+        """
+    },
+    {
+        "name": "expiring_indicators",
+        "cache_ttl": QUERY_CACHE_RELATIVE_TTL_SECONDS,
+        "query": """
+            SELECT i.type, i.indicator, i.expiration
+            FROM {indicators} i
+            WHERE i.expiration IS NOT NULL
+              AND i.expiration BETWEEN NOW() AND NOW() + INTERVAL '30 days'
+            ORDER BY i.expiration
+            LIMIT 5
+        """
+    },
+    {
+        "name": "top_industries",
+        "query": """
+            SELECT industry, COUNT(*) AS pulse_count
+            FROM (SELECT jsonb_array_elements_text(industries) AS industry FROM pulses) AS sub
+            GROUP BY industry
+            ORDER BY pulse_count DESC
+            LIMIT 5
+        """
+    }
+]
 
-def run_all_queries():
+
+# Equivalent queries served from the rollup tables maintained by the load step (src/rollups.py).
+# Time-relative and row-level queries (expired_active, samples, expiring_indicators) always hit the raw tables.
+ROLLUP_QUERIES = {
+    "total_pulses": "SELECT COUNT(*) FROM rollup_pulses",
+    "total_indicators": "SELECT COALESCE(SUM(indicator_count), 0)::bigint FROM rollup_pulses",
+    "indicator_types": """
+        SELECT type, SUM(indicator_count)::bigint as count FROM rollup_pulse_types
+        GROUP BY type ORDER BY count DESC LIMIT 5
+    """,
+    "top_countries": """
+        SELECT value as country, SUM(occurrences)::bigint as count FROM rollup_pulse_facets
+        WHERE facet = 'country' GROUP BY value ORDER BY count DESC LIMIT 5
+    """,
+    "top_tags": """
+        SELECT value as tag, SUM(occurrences)::bigint as count FROM rollup_pulse_facets
+        WHERE facet = 'tag' GROUP BY value ORDER BY count DESC LIMIT 5
+    """,
+    "top_pulse": """
+        SELECT pulse_id, name, indicator_count FROM rollup_pulses
+        ORDER BY indicator_count DESC LIMIT 1
+    """,
+    "pulse_trends": """
+        SELECT month, COUNT(*) AS pulse_count FROM rollup_pulses
+        GROUP BY month ORDER BY month DESC LIMIT 6
+    """,
+    "tlp_indicators": """
+        SELECT p.tlp, t.type, SUM(t.indicator_count)::bigint AS indicator_count
+        FROM rollup_pulses p
+        JOIN rollup_pulse_types t ON p.pulse_id = t.pulse_id
+        WHERE p.tlp IN ('red', 'amber', 'green', 'white')
+        GROUP BY p.tlp, t.type
+        ORDER BY indicator_count DESC
+        LIMIT 5
+    """,
+    "multi_type_pulses": """
+        SELECT pulse_id, name, type_count FROM rollup_pulses
+        WHERE type_count > 1 ORDER BY type_count DESC LIMIT 3
+    """,
+    "top_industries": """
+        SELECT value as industry, SUM(occurrences)::bigint AS pulse_count FROM rollup_pulse_facets
+        WHERE facet = 'industry' GROUP BY value ORDER BY pulse_count DESC LIMIT 5
+    """,
+}
+
+
+def query_text(q, use_rollups=QUERY_USE_ROLLUPS, storage_mode=STORAGE_MODE):
+    """SQL to run for a QUERIES entry: the rollup version when enabled and available."""
+    if use_rollups and q["name"] in ROLLUP_QUERIES:
+        return ROLLUP_QUERIES[q["name"]]
+    return q["query"].format(indicators=indicator_relation(storage_mode))
+
+
+class QueryCache:
+    """
+    On-disk cache of query results, one pickle file per query text (named by its SHA-256).
+    An entry is only served for the data version it was computed at, so any committed
+    load or retention batch invalidates every entry; `ttl` additionally bounds its age.
+    """
+    def __init__(self, directory=QUERY_CACHE_DIR, ttl=QUERY_CACHE_TTL_SECONDS):
+        self.directory = directory
+        self.ttl = ttl
+
+    def _path(self, sql):
+        digest = hashlib.sha256(sql.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, f"{digest}.pkl")
+
+    def get(self, sql, version, ttl=None):
+        """Return the cached rows, or None if missing, computed at another data version, or expired."""
+        try:
+            with open(self._path(sql), "rb") as f:
+                entry = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+        max_age = min(ttl, self.ttl) if ttl else self.ttl
+        if entry["version"] != version or time.time() - entry["created"] > max_age:
+            return None
+        return entry["result"]
+
+    def put(self, sql, version, result):
+        """Store rows atomically, replacing the entry of any older data version."""
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump({"version": version, "created": time.time(), "result": result}, f)
+            os.replace(tmp_path, self._path(sql))
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+
+def _run_query(name, sql, timeout):
+    """
+    Run one query on its own pooled connection under a statement timeout.
+    Returns (result, elapsed_seconds); result is an error dict if the query failed.
+    """
+    start = time.perf_counter()
+    with stage(f"query.{name}") as m:
+        try:
+            with pooled_connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute("SET LOCAL statement_timeout = %s", (int(timeout * 1000),))
+                    cur.execute(sql)
+                    result = cur.fetchall()
+            m["rows"] = len(result)
+        except Exception as e:
+            result = {"error": f"Query failed: {e}"}
+            m["details"] = result
+    return result, time.perf_counter() - start
+
+
+def run_all_queries(workers=QUERY_WORKERS, timeout=QUERY_TIMEOUT_SECONDS, use_rollups=QUERY_USE_ROLLUPS,
+                    cache_dir=QUERY_CACHE_DIR):
     """
     Execute all SQL queries against the threat_intel database, print results, and return them.
+    Queries run concurrently over a connection pool, so the total time is close to that
+    of the slowest query; results are printed in report order once all have finished.
+    Results are cached per data version, so repeated reports between loads only cost one
+    version lookup plus the NOW()-relative queries whose short TTL has run out.
+    Args:
+        workers (int): Number of queries to run at once.
+        timeout (float): Per-query timeout in seconds.
+        use_rollups (bool): Read aggregates from the rollup tables instead of the raw tables.
+        cache_dir (str): Result cache directory; None always runs every query.
     Returns a dictionary with query names as keys and result lists as values.
     """
     results = {}
 
-    # Connect to the database
+    # Connect to the database and read the data version the cache is keyed on
+    cache = version = None
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        cur = conn.cursor()
+        with pooled_connection() as conn:
+            if cache_dir:
+                try:
+                    with conn.cursor() as cur:
+                        version = data_version(cur)
+                    cache = QueryCache(cache_dir)
+                except Exception as e:
+                    print(f"Query cache disabled, data version unavailable: {e}")
         print("Connected to database successfully.")
     except Exception as e:
         print(f"Failed to connect to database: {e}")
         return {"error": f"Failed to connect to database: {e}"}
 
-    queries = [
-        {
-            "name": "total_pulses",
-            "query": "SELECT COUNT(*) FROM pulses"
-        },
-        {
-            "name": "total_indicators",
-            "query": "SELECT COUNT(*) FROM indicators"
-        },
-        {
-            "name": "indicator_types",
-            "query": "SELECT type, COUNT(*) as count FROM indicators GROUP BY type ORDER BY count DESC LIMIT 5"
-        },
-        {
-            "name": "top_countries",
-            "query": """
-                SELECT country, COUNT(*) as count
-                FROM (SELECT jsonb_array_elements_text(targeted_countries) as country FROM pulses) as sub
-                GROUP BY country ORDER BY count DESC LIMIT 5
-            """
-        },
-        {
-            "name": "top_tags",
-            "query": """
-                SELECT tag, COUNT(*) as count
-                FROM (SELECT jsonb_array_elements_text(tags) as tag FROM pulses) as sub
-                GROUP BY tag ORDER BY count DESC LIMIT 5
-            """
-        },
-        {
-            "name": "expired_active",
-            "query": """
-                SELECT
-                    SUM(CASE WHEN expiration < NOW() THEN 1 ELSE 0 END) as expired,
-                    SUM(CASE WHEN expiration >= NOW() OR expiration IS NULL THEN 1 ELSE 0 END) as active
-                FROM indicators
-            """
-        },
-        {
-            "name": "top_pulse",
-            "query": """
-                SELECT p.id, p.name, COUNT(i.id) as indicator_count
-                FROM pulses p LEFT JOIN indicators i ON p.id = i.pulse_id
-                GROUP BY p.id, p.name ORDER BY indicator_count DESC LIMIT 1
-            """
-        },
-        {
-            "name": "samples",
-            "query": """
-                SELECT p.id, p.name, p.description, i.type, i.indicator
-                FROM pulses p JOIN indicators i ON p.id = i.pulse_id
-                LIMIT 3
-            """
-        },
-        {
-            "name": "pulse_trends",
-            "query": """
-                SELECT DATE_TRUNC('month', created) AS month, COUNT(*) AS pulse_count
-                FROM pulses
-                GROUP BY DATE_TRUNC('month', created)
-                ORDER BY month DESC
-                LIMIT 6
-            """
-        },
-        {
-            "name": "tlp_indicators",
-            "query": """
-                SELECT p.tlp, i.type, COUNT(i.id) AS indicator_count
-                FROM pulses p
-                JOIN indicators i ON p.id = i.pulse_id
-                WHERE p.tlp IN ('red', 'amber', 'green', 'white')
-                GROUP BY p.tlp, i.type
-                ORDER BY indicator_count DESC
-                LIMIT 5
-            """
-        },
-        {
-            "name": "multi_type_pulses",
-            "query": """
-                SELECT p.id, p.name, COUNT(DISTINCT i.type) AS type_count
-                FROM pulses p
-                JOIN indicators i ON p.id = i.pulse_id
-                GROUP BY p.id, p.name
-                HAVING COUNT(DISTINCT i.type) > 1
-                ORDER BY type_count DESC
-                LIMIT 3
-            """
-        },
-        {
-            "name": "expiring_indicators",
-            "query": """
-                SELECT i.type, i.indicator, i.expiration
-                FROM indicators i
-                WHERE i.expiration IS NOT NULL
-                  AND i.expiration BETWEEN NOW() AND NOW() + INTERVAL '30 days'
-                ORDER BY i.expiration
-                LIMIT 5
-            """
-        },
-        {
-            "name": "top_industries",
-            "query": """
-                SELECT industry, COUNT(*) AS pulse_count
-                FROM (SELECT jsonb_array_elements_text(industries) AS industry FROM pulses) AS sub
-                GROUP BY industry
-                ORDER BY pulse_count DESC
-                LIMIT 5
-            """
-        }
-    ]
-
-    # Run all queries and print results
-    for q in queries:
+    # Serve what the cache holds for this version and run the rest in parallel
+    sqls = [query_text(q, use_rollups) for q in QUERIES]
+    cached = [cache.get(sql, version, q.get("cache_ttl")) if cache else None for q, sql in zip(QUERIES, sqls)]
+    misses = [i for i, rows in enumerate(cached) if rows is None]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        ran = list(pool.map(lambda i: _run_query(QUERIES[i]["name"], sqls[i], timeout), misses))
+    total = time.perf_counter() - start
+    outcomes = [(rows, 0.0) for rows in cached]
+    for i, (result, elapsed) in zip(misses, ran):
+        outcomes[i] = (result, elapsed)
+        if cache and not isinstance(result, dict):
+            cache.put(sqls[i], version, result)
+
+    # Print results in report order
+    for q, sql, rows, (result, elapsed) in zip(QUERIES, sqls, cached, outcomes):
         print(f"\n=== {q['name'].replace('_', ' ').title()} ===")
-        print(f"Query: {q['query'].strip()}")
-        try:
-            cur.execute(q["query"])
-            result = cur.fetchall()
-            results[q["name"]] = result
-            print("Result:")
-            if result:
-                for row in result:
-                    print(list(row))
-            else:
-                print("No results returned.")
-        except Exception as e:
-            print(f"Error: {e}")
-            results[q["name"]] = {"error": f"Query failed: {e}"}
+        print(f"Query: {sql.strip()}")
+        results[q["name"]] = result
+        if isinstance(result, dict):
+            print(f"Error ({elapsed:.3f}s): {result['error']}")
+            continue
+        print("Result (cached):" if rows is not None else f"Result ({elapsed:.3f}s):")
+        if result:
+            for row in result:
+                print(list(row))
+        else:
+            print("No results returned.")
 
-    # Close connection and print timestamp
-    cur.close()
-    conn.close()
+    # Print timing and timestamp
     timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S %Z')
-    print(f"\nAll queries executed. Connection closed.")
+    print(f"\n{len(misses)} queries executed in {total:.3f}s "
+          f"(sum of query times {sum(elapsed for _, elapsed in outcomes):.3f}s), "
+          f"{len(QUERIES) - len(misses)} served from cache.")
     print(f"Queries executed at: {timestamp}")
     return results
 
 
+# Columns written by CSV/JSONL exports (blocklists hold the indicator value only)
+EXPORT_COLUMNS = [
+    ("id", "i.id"), ("indicator", "i.indicator"), ("type", "i.type"), ("pulse_id", "i.pulse_id"),
+    ("pulse_name", "p.name"), ("tlp", "p.tlp"), ("created", "i.created"), ("expiration", "i.expiration"),
+    ("is_active", "i.is_active"),
+]
+EXPORT_FORMATS = ["csv", "jsonl", "blocklist"]
+
+
+def export_query(cursor, fmt="csv", types=None, tlp=None, active_only=False, pulse_ids=None,
+                 storage_mode=STORAGE_MODE):
+    """
+    SQL selecting the indicators to export, with the filter values inlined via mogrify
+    (COPY cannot take bind parameters).
+    Args:
+        cursor: Cursor used to quote the filter values.
+        fmt (str): "csv", "jsonl", or "blocklist" (distinct indicator values, sorted).
+        types (list): Indicator types to keep, e.g. ["IPv4", "domain"].
+        tlp (list): Pulse TLP levels to keep.
+        active_only (bool): Keep only active indicators that have not expired.
+        pulse_ids (list): Pulses to keep.
+    """
+    conditions = []
+    params = []
+    if types:
+        conditions.append("i.type = ANY(%s)")
+        params.append(list(types))
+    if tlp:
+        conditions.append("p.tlp = ANY(%s)")
+        params.append([level.lower() for level in tlp])
+    if pulse_ids:
+        conditions.append("i.pulse_id = ANY(%s)")
+        params.append(list(pulse_ids))
+    if active_only:
+        conditions.append("i.is_active AND (i.expiration IS NULL OR i.expiration >= NOW())")
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    source = f"{indicator_relation(storage_mode)} i JOIN pulses p ON p.id = i.pulse_id"
+    if fmt == "blocklist":
+        sql = f"SELECT DISTINCT i.indicator FROM {source} {where} ORDER BY i.indicator"
+    else:
+        columns = ", ".join(f"{expression} AS {name}" for name, expression in EXPORT_COLUMNS)
+        sql = f"SELECT {columns} FROM {source} {where} ORDER BY i.id"
+        if fmt == "jsonl":
+            # Postgres renders each row as JSON, which is much faster than json.dumps per row
+            sql = f"SELECT row_to_json(e)::text FROM ({sql}) e"
+    return cursor.mogrify(sql, params).decode()
+
+
+def _write_lines(cursor, f, itersize):
+    """Stream a named cursor's single-column rows to `f`, one per line. Returns the row count."""
+    cursor.itersize = itersize
+    count = 0
+    for (line,) in cursor:
+        f.write(line)
+        f.write("\n")
+        count += 1
+    return count
+
+
+def export_indicators(path, fmt="csv", types=None, tlp=None, active_only=False, pulse_ids=None,
+                      itersize=EXPORT_ITERSIZE, storage_mode=STORAGE_MODE):
+    """
+    Stream indicators to a CSV, JSONL or plain-text blocklist file with constant memory.
+    CSV is produced by Postgres itself through COPY ... TO STDOUT; JSONL and blocklists are
+    written from a named (server-side) cursor fetching `itersize` rows per round trip.
+    The file is written under a temporary name and renamed when complete, so feeds
+    polling `path` never see a partial export.
+    Args:
+        path (str): Output file, or "-" for stdout.
+        fmt (str): "csv", "jsonl" or "blocklist".
+        types, tlp, active_only, pulse_ids: Filters, see export_query.
+        itersize (int): Rows per server-side cursor fetch.
+    Returns:
+        int: Rows written.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format: {fmt}")
+    tmp_path = None if path == "-" else f"{path}.tmp"
+    with stage(f"export.{fmt}") as m, pooled_connection() as conn:
+        with conn.cursor() as cursor:
+            sql = export_query(cursor, fmt, types, tlp, active_only, pulse_ids, storage_mode)
+        f = sys.stdout if tmp_path is None else open(tmp_path, "w", encoding="utf-8", newline="")
+        try:
+            if fmt == "csv":
+                with conn.cursor() as cursor:
+                    cursor.copy_expert(f"COPY ({sql}) TO STDOUT WITH (FORMAT csv, HEADER)", f)
+                    count = cursor.rowcount
+            else:
+                with conn.cursor(name="export") as cursor:
+                    cursor.execute(sql)
+                    count = _write_lines(cursor, f, itersize)
+        except BaseException:
+            if tmp_path:
+                f.close()
+                os.remove(tmp_path)
+            raise
+        if tmp_path:
+            f.close()
+            os.replace(tmp_path, path)
+        m["rows"] = count
+    print(f"Exported {count} rows to {path} ({fmt})", file=sys.stderr)
+    return count
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run the analytics queries, or export indicators")
+    parser.add_argument("--export", metavar="PATH", help="Export indicators to PATH ('-' for stdout) instead")
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="csv", help="Export format")
+    parser.add_argument("--type", action="append", dest="types", metavar="TYPE",
+                        help="Only this indicator type (repeatable), e.g. IPv4")
+    parser.add_argument("--tlp", action="append", metavar="LEVEL", help="Only pulses with this TLP (repeatable)")
+    parser.add_argument("--pulse", action="append", dest="pulse_ids", metavar="ID",
+                        help="Only indicators of this pulse (repeatable)")
+    parser.add_argument("--active", action="store_true", help="Only active, unexpired indicators")
+    parser.add_argument("--no-cache", action="store_true", help="Run every query instead of reusing cached results")
+    return parser.parse_args()
+
+
 if __name__ == "__main__":
-    run_all_queries()
+    args = parse_args()
+    if args.export:
+        export_indicators(args.export, args.format, types=args.types, tlp=args.tlp,
+                          active_only=args.active, pulse_ids=args.pulse_ids)
+    else:
+        run_all_queries(cache_dir=None if args.no_cache else QUERY_CACHE_DIR)
+    close_pool()
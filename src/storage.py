@@ -0,0 +1,35 @@
+# src/storage.py
+# Indicator storage layouts selected by STORAGE_MODE in src/config.py:
+#   "wide":       one `indicators` row per indicator occurrence (default)
+#   "normalized": unique (type, value) pairs in `observables`, linked to pulses by the slim
+#                 `pulse_observables` table; `indicator_occurrences` is a view joining them
+#                 back into the `indicators` column layout.
+from src.config import STORAGE_MODE
+
+STORAGE_MODES = ["wide", "normalized"]
+
+# Relation with the `indicators` column layout for each storage mode
+INDICATOR_RELATIONS = {"wide": "indicators", "normalized": "indicator_occurrences"}
+
+
+def indicator_relation(storage_mode=STORAGE_MODE):
+    """Table or view to read indicator rows from in the given storage mode."""
+    if storage_mode not in INDICATOR_RELATIONS:
+        raise ValueError(f"Unknown storage mode: {storage_mode}")
+    return INDICATOR_RELATIONS[storage_mode]
+
+
+def delete_orphaned_observables(cursor, candidate_ids):
+    """
+    Delete the observables among `candidate_ids` (a subquery) that no pulse_observables row links
+    to any more. Observables of occurrences kept in pulse_observables_archive are kept.
+    Returns:
+        int: Observables deleted.
+    """
+    cursor.execute(f"""
+        DELETE FROM observables o
+        WHERE o.id IN ({candidate_ids})
+          AND NOT EXISTS (SELECT 1 FROM pulse_observables l WHERE l.observable_id = o.id)
+          AND NOT EXISTS (SELECT 1 FROM pulse_observables_archive a WHERE a.observable_id = o.id)
+    """)
+    return cursor.rowcount
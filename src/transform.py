@@ -1,72 +1,290 @@
 # src/transform.py
 import pandas as pd
+import numpy as np
 import json
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from hashlib import blake2b
+from src.config import TRANSFORM_CHUNK_SIZE, STORAGE_MODE, TRANSFORM_WORKERS, TRANSFORM_PARALLEL_MIN_INDICATORS
 
-def transform_pulses(pulses_data):
+PULSE_COLUMNS = [
+    "id", "name", "description", "author_name", "public", "revision", "adversary", "industries",
+    "tlp", "tags", "created", "modified", "references", "targeted_countries"
+]
+
+INDICATOR_COLUMNS = [
+    "id", "pulse_id", "indicator", "type", "title", "description", "access_reason", "created",
+    "is_active", "access_type", "content", "role", "expiration", "access_groups", "observations"
+]
+
+# Normalized storage: unique (type, indicator) observables and slim pulse <-> observable links
+OBSERVABLE_COLUMNS = ["id", "type", "indicator"]
+
+LINK_COLUMNS = [
+    "indicator_id", "pulse_id", "observable_id", "access_reason", "created", "is_active",
+    "access_type", "role", "expiration", "access_groups", "observations", "title", "description", "content"
+]
+
+def _values(records, key, default=None):
+    """Column of `key` across `records`; `default` (if given) stands in for missing keys like dict.get."""
+    if default is None:
+        return [r[key] for r in records]
+    return [r.get(key, default) for r in records]
+
+def _as_bool(values):
+    """Vectorized truthiness conversion of int (0/1) or bool values."""
+    return np.array(values, dtype=object).astype(bool)
+
+def _as_json(values):
+    """JSON-encode a column of arrays, short-circuiting the empty arrays that dominate OTX data."""
+    dumps = json.dumps
+    return ["[]" if value == [] else dumps(value) for value in values]
+
+def _pulses_frame(pulses):
+    """Build the pulses DataFrame column by column."""
+    return pd.DataFrame({
+        "id": _values(pulses, "id"),
+        "name": _values(pulses, "name"),
+        "description": _values(pulses, "description", ""),
+        "author_name": _values(pulses, "author_name"),
+        "public": _as_bool(_values(pulses, "public")),  # Convert int (0/1) to boolean
+        "revision": _values(pulses, "revision"),
+        "adversary": _values(pulses, "adversary", ""),
+        "industries": _as_json(_values(pulses, "industries")),  # Convert array to JSON string
+        "tlp": [(tlp or "white").lower() for tlp in _values(pulses, "tlp", "white")],  # "white" if missing or null
+        "tags": _as_json(_values(pulses, "tags")),
+        "created": _values(pulses, "created"),
+        "modified": _values(pulses, "modified"),
+        "references": _as_json(_values(pulses, "references")),
+        "targeted_countries": _as_json(_values(pulses, "targeted_countries"))
+    }, columns=PULSE_COLUMNS)
+
+def _indicators_frame(pulses):
+    """Flatten every pulse's indicators in one pass and build the indicators DataFrame column by column."""
+    indicators = [indicator for pulse in pulses for indicator in pulse["indicators"]]
+    pulse_ids = [pulse["id"] for pulse in pulses for _ in pulse["indicators"]]  # Link to parent pulse
+    return pd.DataFrame({
+        "id": np.array(_values(indicators, "id"), dtype=np.int64),
+        "pulse_id": pulse_ids,
+        "indicator": _values(indicators, "indicator"),
+        "type": _values(indicators, "type"),
+        "title": _values(indicators, "title", ""),
+        "description": _values(indicators, "description", ""),
+        "access_reason": _values(indicators, "access_reason", ""),
+        "created": _values(indicators, "created"),
+        "is_active": _as_bool(_values(indicators, "is_active")),  # Convert int (0/1) or bool to boolean
+        "access_type": _values(indicators, "access_type", "public"),  # Default to "public" if missing
+        "content": _values(indicators, "content", ""),
+        "role": ["" if role is None else role for role in _values(indicators, "role")],
+        "expiration": _values(indicators, "expiration"),
+        "access_groups": _as_json(_values(indicators, "access_groups", [])),
+        "observations": _values(indicators, "observations", 0)  # Default to 0 if missing
+    }, columns=INDICATOR_COLUMNS)
+
+def _build_frames(pulses):
+    """Create the pulse and indicator DataFrames, removing duplicates on primary keys."""
+    pulses_df = _pulses_frame(pulses)
+    indicators_df = _indicators_frame(pulses)
+    pulses_df.drop_duplicates(subset=["id"], inplace=True)
+    indicators_df.drop_duplicates(subset=["id"], inplace=True)
+    return pulses_df, indicators_df
+
+# Pulse list shared with forked shard workers, so shards are passed as index ranges instead of pickled JSON
+_shard_source = None
+
+def _to_arrow_ipc(df):
+    """Serialize a frame as an Arrow IPC stream: columnar and far cheaper to ship than pickled rows."""
+    import pyarrow as pa
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+def _concat_arrow_ipc(buffers):
+    """
+    Concatenate IPC-serialized shards into one DataFrame. Concatenating as Arrow tables
+    (a shard whose column is all null promotes to the other shards' type) lets pandas infer
+    each column's dtype over all rows, exactly as the serial path does.
+    """
+    import pyarrow as pa
+    tables = [pa.ipc.open_stream(buffer).read_all() for buffer in buffers]
+    return pa.concat_tables(tables, promote_options="default").to_pandas()
+
+def _transform_shard(shard):
+    """Worker: build the (not yet deduplicated) frames of one shard, given as a (start, end) range or a pulse list."""
+    pulses = _shard_source[shard[0]:shard[1]] if isinstance(shard, tuple) else shard
+    return _to_arrow_ipc(_pulses_frame(pulses)), _to_arrow_ipc(_indicators_frame(pulses))
+
+def _shard_ranges(pulses, shard_count):
+    """Contiguous pulse ranges holding roughly equal numbers of indicators."""
+    sizes = [len(pulse["indicators"]) + 1 for pulse in pulses]
+    target = sum(sizes) / shard_count
+    ranges = []
+    start = 0
+    filled = 0
+    for i, size in enumerate(sizes):
+        filled += size
+        if filled >= target * (len(ranges) + 1) and len(ranges) < shard_count - 1:
+            ranges.append((start, i + 1))
+            start = i + 1
+    if start < len(pulses):
+        ranges.append((start, len(pulses)))
+    return ranges
+
+def _build_frames_parallel(pulses, workers):
+    """
+    Build the frames across `workers` processes and deduplicate globally.
+    Shards are contiguous and concatenated in order before drop_duplicates, so the result
+    (rows, order, index and dtypes) is identical to _build_frames. Where fork is available and
+    this is the only thread, the workers read their shard straight from the inherited pulse list.
+    Otherwise (e.g. the daemon, whose loader thread may hold locks a forked child would inherit
+    in a locked state) workers come from a forkserver where available, and shards are pickled.
+    """
+    global _shard_source
+    ranges = _shard_ranges(pulses, workers * 2)  # A few more shards than workers evens out skew
+    start_methods = multiprocessing.get_all_start_methods()
+    if "fork" in start_methods and threading.active_count() == 1:
+        context = multiprocessing.get_context("fork")
+        shards = ranges
+        _shard_source = pulses
+    else:
+        context = multiprocessing.get_context("forkserver") if "forkserver" in start_methods else None
+        shards = [pulses[start:end] for start, end in ranges]
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            results = list(pool.map(_transform_shard, shards))
+    finally:
+        _shard_source = None
+    pulses_df = _concat_arrow_ipc([p for p, _ in results])
+    indicators_df = _concat_arrow_ipc([i for _, i in results])
+    pulses_df.drop_duplicates(subset=["id"], inplace=True)
+    indicators_df.drop_duplicates(subset=["id"], inplace=True)
+    return pulses_df, indicators_df
+
+def observable_id(indicator_type, indicator):
+    """Stable signed 64-bit id of an observable: the first 8 bytes of blake2b over type and value."""
+    digest = blake2b(f"{indicator_type}\0{indicator}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+def _normalized_frames(pulses):
+    """
+    Build pulses, observables and links DataFrames, deduplicating pulses, indicator ids
+    and observables with hash sets while flattening, so no frame-wide drop_duplicates is needed.
+    """
+    seen_pulses = set()
+    unique_pulses = []
+    for pulse in pulses:
+        if pulse["id"] not in seen_pulses:
+            seen_pulses.add(pulse["id"])
+            unique_pulses.append(pulse)
+
+    observables = {}
+    seen_indicators = set()
+    links = []
+    link_pulse_ids = []
+    link_observable_ids = []
+    for pulse in unique_pulses:
+        for indicator in pulse["indicators"]:
+            if indicator["id"] in seen_indicators:
+                continue
+            seen_indicators.add(indicator["id"])
+            key = observable_id(indicator["type"], indicator["indicator"])
+            if key not in observables:
+                observables[key] = indicator
+            links.append(indicator)
+            link_pulse_ids.append(pulse["id"])
+            link_observable_ids.append(key)
+
+    first = list(observables.values())
+    observables_df = pd.DataFrame({
+        "id": np.array(list(observables), dtype=np.int64),
+        "type": _values(first, "type"),
+        "indicator": _values(first, "indicator")
+    }, columns=OBSERVABLE_COLUMNS)
+    links_df = pd.DataFrame({
+        "indicator_id": np.array(_values(links, "id"), dtype=np.int64),
+        "pulse_id": link_pulse_ids,
+        "observable_id": np.array(link_observable_ids, dtype=np.int64),
+        "access_reason": _values(links, "access_reason", ""),
+        "created": _values(links, "created"),
+        "is_active": _as_bool(_values(links, "is_active")),
+        "access_type": _values(links, "access_type", "public"),
+        "role": ["" if role is None else role for role in _values(links, "role")],
+        "expiration": _values(links, "expiration"),
+        "access_groups": _as_json(_values(links, "access_groups", [])),
+        "observations": _values(links, "observations", 0),
+        # Each pulse describes its indicators in its own words
+        "title": _values(links, "title", ""),
+        "description": _values(links, "description", ""),
+        "content": _values(links, "content", "")
+    }, columns=LINK_COLUMNS)
+    return _pulses_frame(unique_pulses), observables_df, links_df
+
+def transform_pulses_normalized(pulses_data):
+    """
+    Transform OTX-like JSON data into the normalized storage layout.
+    An IoC shared by many pulses is kept once in observables_df; links_df holds one
+    slim row per indicator occurrence.
+    Args:
+        pulses_data (list): List of pulse dictionaries from the JSON 'results'.
+    Returns:
+        tuple: (pulses_df, observables_df, links_df)
+    """
+    pulses_df, observables_df, links_df = _normalized_frames(pulses_data)
+    print(f"Normalized {len(links_df)} indicators into {len(observables_df)} unique observables")
+    return pulses_df, observables_df, links_df
+
+def transform_pulses(pulses_data, export_csv=False, workers=TRANSFORM_WORKERS):
     """
     Transform OTX-like JSON data into DataFrames for pulses and indicators.
     Args:
         pulses_data (list): List of pulse dictionaries from the JSON 'results'.
+        export_csv (bool): Also write pulses.csv and indicators.csv to the working directory.
+        workers (int): Processes to shard the work across; the output is identical for any value.
     Returns:
         tuple: (pulses_df, indicators_df)
     """
-    # Lists to hold data for each table
-    pulses_list = []
-    indicators_list = []
-
-    # Process each pulse
-    for pulse in pulses_data:
-        # Pulse-level data
-        pulse_data = {
-            "id": pulse["id"],
-            "name": pulse["name"],
-            "description": pulse.get("description", ""),
-            "author_name": pulse["author_name"],
-            "public": bool(pulse["public"]),  # Convert int (0/1) to boolean
-            "revision": pulse["revision"],
-            "adversary": pulse.get("adversary", ""),
-            "industries": json.dumps(pulse["industries"]),  # Convert array to JSON string
-            "tlp": pulse.get("tlp", "white").lower(),  # Default to "white" if missing
-            "tags": json.dumps(pulse["tags"]),
-            "created": pulse["created"],
-            "modified": pulse["modified"],
-            "references": json.dumps(pulse["references"]),
-            "targeted_countries": json.dumps(pulse["targeted_countries"])
-        }
-        pulses_list.append(pulse_data)
-
-        # Indicators within the pulse
-        for indicator in pulse["indicators"]:
-            indicator_data = {
-                "id": int(indicator["id"]),
-                "pulse_id": pulse["id"],  # Link to parent pulse
-                "indicator": indicator["indicator"],
-                "type": indicator["type"],
-                "title": indicator.get("title", ""),
-                "description": indicator.get("description", ""),
-                "access_reason": indicator.get("access_reason", ""),
-                "created": indicator["created"],
-                "is_active": bool(indicator["is_active"]),  # Convert int (0/1) or bool to boolean
-                "access_type": indicator.get("access_type", "public"),  # Default to "public" if missing
-                "content": indicator.get("content", ""),
-                "role": indicator["role"] if indicator["role"] is not None else "",
-                "expiration": indicator["expiration"],
-                "access_groups": json.dumps(indicator.get("access_groups", [])),
-                "observations": indicator.get("observations", 0)  # Default to 0 if missing
-            }
-            indicators_list.append(indicator_data)
-
-    # Create DataFrames
-    pulses_df = pd.DataFrame(pulses_list)
-    indicators_df = pd.DataFrame(indicators_list)
-    
-    # Remove duplicates based on primary keys
-    pulses_df.drop_duplicates(subset=["id"], inplace=True)
-    indicators_df.drop_duplicates(subset=["id"], inplace=True)
+    # Build both tables column-wise and remove duplicates based on primary keys
+    indicator_count = sum(len(pulse["indicators"]) for pulse in pulses_data)
+    if workers > 1 and len(pulses_data) > 1 and indicator_count >= TRANSFORM_PARALLEL_MIN_INDICATORS:
+        pulses_df, indicators_df = _build_frames_parallel(pulses_data, workers)
+    else:
+        pulses_df, indicators_df = _build_frames(pulses_data)
     
-    # Export to Excel files
-    print("Saving 'pulses' and 'indicators' as CSV files")
-    pulses_df.to_csv('pulses.csv', index=False)
-    indicators_df.to_csv('indicators.csv', index=False)
+    # Export to CSV files on request
+    if export_csv:
+        print("Saving 'pulses' and 'indicators' as CSV files")
+        pulses_df.to_csv('pulses.csv', index=False)
+        indicators_df.to_csv('indicators.csv', index=False)
 
     return pulses_df, indicators_df
+
+def iter_transform_chunks(pulse_pages, chunk_size=TRANSFORM_CHUNK_SIZE, storage_mode=STORAGE_MODE):
+    """
+    Stream pages of OTX pulses into bounded (pulses_df, indicators_df) chunks.
+    A chunk always holds whole pulses and is emitted once it reaches `chunk_size`
+    indicator rows, so memory stays flat regardless of the subscription size.
+    Duplicates are removed within a chunk; duplicates across chunks are resolved
+    by the loader's upserts.
+    Args:
+        pulse_pages (iterable): Iterable of lists of pulse dictionaries.
+        chunk_size (int): Target number of indicator rows per chunk.
+        storage_mode (str): "wide", or "normalized" to yield (pulses_df, observables_df, links_df).
+    Yields:
+        tuple: (pulses_df, indicators_df)
+    """
+    build_frames = _normalized_frames if storage_mode == "normalized" else _build_frames
+    chunk = []
+    indicator_count = 0
+    for page in pulse_pages:
+        for pulse in page:
+            chunk.append(pulse)
+            indicator_count += len(pulse["indicators"])
+            if indicator_count >= chunk_size:
+                yield build_frames(chunk)
+                chunk = []
+                indicator_count = 0
+    if chunk:
+        yield build_frames(chunk)
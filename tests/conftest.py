@@ -0,0 +1,21 @@
+# tests/conftest.py
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import psycopg2
+import pytest
+from src.config import DB_CONFIG
+
+
+@pytest.fixture
+def database():
+    """A fresh, migrated database for the test (see throwaway_database); skipped without PostgreSQL."""
+    from benchmarks.run_benchmarks import throwaway_database
+    try:
+        psycopg2.connect(**{**DB_CONFIG, "dbname": "postgres"}).close()
+    except psycopg2.OperationalError as e:
+        pytest.skip(f"PostgreSQL is not reachable: {e}")
+    with throwaway_database("threat_intel_test"):
+        yield
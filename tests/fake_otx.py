@@ -0,0 +1,74 @@
+# tests/fake_otx.py
+# Local stand-in for the OTX subscribed-pulses endpoint, used by the extract tests.
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+
+SUBSCRIBED_PATH = "/api/v1/pulses/subscribed"
+
+
+class FakeOTX:
+    """
+    Serves `pulses` (newest modified first) in pages like the OTX API.
+    `failures` maps a page number to a list of (status, headers) responses returned,
+    one per request, before the page succeeds. Every request is recorded in `requests`.
+    """
+    def __init__(self, pulses, failures=None):
+        self.pulses = sorted(pulses, key=lambda p: p["modified"], reverse=True)
+        self.failures = {page: list(responses) for page, responses in (failures or {}).items()}
+        self.requests = []
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _page(self, query):
+        limit = int(query.get("limit", ["50"])[0])
+        page = int(query.get("page", ["1"])[0])
+        since = query.get("modified_since", [None])[0]
+        matching = [p for p in self.pulses if since is None or p["modified"] > since]
+        results = matching[(page - 1) * limit:page * limit]
+        next_url = None
+        if page * limit < len(matching):
+            next_url = f"{self.url}{SUBSCRIBED_PATH}?{urlencode({**{k: v[0] for k, v in query.items()}, 'page': page + 1})}"
+        return page, {"count": len(matching), "results": results, "next": next_url}
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                query = parse_qs(url.query)
+                page, body = fake._page(query)
+                with fake.lock:
+                    fake.requests.append((time.monotonic(), page))
+                    pending = fake.failures.get(page)
+                    failure = pending.pop(0) if pending else None
+                if url.path.rstrip("/") != SUBSCRIBED_PATH:
+                    failure = (404, {})
+                if failure:
+                    status, headers = failure
+                    self.send_response(status)
+                    for name, value in headers.items():
+                        self.send_header(name, value)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                data = json.dumps(body).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
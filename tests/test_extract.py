@@ -0,0 +1,146 @@
+# tests/test_extract.py
+# Concurrent OTX page fetching and the streaming pipeline's extract checkpoint, against a
+# local fake OTX server.
+import time
+from datetime import datetime
+from types import SimpleNamespace
+import pytest
+import requests
+from benchmarks.synthetic import generate_pulses
+import src.extract as extract
+from tests.fake_otx import FakeOTX
+
+PULSES = generate_pulses(6000, indicators_per_pulse=20, seed=4)
+
+
+@pytest.fixture
+def otx(monkeypatch):
+    servers = []
+
+    def start(pulses=PULSES, failures=None):
+        server = FakeOTX(pulses, failures)
+        servers.append(server)
+        monkeypatch.setattr(extract, "OTX_SERVER", server.url)
+        return server
+
+    yield start
+    for server in servers:
+        server.close()
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Record retry back-off delays instead of sleeping through them."""
+    delays = []
+    monkeypatch.setattr(extract, "time", SimpleNamespace(monotonic=time.monotonic, sleep=delays.append))
+    return delays
+
+
+def _fetch(page=1, limiter=None, max_retries=3):
+    session = extract._get_otx_session(1)
+    return extract._fetch_page(session, limiter or extract.TokenBucket(1000), {"limit": 10, "page": page},
+                               max_retries=max_retries)
+
+
+def test_429_honours_retry_after_and_slows_the_limiter(otx, sleeps):
+    server = otx(failures={1: [(429, {"Retry-After": "7"})]})
+    limiter = extract.TokenBucket(100)
+    data = _fetch(limiter=limiter)
+    assert [p["id"] for p in data["results"]] == [p["id"] for p in server.pulses[:10]]
+    assert sleeps == [7.0]
+    assert limiter.rate < limiter.max_rate
+    assert len(server.requests) == 2
+
+
+def test_5xx_is_retried_with_exponential_backoff(otx, sleeps):
+    server = otx(failures={1: [(503, {}), (502, {})]})
+    assert len(_fetch()["results"]) == 10
+    assert len(sleeps) == 2
+    assert 1 <= sleeps[0] < 2 and 2 <= sleeps[1] < 3
+    assert len(server.requests) == 3
+
+
+def test_gives_up_after_max_retries(otx, sleeps):
+    server = otx(failures={1: [(500, {})] * 10})
+    with pytest.raises(requests.HTTPError):
+        _fetch(max_retries=2)
+    assert len(server.requests) == 3
+
+
+def test_client_errors_are_not_retried(otx, sleeps):
+    server = otx(failures={1: [(403, {})]})
+    with pytest.raises(requests.HTTPError):
+        _fetch()
+    assert sleeps == [] and len(server.requests) == 1
+
+
+def test_token_bucket_caps_the_request_rate(otx, monkeypatch):
+    server = otx()
+    monkeypatch.setattr(extract, "OTX_REQUESTS_PER_SECOND", 40)
+    # Time each token grant: requests queued in the HTTP stack can reach the server bunched up
+    granted = []
+    acquire = extract.TokenBucket.acquire
+
+    def timed_acquire(bucket):
+        acquire(bucket)
+        granted.append(time.monotonic())
+
+    monkeypatch.setattr(extract.TokenBucket, "acquire", timed_acquire)
+    start = time.monotonic()
+    pulses = extract._fetch_pages_parallel(None, workers=8, page_size=3)
+    elapsed = time.monotonic() - start
+    assert len(pulses) == len(PULSES)
+    assert len(granted) == len(server.requests)
+    # The bucket starts full (40 tokens), then refills at 40 requests per second
+    assert elapsed >= (len(server.requests) - 40) / 40 * 0.9
+    stamps = sorted(granted)
+    for i, stamp in enumerate(stamps):
+        in_window = sum(1 for other in stamps[i:] if other - stamp < 1.0)
+        assert in_window <= 40 + 40
+
+
+@pytest.mark.parametrize("modified_since", [None, datetime(2024, 6, 1)])
+def test_parallel_fetch_matches_serial_sdk_walk(otx, monkeypatch, modified_since):
+    otx(failures={3: [(503, {"Retry-After": "0"})]})
+    monkeypatch.setattr(extract, "OTX_PAGE_SIZE", 7)
+    monkeypatch.setattr(extract, "OTX_REQUESTS_PER_SECOND", 1000)
+    parallel = extract.extract_otx_pulses(full=modified_since is None, workers=4, modified_since=modified_since)
+    serial = extract.extract_otx_pulses(full=modified_since is None, workers=1, modified_since=modified_since)
+    assert parallel
+    assert [p["id"] for p in parallel] == [p["id"] for p in serial]
+    assert parallel == serial
+    if modified_since:
+        assert len(parallel) < len(PULSES)
+        assert all(p["modified"] > modified_since.isoformat() for p in parallel)
+
+
+def test_streaming_pipeline_holds_the_checkpoint_until_a_complete_load(otx, database, monkeypatch):
+    import functools
+    import main
+    import src.transform as transform
+    from src.db import pooled_connection
+    from src.load import load_to_postgres
+
+    def stored():
+        with pooled_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT COUNT(*), MAX(modified) FROM pulses")
+                return cursor.fetchone()
+
+    pulses = sorted(generate_pulses(8000, indicators_per_pulse=20, seed=19), key=lambda p: p["modified"])
+    load_to_postgres(*transform.transform_pulses(pulses[:40], workers=1))
+    checkpoint = extract.get_last_modified()
+    # Page 3 (newest first) fails after the chunks of pages 1 and 2 were committed
+    server = otx(pulses, failures={3: [(400, {})]})
+    monkeypatch.setattr(transform, "iter_transform_chunks",
+                        functools.partial(transform.iter_transform_chunks, chunk_size=500))
+
+    main.run_streaming_pipeline(skip_llm=True)
+    count, newest = stored()
+    assert 40 < count < len(pulses) and newest > checkpoint
+    assert extract.get_last_modified() == checkpoint  # Not MAX(modified), which would skip the lost pages
+
+    server.requests.clear()
+    main.run_streaming_pipeline(skip_llm=True)
+    assert server.requests and stored()[0] == len(pulses)
+    assert extract.get_last_modified() == stored()[1]  # Released once the held extract loaded completely
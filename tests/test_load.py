@@ -0,0 +1,91 @@
+# tests/test_load.py
+# Delta merges and resumable chunked loads against a throwaway PostgreSQL database.
+import copy
+import pytest
+from benchmarks.synthetic import generate_pulses
+from src.db import data_version, pooled_connection
+from src.load import load_normalized, load_to_postgres, resume_load, start_resumable_load
+from src.transform import transform_pulses, transform_pulses_normalized
+
+
+def _stored(pulse_id):
+    with pooled_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT revision FROM pulses WHERE id = %s", (pulse_id,))
+            revision = cursor.fetchone()[0]
+            cursor.execute("SELECT id FROM indicators WHERE pulse_id = %s ORDER BY id", (pulse_id,))
+            return revision, [row[0] for row in cursor.fetchall()]
+
+
+def _load(pulses, storage_mode, **kwargs):
+    if storage_mode == "normalized":
+        return load_normalized(*transform_pulses_normalized(pulses), **kwargs)
+    return load_to_postgres(*transform_pulses(pulses, workers=1), **kwargs)
+
+
+def _version():
+    with pooled_connection() as conn:
+        with conn.cursor() as cursor:
+            return data_version(cursor)
+
+
+@pytest.mark.parametrize("storage_mode", ["wide", "normalized"])
+def test_delta_load_counts_and_identical_reload(database, storage_mode):
+    pulses = copy.deepcopy(generate_pulses(1000, indicators_per_pulse=10, seed=14))
+    indicator_count = len({i["id"] for pulse in pulses for i in pulse["indicators"]})
+    stats = _load(pulses, storage_mode)
+    assert stats["pulses"] == {"inserted": len(pulses), "updated": 0, "unchanged": 0}
+    assert stats["indicators"] == {"inserted": indicator_count, "updated": 0, "unchanged": 0, "deleted": 0}
+
+    # Identical rows are not rewritten even when every pulse is merged, and nothing is recorded
+    version = _version()
+    for skip_unchanged in (True, False):
+        stats = _load(pulses, storage_mode, skip_unchanged=skip_unchanged)
+        assert stats["pulses"] == {"inserted": 0, "updated": 0, "unchanged": len(pulses)}
+        assert stats["indicators"]["inserted"] == stats["indicators"]["updated"] == 0
+        assert stats["indicators"]["deleted"] == 0
+    assert _version() == version
+
+
+@pytest.mark.parametrize("storage_mode", ["wide", "normalized"])
+def test_revised_pulse_replaces_its_indicators(database, storage_mode):
+    pulses = copy.deepcopy(generate_pulses(1000, indicators_per_pulse=10, seed=15))
+    _load(pulses, storage_mode)
+    revised = pulses[0]
+    kept, dropped = revised["indicators"][:3], revised["indicators"][3:]
+    revised["indicators"] = kept
+    kept[0]["title"] = "revised title"
+    revised["revision"] += 1
+    revised["modified"] = "2099-01-01T00:00:00"
+
+    stats = _load(pulses, storage_mode)
+    assert stats["pulses"] == {"inserted": 0, "updated": 1, "unchanged": len(pulses) - 1}
+    assert stats["indicators"]["deleted"] == len(dropped)
+    assert stats["indicators"]["updated"] == 1 and stats["indicators"]["inserted"] == 0
+    table, key = ("pulse_observables", "indicator_id") if storage_mode == "normalized" else ("indicators", "id")
+    with pooled_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(f"SELECT {key} FROM {table} WHERE pulse_id = %s ORDER BY {key}", (revised["id"],))
+            assert [row[0] for row in cursor.fetchall()] == sorted(int(i["id"]) for i in kept)
+
+
+def test_resumed_load_does_not_replay_pulses_revised_since(database, tmp_path):
+    pulses = copy.deepcopy(generate_pulses(2000, indicators_per_pulse=20, seed=6))
+    run_id = start_resumable_load(*transform_pulses(pulses, workers=1), chunk_size=500, spool_dir=str(tmp_path))
+
+    # A newer revision of two spooled pulses is loaded before the old run is resumed
+    revised = copy.deepcopy(pulses[:2])
+    for pulse in revised:
+        pulse["revision"] += 1
+        pulse["modified"] = "2099-01-01T00:00:00"
+        pulse["indicators"] = pulse["indicators"][:3]
+    assert load_to_postgres(*transform_pulses(revised, workers=1))
+    expected = {pulse["id"]: _stored(pulse["id"]) for pulse in revised}
+
+    stats = resume_load(run_id)
+    assert stats["pulses"]["inserted"] == len({pulse["id"] for pulse in pulses}) - 2
+    for pulse_id, (revision, indicator_ids) in expected.items():
+        assert _stored(pulse_id) == (revision, indicator_ids)
+        assert len(indicator_ids) == 3
+    untouched = pulses[5]
+    assert _stored(untouched["id"]) == (untouched["revision"], sorted(int(i["id"]) for i in untouched["indicators"]))
@@ -0,0 +1,141 @@
+# tests/test_lookup.py
+# In-memory IoC index: exact and CIDR matching, per-pulse reference counts, the Bloom
+# filter, and incremental refreshes from Postgres after loads and retention runs.
+import copy
+import pytest
+from benchmarks.synthetic import generate_pulses
+from src.lookup import BloomFilter, IndicatorIndex
+
+
+def _index(pulse_entries, bloom_error_rate=None):
+    index = IndicatorIndex(storage_mode="wide", bloom_error_rate=bloom_error_rate)
+    index.replace_pulses(pulse_entries, full=True)
+    return index
+
+
+def test_exact_matches_respect_type_case_rules():
+    index = _index({
+        "p1": [("domain", "Evil.Example.com"), ("URL", "http://x/Path"), ("FileHash-MD5", "ABCDEF")],
+        "p2": [("domain", "evil.example.com")],
+    })
+    assert index.lookup("EVIL.example.COM") == [{"type": "domain", "indicator": "evil.example.com", "pulses": 2}]
+    assert index.lookup("abcdef")[0]["type"] == "FileHash-MD5"
+    assert index.lookup("http://x/Path") and not index.lookup("http://x/path")
+    assert index.lookup_many([" evil.example.com ", "unknown.test"]) == {
+        " evil.example.com ": [{"type": "domain", "indicator": "evil.example.com", "pulses": 2}]}
+
+
+def test_cidr_ranges_match_contained_addresses():
+    index = _index({
+        "p1": [("CIDR", "10.1.0.0/16"), ("CIDR", "10.1.2.0/24"), ("CIDR", "2001:db8::/32"), ("CIDR", "bogus")],
+        "p2": [("IPv4", "10.1.2.3")],
+    })
+    matches = {(m["type"], m["indicator"]) for m in index.lookup("10.1.2.3")}
+    assert matches == {("IPv4", "10.1.2.3"), ("CIDR", "10.1.0.0/16"), ("CIDR", "10.1.2.0/24")}
+    assert [m["indicator"] for m in index.lookup("10.1.9.9")] == ["10.1.0.0/16"]
+    assert [m["indicator"] for m in index.lookup("2001:db8:ffff::1")] == ["2001:db8::/32"]
+    assert index.lookup("10.2.0.1") == [] and index.lookup("not-an-ip") == []
+
+
+def test_revised_and_emptied_pulses_release_their_values():
+    index = _index({"p1": [("IPv4", "1.1.1.1"), ("CIDR", "10.0.0.0/8")], "p2": [("IPv4", "1.1.1.1")]})
+    index.replace_pulses({"p1": [("IPv4", "2.2.2.2")]})
+    assert index.lookup("1.1.1.1")[0]["pulses"] == 1
+    assert index.lookup("10.9.9.9") == [] and index.networks[4] == {}
+    index.replace_pulses({"p2": []})
+    assert index.lookup("1.1.1.1") == [] and "p2" not in index.pulse_entries
+    assert index.lookup("2.2.2.2")
+
+
+def test_bloom_filter_has_no_false_negatives_and_a_bounded_error_rate():
+    bloom = BloomFilter(20000, error_rate=0.01)
+    for i in range(20000):
+        bloom.add(f"value-{i}")
+    assert all(f"value-{i}" in bloom for i in range(20000))
+    false_positives = sum(f"other-{i}" in bloom for i in range(20000))
+    assert false_positives < 20000 * 0.02
+    data = bloom.to_bytes()
+    assert int.from_bytes(data[:8], "little") == bloom.size and len(data) == 16 + len(bloom.bits)
+
+
+def test_bloom_fronted_lookups_match_unfiltered_lookups():
+    entries = {"p1": [("domain", "Evil.Example.com"), ("IPv4", "1.2.3.4"), ("CIDR", "10.0.0.0/8")]}
+    plain, fronted = _index(entries), _index(entries, bloom_error_rate=0.001)
+    queries = ["EVIL.EXAMPLE.COM", "1.2.3.4", "10.3.3.3", "5.6.7.8"]
+    assert fronted.bloom is not None
+    assert fronted.lookup_many(queries) == plain.lookup_many(queries)
+
+
+def _pulse_count(index, value):
+    """Pulses holding exactly `value` (values can be shared across pulses)."""
+    return sum(match["pulses"] for match in index.lookup(value) if match["type"] != "CIDR")
+
+
+@pytest.mark.parametrize("storage_mode", ["wide", "normalized"])
+def test_incremental_refresh_follows_revisions_and_retention(database, storage_mode):
+    from src.load import load_normalized, load_to_postgres
+    from src.retention import run_retention
+    from src.db import pooled_connection
+    from src.transform import transform_pulses, transform_pulses_normalized
+
+    def load(pulses):
+        if storage_mode == "normalized":
+            return load_normalized(*transform_pulses_normalized(pulses))
+        return load_to_postgres(*transform_pulses(pulses, workers=1))
+
+    pulses = copy.deepcopy(generate_pulses(1500, indicators_per_pulse=15, seed=5))
+    load(pulses)
+    run_retention(storage_mode, inactive_days=None, archive="table", vacuum=False)  # Already expired ones
+    index = IndicatorIndex(storage_mode=storage_mode)
+    index.refresh()
+    archived = next(i for i in pulses[0]["indicators"] if i["expiration"] is None)
+    revised = pulses[1]["indicators"].pop(next(
+        n for n, i in enumerate(pulses[1]["indicators"]) if i["expiration"] is None))
+    before = {value: _pulse_count(index, value) for value in (archived["indicator"], revised["indicator"])}
+    assert all(before.values())
+
+    pulses[1]["revision"] += 1
+    pulses[1]["modified"] = "2099-01-01T00:00:00"
+    load(pulses)
+    table, key = ("pulse_observables", "indicator_id") if storage_mode == "normalized" else ("indicators", "id")
+    with pooled_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(f"UPDATE {table} SET expiration = NOW() - INTERVAL '1 day' WHERE {key} = %s",
+                           (int(archived["id"]),))
+        conn.commit()
+    # The revision also brings back indicators of pulse 1 archived earlier, which expire again
+    assert run_retention(storage_mode, inactive_days=None, archive="table", vacuum=False)["archived"] >= 1
+
+    assert index.refresh() >= 2
+    assert all(_pulse_count(index, value) < count for value, count in before.items())
+    full = IndicatorIndex(storage_mode=storage_mode)
+    full.refresh()
+    assert index.exact == full.exact and index.pulse_entries.keys() == full.pulse_entries.keys()
+
+
+@pytest.mark.parametrize("storage_mode", ["wide", "normalized"])
+def test_incremental_refresh_indexes_pulses_older_than_the_newest(database, storage_mode):
+    # As loaded by --full, --from-snapshot, --resume or a replayed extract checkpoint
+    from src.load import load_normalized, load_to_postgres
+    from src.transform import transform_pulses, transform_pulses_normalized
+
+    def load(pulses):
+        if storage_mode == "normalized":
+            return load_normalized(*transform_pulses_normalized(pulses))
+        return load_to_postgres(*transform_pulses(pulses, workers=1))
+
+    pulses = copy.deepcopy(generate_pulses(1500, indicators_per_pulse=15, seed=5))
+    load(pulses[1:])
+    index = IndicatorIndex(storage_mode=storage_mode)
+    index.refresh()
+    old = pulses[0]
+    old["modified"] = "2000-01-01T00:00:00"
+    old["indicators"][0]["indicator"] = "replayed.example.test"
+    old["indicators"][0]["type"] = "domain"
+    load([old])
+
+    assert index.refresh() == 1
+    assert index.lookup("replayed.example.test")
+    full = IndicatorIndex(storage_mode=storage_mode)
+    full.refresh()
+    assert index.exact == full.exact and index.pulse_entries.keys() == full.pulse_entries.keys()
@@ -0,0 +1,169 @@
+# tests/test_send_to_llms.py
+# LLM fan-out and response cache against local stub Grok and Anthropic endpoints.
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+import src.send_to_llms as llms
+
+QUERY_RESULTS = {
+    "total_pulses": [(7128,)],
+    "total_indicators": [(412985,)],
+    "indicator_types": [("FileHash-SHA256", 134220), ("domain", 65251)],
+    "top_countries": [("Ukraine", 120)],
+    "top_tags": [("phishing", 300), ("malware", 250)],
+    "expired_active": [(1200, 411785)],
+    "top_pulse": [("abc", "Big pulse", 5000)],
+    "samples": [("abc", "Big pulse", "desc", "IPv4", "1.2.3.4")],
+    "pulse_trends": [(datetime(2025, 5, 1), 412), (datetime(2025, 4, 1), 390)],
+    "tlp_indicators": [("white", "IPv4", 900)],
+    "multi_type_pulses": [("abc", "Big pulse", 6)],
+    "expiring_indicators": [("IPv4", "5.6.7.8", datetime(2025, 6, 1, 12, 0))],
+    "top_industries": [("Government", 80)],
+}
+
+
+class StubLLMs:
+    """Grok completions and Anthropic messages endpoints answering with canned text."""
+    def __init__(self):
+        self.calls = {"grok": 0, "claude": 0}
+        self.bodies = {}
+        self.fail = set()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                model = "claude" if self.path.endswith("/v1/messages") else "grok"
+                stub.calls[model] += 1
+                stub.bodies[model] = body
+                if model in stub.fail:
+                    self._reply(400, {"type": "error", "error": {"type": "invalid_request_error", "message": "no"}})
+                elif model == "claude":
+                    self._reply(200, {
+                        "id": "msg_1", "type": "message", "role": "assistant", "model": body["model"],
+                        "content": [{"type": "text", "text": " Claude summary "}],
+                        "stop_reason": "end_turn", "stop_sequence": None,
+                        "usage": {"input_tokens": 10, "output_tokens": 3},
+                    })
+                else:
+                    self._reply(200, {"choices": [{"text": " Grok summary "}]})
+
+            def _reply(self, status, payload):
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def stubs(monkeypatch, tmp_path):
+    stub = StubLLMs()
+    monkeypatch.setattr(llms, "GROK_API_URL", stub.url + "/v1/completions")
+    monkeypatch.setattr(llms, "CLAUDE_BASE_URL", stub.url)
+    monkeypatch.setattr(llms, "_grok_session", None)
+    monkeypatch.setattr(llms, "_claude_client", None)
+    monkeypatch.setattr(llms, "LLM_MAX_RETRIES", 0)
+    monkeypatch.setattr(llms.ResponseCache.__init__, "__defaults__", (str(tmp_path), llms.LLM_CACHE_TTL_SECONDS))
+    results = {"value": QUERY_RESULTS}
+    monkeypatch.setattr(llms, "run_all_queries", lambda: results["value"])
+    stub.results = results
+    yield stub
+    stub.close()
+
+
+def test_models_are_queried_and_answers_cached(stubs, capsys):
+    llms.run_llm_pipeline()
+    out = capsys.readouterr().out
+    assert "=== Grok Response ===\nGrok summary" in out
+    assert "=== Claude Response ===\nClaude summary" in out
+    assert stubs.calls == {"grok": 1, "claude": 1}
+    assert stubs.bodies["claude"]["temperature"] == stubs.bodies["grok"]["temperature"] == 0.7
+    assert "Total pulses: 7128" in stubs.bodies["claude"]["messages"][0]["content"]
+
+    llms.run_llm_pipeline()
+    out = capsys.readouterr().out
+    assert "=== Grok Response (cached) ===" in out and "=== Claude Response (cached) ===" in out
+    assert stubs.calls == {"grok": 1, "claude": 1}
+
+
+def test_cache_survives_a_new_day_and_clock_driven_drift(stubs, monkeypatch):
+    llms.run_llm_pipeline()
+
+    class Tomorrow(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return datetime(2030, 1, 2)
+
+    monkeypatch.setattr(llms, "datetime", Tomorrow)
+    stubs.results["value"] = {**QUERY_RESULTS, "expired_active": [(1300, 411685)]}  # Still 0% expired
+    llms.run_llm_pipeline()
+    assert stubs.calls == {"grok": 1, "claude": 1}
+
+
+@pytest.mark.parametrize("changed", [
+    {"expired_active": [(41300, 371685)]},  # 10% expired instead of 0%
+    {"expiring_indicators": []},
+    {"expiring_indicators": [("IPv4", "5.6.7.8", datetime(2025, 6, 2, 12, 0))]},
+])
+def test_shifted_clock_driven_results_miss_the_cache(stubs, changed):
+    llms.run_llm_pipeline()
+    stubs.results["value"] = {**QUERY_RESULTS, **changed}
+    llms.run_llm_pipeline()
+    assert stubs.calls == {"grok": 2, "claude": 2}
+
+
+def test_changed_data_misses_the_cache(stubs):
+    llms.run_llm_pipeline()
+    stubs.results["value"] = {**QUERY_RESULTS, "total_pulses": [(7129,)]}
+    llms.run_llm_pipeline()
+    assert stubs.calls == {"grok": 2, "claude": 2}
+
+
+def test_failed_model_is_reported_and_not_cached(stubs, capsys):
+    stubs.fail.add("grok")
+    llms.run_llm_pipeline()
+    out = capsys.readouterr().out
+    assert "Error from Grok API" in out and "Claude summary" in out
+    stubs.fail.clear()
+    llms.run_llm_pipeline()
+    out = capsys.readouterr().out
+    assert "=== Grok Response ===\nGrok summary" in out and "Claude Response (cached)" in out
+    assert stubs.calls == {"grok": 2, "claude": 1}
+
+
+def test_evict_expired_removes_stale_entries_and_orphaned_temp_files(tmp_path):
+    cache = llms.ResponseCache(str(tmp_path), ttl=60)
+    cache.put("model", "fresh", "answer")
+    old = time.time() - 2 * llms.STALE_TMP_SECONDS
+    for name in ("stale.json", "orphan.tmp"):
+        path = tmp_path / name
+        path.write_text("{}")
+        os.utime(path, (old, old))
+    (tmp_path / "inflight.tmp").write_text("")
+    assert cache.evict_expired() == 2
+    assert sorted(p.name for p in tmp_path.iterdir() if p.suffix == ".tmp") == ["inflight.tmp"]
+    assert cache.get("model", "fresh") == "answer"
+
+
+def test_database_error_returns_false_instead_of_exiting(stubs, capsys):
+    stubs.results["value"] = {"error": "Failed to connect to database: refused"}
+    assert llms.run_llm_pipeline() is False
+    assert "Database error: Failed to connect" in capsys.readouterr().out
+    assert stubs.calls == {"grok": 0, "claude": 0}
@@ -0,0 +1,53 @@
+# tests/test_setup_db.py
+# Index usage reported by setup_db.py --explain, from EXPLAIN (FORMAT JSON) plan trees, and
+# the generated schema.sql.
+from setup_db import SCHEMA_FILE, _plan_access, _plan_problems, schema_sql
+
+
+def test_bitmap_heap_scan_reports_its_bitmap_indexes():
+    plan = {
+        "Node Type": "Sort",
+        "Plans": [{
+            "Node Type": "Bitmap Heap Scan", "Relation Name": "pulses",
+            "Plans": [{
+                "Node Type": "BitmapOr",
+                "Plans": [
+                    {"Node Type": "Bitmap Index Scan", "Index Name": "idx_pulses_tags"},
+                    {"Node Type": "Bitmap Index Scan", "Index Name": "idx_pulses_created"},
+                ],
+            }],
+        }],
+    }
+    assert _plan_access(plan, set()) == {("pulses", "idx_pulses_tags"), ("pulses", "idx_pulses_created")}
+
+
+def test_sequential_and_index_scans():
+    plan = {
+        "Node Type": "Hash Join",
+        "Plans": [
+            {"Node Type": "Seq Scan", "Relation Name": "indicators", "Parallel Aware": True},
+            {"Node Type": "Hash", "Plans": [
+                {"Node Type": "Index Only Scan", "Relation Name": "pulses", "Index Name": "pulses_pkey"},
+            ]},
+        ],
+    }
+    assert _plan_access(plan, set()) == {("indicators", None), ("pulses", "pulses_pkey")}
+
+
+def test_unused_expected_index_and_unexpected_scan_are_reported():
+    pages = {"indicators": 4000, "pulses": 100}.get
+    found = {("indicators", None), ("pulses", "pulses_pkey")}
+    problems = _plan_problems("multi_type_pulses", found, pages)
+    assert problems == [
+        "Expected index idx_indicators_pulse_id_type on indicators is not used (4000 pages)",
+        "Unexpected sequential scan of indicators (4000 pages)",
+    ]
+    assert _plan_problems("multi_type_pulses", {("indicators", "idx_indicators_pulse_id_type")}, pages) == []
+    # Allow-listed scans and small tables pass
+    assert _plan_problems("samples", {("indicators", None), ("pulses", None)}, pages) == []
+    assert _plan_problems("pulse_trends", {("pulses", None)}, pages) == []
+
+
+def test_schema_file_matches_schema_and_migrations():
+    with open(SCHEMA_FILE, newline="") as f:
+        assert f.read() == schema_sql().replace("\n", "\r\n"), "Run `python setup_db.py --schema`"
@@ -0,0 +1,125 @@
+# tests/test_sql_queries.py
+# Query result cache keyed on the data version, and indicator exports, against a throwaway
+# PostgreSQL database.
+import copy
+import csv
+import json
+import threading
+from datetime import datetime
+import psycopg2
+import pytest
+from benchmarks.synthetic import generate_pulses
+from src.config import DB_CONFIG
+from src.db import data_version, record_etl_run
+from src.load import load_normalized, load_to_postgres
+from src.sql_queries import export_indicators, run_all_queries
+from src.transform import transform_pulses, transform_pulses_normalized
+
+
+def _served_from_cache(capsys):
+    out = capsys.readouterr().out
+    return out.count("Result (cached):")
+
+
+def _version():
+    conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        with conn.cursor() as cursor:
+            return data_version(cursor)
+    finally:
+        conn.close()
+
+
+def test_cache_is_served_until_the_next_commit_and_not_after_a_reset(database, tmp_path, capsys):
+    from setup_db import setup_database
+    frames = transform_pulses(generate_pulses(2000, seed=9), workers=1)
+    load_to_postgres(*frames)
+    run_all_queries(cache_dir=str(tmp_path))
+    assert _served_from_cache(capsys) == 0
+    run_all_queries(cache_dir=str(tmp_path))
+    assert _served_from_cache(capsys) > 0
+
+    load_to_postgres(*transform_pulses(generate_pulses(500, seed=10), workers=1))
+    run_all_queries(cache_dir=str(tmp_path))
+    assert _served_from_cache(capsys) == 0
+
+    # A reset database reaches the same counter value again, but under a new epoch
+    epoch, version = _version()
+    setup_database(reset=True)
+    load_to_postgres(*frames)
+    load_to_postgres(*transform_pulses(generate_pulses(500, seed=10), workers=1))
+    assert _version()[1] == version and _version()[0] != epoch
+    run_all_queries(cache_dir=str(tmp_path))
+    assert _served_from_cache(capsys) == 0
+
+
+def test_concurrent_writers_take_versions_in_commit_order(database):
+    first, second = psycopg2.connect(**DB_CONFIG), psycopg2.connect(**DB_CONFIG)
+    try:
+        start = _version()[1]
+        with first.cursor() as cursor:
+            assert record_etl_run(cursor, "load") == start + 1
+        versions = []
+
+        def write():
+            with second.cursor() as cursor:
+                versions.append(record_etl_run(cursor, "load"))
+            second.commit()
+
+        writer = threading.Thread(target=write)
+        writer.start()
+        writer.join(timeout=0.5)
+        assert writer.is_alive() and _version()[1] == start  # Blocked on the uncommitted first write
+        first.commit()
+        writer.join(timeout=5)
+        assert versions == [start + 2] and _version()[1] == start + 2
+    finally:
+        first.close()
+        second.close()
+
+
+def _expected_exports(pulses, types, tlp, active_only):
+    """Indicator id -> (value, type, pulse id) that an export with these filters should hold."""
+    now = datetime.now()
+    expected = {}
+    for pulse in pulses:
+        if pulse["tlp"] not in tlp:
+            continue
+        for indicator in pulse["indicators"]:
+            expiration = indicator["expiration"] and datetime.fromisoformat(indicator["expiration"])
+            if indicator["type"] not in types:
+                continue
+            if active_only and not (indicator["is_active"] and (expiration is None or expiration >= now)):
+                continue
+            expected[int(indicator["id"])] = (indicator["indicator"], indicator["type"], pulse["id"])
+    return expected
+
+
+@pytest.mark.parametrize("storage_mode", ["wide", "normalized"])
+def test_exports_hold_the_filtered_indicators_in_every_format(database, tmp_path, storage_mode):
+    pulses = copy.deepcopy(generate_pulses(3000, indicators_per_pulse=20, seed=20))
+    if storage_mode == "normalized":
+        load_normalized(*transform_pulses_normalized(pulses))
+    else:
+        load_to_postgres(*transform_pulses(pulses, workers=1))
+    filters = {"types": ["domain", "FileHash-MD5"], "tlp": ["WHITE", "green"], "active_only": True}
+    expected = _expected_exports(pulses, filters["types"], ["white", "green"], filters["active_only"])
+    assert expected
+
+    paths = {fmt: str(tmp_path / f"export.{fmt}") for fmt in ("csv", "jsonl", "blocklist")}
+    counts = {fmt: export_indicators(path, fmt, storage_mode=storage_mode, **filters) for fmt, path in paths.items()}
+    with open(paths["csv"], newline="", encoding="utf-8") as f:
+        csv_rows = list(csv.DictReader(f))
+    with open(paths["jsonl"], encoding="utf-8") as f:
+        json_rows = [json.loads(line) for line in f]
+    with open(paths["blocklist"], encoding="utf-8") as f:
+        blocklist = f.read().splitlines()
+
+    assert counts["csv"] == counts["jsonl"] == len(expected)
+    assert {int(r["id"]): (r["indicator"], r["type"], r["pulse_id"]) for r in csv_rows} == expected
+    assert {r["id"]: (r["indicator"], r["type"], r["pulse_id"]) for r in json_rows} == expected
+    assert [int(r["id"]) for r in csv_rows] == sorted(expected) == [r["id"] for r in json_rows]
+    assert all(r["is_active"] == "t" and r["tlp"] in ("white", "green") for r in csv_rows)
+    # Distinct values, in the database collation's order
+    assert sorted(blocklist) == sorted({value for value, _, _ in expected.values()})
+    assert counts["blocklist"] == len(blocklist)
@@ -0,0 +1,164 @@
+# tests/test_transform.py
+# The column-wise transform must produce the same frames as the original row-wise one.
+import copy
+import json
+import threading
+import pandas as pd
+import pytest
+from benchmarks.synthetic import generate_pulses
+import src.transform as transform
+from src.transform import transform_pulses, transform_pulses_normalized
+
+
+def row_wise_transform(pulses_data):
+    """The original per-row transform (before DataFrames were built column-wise), minus the CSV export."""
+    pulses_list = []
+    indicators_list = []
+    for pulse in pulses_data:
+        pulses_list.append({
+            "id": pulse["id"],
+            "name": pulse["name"],
+            "description": pulse.get("description", ""),
+            "author_name": pulse["author_name"],
+            "public": bool(pulse["public"]),
+            "revision": pulse["revision"],
+            "adversary": pulse.get("adversary", ""),
+            "industries": json.dumps(pulse["industries"]),
+            "tlp": pulse.get("tlp", "white").lower(),
+            "tags": json.dumps(pulse["tags"]),
+            "created": pulse["created"],
+            "modified": pulse["modified"],
+            "references": json.dumps(pulse["references"]),
+            "targeted_countries": json.dumps(pulse["targeted_countries"])
+        })
+        for indicator in pulse["indicators"]:
+            indicators_list.append({
+                "id": int(indicator["id"]),
+                "pulse_id": pulse["id"],
+                "indicator": indicator["indicator"],
+                "type": indicator["type"],
+                "title": indicator.get("title", ""),
+                "description": indicator.get("description", ""),
+                "access_reason": indicator.get("access_reason", ""),
+                "created": indicator["created"],
+                "is_active": bool(indicator["is_active"]),
+                "access_type": indicator.get("access_type", "public"),
+                "content": indicator.get("content", ""),
+                "role": indicator["role"] if indicator["role"] is not None else "",
+                "expiration": indicator["expiration"],
+                "access_groups": json.dumps(indicator.get("access_groups", [])),
+                "observations": indicator.get("observations", 0)
+            })
+    pulses_df = pd.DataFrame(pulses_list)
+    indicators_df = pd.DataFrame(indicators_list)
+    pulses_df.drop_duplicates(subset=["id"], inplace=True)
+    indicators_df.drop_duplicates(subset=["id"], inplace=True)
+    return pulses_df, indicators_df
+
+
+def _edge_case_pulses():
+    """Synthetic pulses with missing keys, None values, mixed TLP casing and duplicates."""
+    pulses = copy.deepcopy(generate_pulses(600, indicators_per_pulse=20, seed=11))
+    optional_pulse_keys = ["description", "adversary", "tlp"]
+    optional_indicator_keys = ["title", "description", "access_reason", "access_type", "content",
+                               "access_groups", "observations"]
+    for i, pulse in enumerate(pulses):
+        pulse["tlp"] = ["RED", "Amber", "green", "WHITE", "white"][i % 5]
+        pulse["public"] = i % 2  # OTX sends 0/1
+        if i % 4 == 0:
+            del pulse[optional_pulse_keys[i % 3]]
+        if i % 6 == 1:
+            pulse["description"] = None
+            pulse["adversary"] = None
+        if i % 7 == 2:
+            pulse["indicators"] = []
+        for j, indicator in enumerate(pulse["indicators"]):
+            indicator["is_active"] = (i + j) % 2
+            if j % 3 == 0:
+                del indicator[optional_indicator_keys[(i + j) % len(optional_indicator_keys)]]
+            if j % 5 == 1:
+                indicator["role"] = None
+                indicator["expiration"] = None
+                indicator["title"] = None
+            if j % 11 == 3:
+                indicator["id"] = str(indicator["id"])  # Some payloads carry ids as strings
+    pulses.append(copy.deepcopy(pulses[3]))  # Duplicate pulse and indicators
+    pulses[5]["indicators"].append(copy.deepcopy(pulses[8]["indicators"][0]))
+    return pulses
+
+
+@pytest.mark.parametrize("pulses", [
+    generate_pulses(3000, seed=1),
+    _edge_case_pulses(),
+], ids=["synthetic", "edge-cases"])
+def test_column_wise_matches_row_wise(pulses):
+    expected_pulses, expected_indicators = row_wise_transform(pulses)
+    pulses_df, indicators_df = transform_pulses(pulses, workers=1)
+    pd.testing.assert_frame_equal(pulses_df, expected_pulses)
+    pd.testing.assert_frame_equal(indicators_df, expected_indicators)
+
+
+def test_null_tlp_defaults_to_white():
+    # The row-wise transform raised AttributeError on an explicit null TLP; it now counts as missing
+    pulses = copy.deepcopy(generate_pulses(400, seed=2))
+    pulses[0]["tlp"] = None
+    pulses_df, _ = transform_pulses(pulses, workers=1)
+    assert pulses_df["tlp"].iloc[0] == "white"
+    assert pulses_df["tlp"].dtype == row_wise_transform(pulses[1:])[0]["tlp"].dtype
+
+
+def test_normalized_keeps_each_pulses_text_for_a_shared_observable():
+    pulses = copy.deepcopy(generate_pulses(400, seed=3))
+    shared = pulses[0]["indicators"][0]
+    pulses[1]["indicators"][0].update(type=shared["type"], indicator=shared["indicator"], title="Second pulse")
+    shared["title"] = "First pulse"
+    _, observables_df, links_df = transform_pulses_normalized(pulses)
+    assert list(observables_df.columns) == ["id", "type", "indicator"]
+    titles = links_df.set_index("indicator_id")["title"]
+    assert titles[int(shared["id"])] == "First pulse"
+    assert titles[int(pulses[1]["indicators"][0]["id"])] == "Second pulse"
+
+
+def _null_expiration_shard_pulses():
+    """Pulses whose first shard has only null expirations, so that shard's column has no type."""
+    pulses = copy.deepcopy(generate_pulses(3000, seed=8))
+    for pulse in pulses[:len(pulses) // 2]:
+        for indicator in pulse["indicators"]:
+            indicator["expiration"] = None
+    return pulses
+
+
+@pytest.mark.parametrize("workers", [2, 4])
+@pytest.mark.parametrize("pulses", [
+    generate_pulses(3000, seed=1),
+    _edge_case_pulses(),
+    _null_expiration_shard_pulses(),
+], ids=["synthetic", "edge-cases", "null-expiration-shard"])
+def test_parallel_matches_serial(pulses, workers, monkeypatch):
+    monkeypatch.setattr(transform, "TRANSFORM_PARALLEL_MIN_INDICATORS", 0)
+    expected_pulses, expected_indicators = transform_pulses(pulses, workers=1)
+    pulses_df, indicators_df = transform_pulses(pulses, workers=workers)
+    pd.testing.assert_frame_equal(pulses_df, expected_pulses)
+    pd.testing.assert_frame_equal(indicators_df, expected_indicators)
+
+
+def test_parallel_with_other_threads_alive_does_not_fork(monkeypatch):
+    # As in the daemon, where the loader thread runs next to the transform
+    monkeypatch.setattr(transform, "TRANSFORM_PARALLEL_MIN_INDICATORS", 0)
+    contexts = []
+    real_get_context = transform.multiprocessing.get_context
+    monkeypatch.setattr(transform.multiprocessing, "get_context",
+                        lambda method=None: contexts.append(method) or real_get_context(method))
+    pulses = generate_pulses(3000, seed=1)
+    expected = transform_pulses(pulses, workers=1)
+    stop = threading.Event()
+    other = threading.Thread(target=stop.wait)
+    other.start()
+    try:
+        result = transform_pulses(pulses, workers=2)
+    finally:
+        stop.set()
+        other.join()
+    assert "fork" not in contexts
+    for frame, expected_frame in zip(result, expected):
+        pd.testing.assert_frame_equal(frame, expected_frame)